@@ -15,10 +15,33 @@ THUMBNAIL_DIR = UPLOAD_DIR / "thumbs"
 THUMBNAIL_DIR.mkdir(exist_ok=True)
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None  # 未指定なら SDK の既定（api.anthropic.com）
 VISION_MODEL = os.getenv("VISION_MODEL", "claude-sonnet-4-20250514")
 MOCK_VISION = os.getenv("MOCK_VISION", "").lower() in ("1", "true", "yes")
+MOCK_VISION_LATENCY = float(os.getenv("MOCK_VISION_LATENCY", "0"))  # 秒（負荷検証用）
 
-if not ANTHROPIC_API_KEY and not MOCK_VISION:
+# 同一画像の再解析を避ける Vision 解析キャッシュ
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))  # 50MB
+
+# Vision API へ送る前の画像正規化（EXIF回転・長辺の縮小・グレースケール化・再エンコード）
+# 長辺 1568px を超える画像は API 側でも縮小されるため、それ以上送っても精度は上がらない
+VISION_IMAGE_NORMALIZE = os.getenv("VISION_IMAGE_NORMALIZE", "true").lower() in ("1", "true", "yes")
+VISION_MAX_LONG_EDGE = int(os.getenv("VISION_MAX_LONG_EDGE", "1568"))
+VISION_GRAYSCALE = os.getenv("VISION_GRAYSCALE", "").lower() in ("1", "true", "yes")
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "jpeg").lower()  # jpeg / webp
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+
+# 記録済み raw_response を再生する Vision バックエンド（負荷試験用、詳細は app/services/vision_replay.py）
+VISION_REPLAY_DIR = os.getenv("VISION_REPLAY_DIR") or None  # 指定すると Anthropic API を呼ばずに再生する
+VISION_REPLAY_LATENCY = os.getenv("VISION_REPLAY_LATENCY", "lognormal:3000:0.4")
+VISION_REPLAY_ERROR_RATE = float(os.getenv("VISION_REPLAY_ERROR_RATE", "0"))  # 529 を返す確率
+VISION_REPLAY_429_RATE = float(os.getenv("VISION_REPLAY_429_RATE", "0"))  # 429 を返す確率
+VISION_REPLAY_RETRY_AFTER = float(os.getenv("VISION_REPLAY_RETRY_AFTER", "1"))  # 429 の retry-after（秒）
+VISION_REPLAY_MALFORMED_RATE = float(os.getenv("VISION_REPLAY_MALFORMED_RATE", "0"))  # 途中で切れた応答を返す確率
+VISION_REPLAY_SEED = int(os.environ["VISION_REPLAY_SEED"]) if os.getenv("VISION_REPLAY_SEED") else None
+
+if not ANTHROPIC_API_KEY and not MOCK_VISION and not VISION_REPLAY_DIR:
     _logger.warning("ANTHROPIC_API_KEY が未設定です。Vision API の呼び出しは失敗します。")
 
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'receipts.db'}")
@@ -26,8 +49,77 @@ DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'receipts.db'}"
 CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")]
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024  # アップロードを一時ファイルへ書き出す単位（1件あたりのメモリ使用量の上限）
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
+# 月次集計レスポンスのキャッシュ（件数上限と有効期限[秒]、0 で無期限）
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "256"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "0"))
+
+# CSVエクスポートで1回にDBから読み出す件数
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# 重複レシート判定: dHash のハミング距離の閾値と返す候補数
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "6"))
+DUPLICATE_MAX_RESULTS = int(os.getenv("DUPLICATE_MAX_RESULTS", "5"))
+
+# 一括スキャンで同時に処理するファイル数の上限
+BATCH_SCAN_CONCURRENCY = max(1, int(os.getenv("BATCH_SCAN_CONCURRENCY", "4")))
+
+# 非同期スキャンジョブのワーカー数（0 でワーカーを起動しない）とポーリング間隔（秒）。
+# ワーカーは起動時に処理中のジョブを戻すため、アプリは1プロセスで動かす（scan_job_service 参照）
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "2"))
+SCAN_JOB_POLL_INTERVAL = float(os.getenv("SCAN_JOB_POLL_INTERVAL", "1.0"))
+
+# 一括取り込み（Message Batches API）: 1バッチあたりのリクエスト数の上限と、完了確認のポーリング間隔（秒）
+BULK_VISION_MAX_REQUESTS = max(1, int(os.getenv("BULK_VISION_MAX_REQUESTS", "200")))
+BULK_VISION_POLL_INTERVAL = float(os.getenv("BULK_VISION_POLL_INTERVAL", "60"))
+
+# Vision API 呼び出しの流量制御: 同時実行数・送信レート（毎分、0 で無制限）・再試行・サーキットブレーカー
+VISION_MAX_CONCURRENCY = max(1, int(os.getenv("VISION_MAX_CONCURRENCY", "4")))
+VISION_RATE_PER_MINUTE = float(os.getenv("VISION_RATE_PER_MINUTE", "50"))
+VISION_RATE_BURST = max(1, int(os.getenv("VISION_RATE_BURST", "5")))
+VISION_MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", "3"))
+VISION_RETRY_BASE_DELAY = float(os.getenv("VISION_RETRY_BASE_DELAY", "1.0"))  # 秒
+VISION_RETRY_MAX_DELAY = float(os.getenv("VISION_RETRY_MAX_DELAY", "30"))  # 秒（retry-after がこれを超えたら再試行しない）
+VISION_BREAKER_THRESHOLD = int(os.getenv("VISION_BREAKER_THRESHOLD", "5"))  # 0 で無効
+VISION_BREAKER_COOLDOWN = float(os.getenv("VISION_BREAKER_COOLDOWN", "30"))  # 秒
+
+# 静的なプロンプト（抽出ルール・カテゴリ基準）をプロンプトキャッシュの対象にする。
+# 現在の PROMPT（約800文字）はモデルの最小キャッシュ長（1024 トークン、Haiku は 2048）に満たず、
+# 有効にしても API 側でキャッシュされない（cache_read_input_tokens は 0 のまま）ため既定は無効
+VISION_PROMPT_CACHE = os.getenv("VISION_PROMPT_CACHE", "false").lower() in ("1", "true", "yes")
+
+# リクエスト単位のプロファイル: 有効時のみ X-Profile: 1 ヘッダーか ?profile=1 でサンプリングし、
+# 折りたたみスタック形式で PROFILE_DIR に保存する（新しい PROFILE_KEEP 件を残す）
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR") or BASE_DIR / "profiles")
+PROFILE_KEEP = max(1, int(os.getenv("PROFILE_KEEP", "20")))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))  # サンプリング間隔
+
+# Vision API の料金（USD / 100万トークン、入力・出力）。モデル名の最長一致で引き、不明なモデルは費用を出さない
+VISION_PRICING = {
+    "claude-opus-4-5": (5.0, 25.0),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+}
+
+# 画像処理（サムネイル生成など）を実行するプール。thread または process
+IMAGE_EXECUTOR = os.getenv("IMAGE_EXECUTOR", "thread").lower()
+IMAGE_WORKERS = max(1, int(os.getenv("IMAGE_WORKERS", "2")))
+
+# オンデマンド画像派生（/api/receipts/{id}/image）: 許可する幅・形式と、ディスクキャッシュの上限
+DERIVATIVE_DIR = THUMBNAIL_DIR / "derived"
+DERIVATIVE_DIR.mkdir(exist_ok=True)
+DERIVATIVE_WIDTHS = sorted(int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "200,400,800,1600").split(","))
+DERIVATIVE_FORMATS = {"webp", "jpeg", "png"}
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # 200MB
+
 CATEGORIES = [
     "食費",
     "交通費",
@@ -1,21 +1,41 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
-from app.config import CORS_ORIGINS, UPLOAD_DIR
+from app.config import CORS_ORIGINS, PROFILING_ENABLED, UPLOAD_DIR
 from app.database import engine
+from app.migrations import run_migrations
+from app.models import monthly_category_total, scan_job, search, vision_batch, vision_cache, vision_usage  # noqa: F401  テーブル登録のため
 from app.models.receipt import Base
-from app.routers import receipts, summary
+from app.routers import admin, receipts, scan_jobs, summary
+from app.services.bulk_vision_service import bulk_poller
+from app.services.image_service import shutdown_image_executor
+from app.services.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.services.profiling import ProfilingMiddleware
+from app.services.scan_job_service import worker_pool
 
 logger = logging.getLogger(__name__)
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
-app = FastAPI(title="Receipt Scanner API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker_pool.start()
+    bulk_poller.start()
+    yield
+    await bulk_poller.stop()
+    await worker_pool.stop()
+    shutdown_image_executor()
+
+
+app = FastAPI(title="Receipt Scanner API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +44,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if PROFILING_ENABLED:
+    # 無効時はミドルウェアを組み込まない（リクエストごとの判定も発生しない）
+    app.add_middleware(ProfilingMiddleware)
 
 
 @app.exception_handler(RequestValidationError)
@@ -50,7 +74,15 @@ async def general_exception_handler(request: Request, exc: Exception):
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus のテキスト形式でメトリクスを返す。"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
 app.include_router(receipts.router, prefix="/api")
 app.include_router(summary.router, prefix="/api")
+app.include_router(scan_jobs.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
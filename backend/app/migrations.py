@@ -0,0 +1,109 @@
+"""起動時に適用する軽量なスキーマ移行。
+
+create_all は新しいテーブルしか作らないため、既存の receipts.db に対する
+列・インデックスの追加はここに番号付きで定義する。適用済みの番号は
+schema_version テーブルに記録し、未適用のものだけを順番に実行する。
+各移行は再実行しても安全なように書く（新規DBでは create_all 済みのため）。
+"""
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import Connection, Engine, inspect, text
+
+from app.database import Base
+from app.models import monthly_category_total, receipt, scan_job, search, vision_batch, vision_cache, vision_usage  # noqa: F401  全テーブルを登録する
+from app.services.rollup_service import rebuild_rollup
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return
+    columns = {c["name"] for c in inspector.get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _create_model_indexes(*tables: str) -> Callable[[Connection], None]:
+    """モデルに定義されたインデックスのうち、未作成のものを作る。"""
+
+    def apply(conn: Connection) -> None:
+        for table in tables:
+            for index in Base.metadata.tables[table].indexes:
+                index.create(bind=conn, checkfirst=True)
+
+    return apply
+
+
+def _add_image_hash_columns(conn: Connection) -> None:
+    _add_column_if_missing(conn, "receipts", "image_phash", "TEXT")
+    _add_column_if_missing(conn, "scan_jobs", "image_sha256", "TEXT")
+    _add_column_if_missing(conn, "scan_jobs", "image_phash", "TEXT")
+
+
+def _add_scan_metadata_column(conn: Connection) -> None:
+    _add_column_if_missing(conn, "receipts", "scan_metadata", "JSON")
+
+
+def _add_vision_batch_column(conn: Connection) -> None:
+    _add_column_if_missing(conn, "scan_jobs", "vision_batch_id", "TEXT")
+    if inspect(conn).has_table("scan_jobs"):
+        _create_model_indexes("scan_jobs")(conn)
+
+
+def _build_monthly_rollup(conn: Connection) -> None:
+    rebuild_rollup(conn)
+
+
+def _build_search_index(conn: Connection) -> None:
+    for statement in search.CREATE_STATEMENTS + search.REBUILD_STATEMENTS:
+        conn.execute(text(statement))
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "画像ハッシュ列（receipts.image_phash, scan_jobs.image_sha256/image_phash）を追加", _add_image_hash_columns),
+    Migration(2, "receipts / receipt_items の検索・ソート用インデックスを追加", _create_model_indexes("receipts", "receipt_items")),
+    Migration(3, "月次カテゴリ別集計 monthly_category_totals を既存データから構築", _build_monthly_rollup),
+    Migration(4, "全文検索 receipts_fts（trigram）とトリガーを作成し既存データを索引", _build_search_index),
+    Migration(5, "解析メタデータ列 receipts.scan_metadata を追加", _add_scan_metadata_column),
+    Migration(6, "一括取り込みのバッチID列 scan_jobs.vision_batch_id を追加", _add_vision_batch_column),
+]
+
+
+def get_schema_version(conn: Connection) -> int:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at TEXT NOT NULL)"
+    ))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def run_migrations(engine: Engine, migrations: list[Migration] = MIGRATIONS) -> list[int]:
+    """未適用の移行を番号順に適用し、適用した番号のリストを返す。"""
+    applied = []
+    with engine.begin() as conn:
+        current = get_schema_version(conn)
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current:
+            continue
+        # 1移行ごとにトランザクションを分け、途中で失敗しても適用済みの分は残す
+        with engine.begin() as conn:
+            migration.apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, applied_at) VALUES (:version, :applied_at)"),
+                {"version": migration.version, "applied_at": datetime.now(timezone.utc).isoformat()},
+            )
+        logger.info("スキーマ移行 %d を適用しました: %s", migration.version, migration.description)
+        applied.append(migration.version)
+    return applied
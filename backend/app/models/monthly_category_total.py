@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Float, Integer, Text
+
+from app.database import Base
+
+
+class MonthlyCategoryTotal(Base):
+    """年月・カテゴリごとのレシート合計（rollup_service が receipts の変更に合わせて更新する）。"""
+
+    __tablename__ = "monthly_category_totals"
+
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    category = Column(Text, primary_key=True)  # カテゴリ未設定は "未分類"
+    total_amount = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, Text
+from sqlalchemy import JSON, Column, Date, DateTime, Float, ForeignKey, Index, Integer, Text
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -8,6 +8,17 @@ from app.database import Base
 
 class Receipt(Base):
     __tablename__ = "receipts"
+    __table_args__ = (
+        # 一覧のソート（id は同値時の並び順・キーセットページネーション用）
+        Index("ix_receipts_created_at_id", "created_at", "id"),
+        Index("ix_receipts_date_id", "date", "id"),
+        Index("ix_receipts_total_amount_id", "total_amount", "id"),
+        Index("ix_receipts_store_name_id", "store_name", "id"),
+        # カテゴリ絞り込み + 既定の作成日時ソート
+        Index("ix_receipts_category_created_at_id", "category", "created_at", "id"),
+        # 月次集計（日付範囲でカテゴリ別に合計する）のカバリングインデックス
+        Index("ix_receipts_date_category_total_amount", "date", "category", "total_amount"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     store_name = Column(Text, nullable=True)
@@ -19,6 +30,8 @@ class Receipt(Base):
     image_path = Column(Text, nullable=False)
     thumbnail_path = Column(Text, nullable=True)
     raw_response = Column(Text, nullable=True)
+    image_phash = Column(Text, nullable=True)
+    scan_metadata = Column(JSON, nullable=True)  # 解析時の送信画像サイズ・所要時間など
     created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -29,7 +42,7 @@ class ReceiptItem(Base):
     __tablename__ = "receipt_items"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    receipt_id = Column(Integer, ForeignKey("receipts.id", ondelete="CASCADE"), nullable=False)
+    receipt_id = Column(Integer, ForeignKey("receipts.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(Text, nullable=True)
     quantity = Column(Float, nullable=True, default=1)
     price = Column(Float, nullable=True)
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text
+
+from app.database import Base
+
+
+class ScanJob(Base):
+    __tablename__ = "scan_jobs"
+
+    id = Column(Text, primary_key=True)
+    batch_id = Column(Text, nullable=True, index=True)
+    filename = Column(Text, nullable=True)
+    image_path = Column(Text, nullable=True)
+    image_sha256 = Column(Text, nullable=True)
+    image_phash = Column(Text, nullable=True)
+    status = Column(Text, nullable=False, default="queued", index=True)
+    error = Column(Text, nullable=True)
+    receipt_id = Column(Integer, ForeignKey("receipts.id", ondelete="SET NULL"), nullable=True)
+    vision_batch_id = Column(Text, nullable=True, index=True)  # 一括取り込み時の vision_batches.id
+
+    # ステージごとのタイムスタンプ
+    queued_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    analyzed_at = Column(DateTime, nullable=True)
+    thumbnailed_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
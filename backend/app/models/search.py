@@ -0,0 +1,56 @@
+"""レシート全文検索用の FTS5 仮想テーブル（receipts_fts）。
+
+rowid をレシートIDとし、店名と品目名（改行区切り）を trigram トークナイザで索引する。
+内容は receipts / receipt_items のトリガーで同期するため、ORM・Core のどちらで
+書き込んでも検索結果に反映される。
+"""
+from sqlalchemy import DDL, column, event, table
+
+from app.database import Base
+
+receipts_fts = table(
+    "receipts_fts",
+    column("rowid"),
+    column("store_name"),
+    column("item_names"),
+    column("rank"),
+)
+
+_ITEM_NAMES = "(SELECT group_concat(name, char(10)) FROM receipt_items WHERE receipt_id = {receipt_id})"
+
+CREATE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS receipts_fts USING fts5(store_name, item_names, tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO receipts_fts (rowid, store_name, item_names) VALUES (new.id, new.store_name, NULL);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_au AFTER UPDATE OF store_name ON receipts BEGIN
+        UPDATE receipts_fts SET store_name = new.store_name WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ad AFTER DELETE ON receipts BEGIN
+        DELETE FROM receipts_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS receipt_items_fts_ai AFTER INSERT ON receipt_items BEGIN
+        UPDATE receipts_fts SET item_names = {_ITEM_NAMES.format(receipt_id="new.receipt_id")}
+        WHERE rowid = new.receipt_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS receipt_items_fts_au AFTER UPDATE ON receipt_items BEGIN
+        UPDATE receipts_fts SET item_names = {_ITEM_NAMES.format(receipt_id="old.receipt_id")}
+        WHERE rowid = old.receipt_id;
+        UPDATE receipts_fts SET item_names = {_ITEM_NAMES.format(receipt_id="new.receipt_id")}
+        WHERE rowid = new.receipt_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS receipt_items_fts_ad AFTER DELETE ON receipt_items BEGIN
+        UPDATE receipts_fts SET item_names = {_ITEM_NAMES.format(receipt_id="old.receipt_id")}
+        WHERE rowid = old.receipt_id;
+    END""",
+]
+
+REBUILD_STATEMENTS = [
+    "DELETE FROM receipts_fts",
+    f"""INSERT INTO receipts_fts (rowid, store_name, item_names)
+        SELECT r.id, r.store_name, {_ITEM_NAMES.format(receipt_id="r.id")} FROM receipts r""",
+]
+
+for _statement in CREATE_STATEMENTS:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "before_drop", DDL("DROP TABLE IF EXISTS receipts_fts").execute_if(dialect="sqlite"))
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, Text
+
+from app.database import Base
+
+
+class VisionBatch(Base):
+    """Message Batches API に投入した一括解析バッチ。"""
+
+    __tablename__ = "vision_batches"
+
+    id = Column(Text, primary_key=True)  # Anthropic 側のバッチID（msgbatch_...）
+    scan_batch_id = Column(Text, nullable=True, index=True)  # scan_jobs.batch_id
+    status = Column(Text, nullable=False, default="in_progress", index=True)  # in_progress / processed / failed
+    request_count = Column(Integer, nullable=False, default=0)
+    succeeded_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    submitted_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_polled_at = Column(DateTime, nullable=True)
+    ended_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, Text
+
+from app.database import Base
+
+
+class VisionCacheEntry(Base):
+    __tablename__ = "vision_cache"
+
+    image_sha256 = Column(Text, primary_key=True)
+    model = Column(Text, primary_key=True)
+    prompt_version = Column(Text, primary_key=True)
+    response_json = Column(Text, nullable=False)
+    raw_response = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_accessed_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
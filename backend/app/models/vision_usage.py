@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Float, Integer, Text
+
+from app.database import Base
+
+
+class VisionUsage(Base):
+    """Vision API 呼び出し1回分のトークン使用量と所要時間（日別・モデル別の集計用）。"""
+
+    __tablename__ = "vision_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+    model = Column(Text, nullable=False)
+    mode = Column(Text, nullable=False, default="sync")  # sync / batch（Message Batches API）/ replay（VISION_REPLAY_DIR）
+    status = Column(Text, nullable=False, default="ok")  # ok / error
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cache_creation_input_tokens = Column(Integer, nullable=False, default=0)
+    cache_read_input_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=True)  # batch では計測しない
@@ -0,0 +1,77 @@
+import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas.profile import ProfileInfo
+from app.schemas.summary import SummaryCacheStatsResponse
+from app.schemas.vision_cache import VisionCachePurgeResponse, VisionCacheStatsResponse
+from app.schemas.vision_limiter import VisionLimiterStatsResponse
+from app.schemas.vision_usage import VisionUsageResponse
+from app.services import vision_cache_service, vision_usage_service
+from app.services.profiling import profile_store
+from app.services.summary_cache import summary_cache
+from app.services.vision_limiter import vision_limiter
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/vision-cache", response_model=VisionCacheStatsResponse)
+def vision_cache_stats(db: Session = Depends(get_db)):
+    """Vision 解析キャッシュの件数・サイズ・ヒット率を返す。"""
+    return vision_cache_service.get_stats(db)
+
+
+@router.delete("/vision-cache", response_model=VisionCachePurgeResponse)
+def purge_vision_cache(db: Session = Depends(get_db)):
+    """Vision 解析キャッシュを全削除する。"""
+    return VisionCachePurgeResponse(deleted=vision_cache_service.purge(db))
+
+
+@router.get("/vision-limiter", response_model=VisionLimiterStatsResponse)
+def vision_limiter_stats():
+    """Vision API 呼び出しの実行数・待ち行列の長さ・待ち時間・再試行回数・サーキットの状態を返す。"""
+    return vision_limiter.stats()
+
+
+@router.get("/vision-usage", response_model=VisionUsageResponse)
+def vision_usage(
+    date_from: datetime.date | None = Query(None),
+    date_to: datetime.date | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    """Vision API のトークン使用量・推定費用・レイテンシを日別（UTC）・モデル別に返す。既定は直近30日。"""
+    date_to = date_to or datetime.datetime.now(datetime.timezone.utc).date()
+    date_from = date_from or date_to - datetime.timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from は date_to 以前の日付を指定してください")
+    return vision_usage_service.get_daily_usage(db, date_from, date_to)
+
+
+@router.get("/summary-cache", response_model=SummaryCacheStatsResponse)
+def summary_cache_stats():
+    """月次集計キャッシュの件数・ヒット率・無効化回数を返す。"""
+    return summary_cache.stats()
+
+
+@router.delete("/summary-cache", status_code=204)
+def clear_summary_cache():
+    """月次集計キャッシュを全削除する。"""
+    summary_cache.clear()
+
+
+@router.get("/profiles", response_model=list[ProfileInfo])
+def list_profiles():
+    """保存済みのリクエストプロファイルを新しい順に返す（PROFILING_ENABLED 時に X-Profile: 1 で採取）。"""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str):
+    """プロファイルを折りたたみスタック形式（1行1スタック: フレーム;フレーム;... 件数）でダウンロードする。"""
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="プロファイルが見つかりません")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
@@ -1,37 +1,69 @@
+import asyncio
 import datetime
 import logging
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, UploadFile
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.config import UPLOAD_DIR
+from app.config import BATCH_SCAN_CONCURRENCY, UPLOAD_DIR
 from app.database import get_db
 from app.schemas.receipt import (
     BatchScanResponse,
     BatchScanResultItem,
+    DuplicateCandidate,
+    DuplicateCheckResponse,
     ReceiptListResponse,
     ReceiptResponse,
     ReceiptUpdate,
+    ScanReceiptResponse,
 )
 from app.services.category_service import classify_by_items
-from app.services.export_service import generate_csv
-from app.services.image_service import generate_thumbnail, save_image
+from app.services.derivative_service import derivative_etag, get_derivative, validate_request
+from app.services.duplicate_service import find_duplicates
+from app.services.export_service import iter_csv
+from app.services.image_service import (
+    SavedImage,
+    compute_upload_phash,
+    generate_thumbnail,
+    run_image_task,
+    save_image,
+    store_thumbnail,
+)
+from app.services.metrics import scans_in_flight, stage
 from app.services.receipt_service import (
     ALLOWED_SORT_FIELDS,
+    RELEVANCE_SORT,
     create_receipt,
     delete_receipt,
+    encode_cursor,
     get_receipt,
     get_receipts,
+    iter_receipt_batches,
     update_receipt,
 )
-from app.services.vision_service import analyze_receipt
+from app.services.vision_limiter import PRIORITY_BACKGROUND, VisionUnavailableError
+from app.services.vision_service import analyze_receipt, needs_vision_payload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/receipts", tags=["receipts"])
 
+# 派生画像は内容が変わらないため、ブラウザ・CDN に長期キャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+async def _make_thumbnail(saved: SavedImage) -> str | None:
+    """保存時のデコードで作ったサムネイルを書き出す。なければ元画像から生成する。"""
+    if saved.thumbnail is not None:
+        return await asyncio.to_thread(store_thumbnail, saved.thumbnail)
+    return await run_image_task(generate_thumbnail, saved.path)
+
+
+def _initial_scan_metadata(saved: SavedImage) -> dict:
+    return {"image_cpu_ms": saved.cpu_ms} if saved.cpu_ms else {}
+
 
 def _cleanup_uploaded_file(image_path: str) -> None:
     """アップロード済みファイルを削除する（解析失敗時のクリーンアップ）。"""
@@ -43,22 +75,43 @@ def _cleanup_uploaded_file(image_path: str) -> None:
         logger.warning("クリーンアップ失敗: %s", image_path, exc_info=True)
 
 
-@router.post("/scan", response_model=ReceiptResponse, status_code=201)
+@router.post("/scan", response_model=ScanReceiptResponse, status_code=201)
 async def scan_receipt(file: UploadFile, db: Session = Depends(get_db)):
-    """レシート画像をアップロードし、AI解析してDBに保存する。"""
+    """レシート画像をアップロードし、AI解析してDBに保存する。
+
+    知覚ハッシュが近い既存レシートがあれば duplicates に含めて返す。
+    """
+    with scans_in_flight.track_inprogress(pipeline="scan"):
+        return await _scan_receipt(file, db)
+
+
+async def _scan_receipt(file: UploadFile, db: Session) -> ScanReceiptResponse:
     # 1. 画像保存
     try:
-        image_path = await save_image(file)
+        with stage("scan", "save_image"):
+            saved = await save_image(file, needs_vision=needs_vision_payload)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    image_path = saved.path
+    with stage("scan", "find_duplicates"):
+        duplicates = find_duplicates(db, saved.phash)
 
     # 2. Vision API で解析
+    scan_metadata = _initial_scan_metadata(saved)
     try:
         absolute_path = str(UPLOAD_DIR.parent / image_path.lstrip("/"))
-        vision, raw_response = await analyze_receipt(absolute_path)
+        with stage("scan", "analyze_receipt"):
+            vision, raw_response = await analyze_receipt(
+                absolute_path, image_hash=saved.sha256, scan_metadata=scan_metadata, image=saved.vision_image
+            )
     except ValueError as e:
         _cleanup_uploaded_file(image_path)
         raise HTTPException(status_code=422, detail=str(e))
+    except VisionUnavailableError as e:
+        _cleanup_uploaded_file(image_path)
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         _cleanup_uploaded_file(image_path)
         raise HTTPException(status_code=500, detail=f"AI解析中にエラーが発生しました: {e}")
@@ -66,17 +119,97 @@ async def scan_receipt(file: UploadFile, db: Session = Depends(get_db)):
     # 3. カテゴリ補完（Vision API が null の場合）
     if not vision.category and vision.items:
         items_dicts = [item.model_dump() for item in vision.items]
-        inferred = classify_by_items(items_dicts)
+        with stage("scan", "classify"):
+            inferred = classify_by_items(items_dicts)
         if inferred:
             vision.category = inferred
 
     # 4. サムネイル生成
-    thumbnail_path = generate_thumbnail(image_path)
+    with stage("scan", "generate_thumbnail"):
+        thumbnail_path = await _make_thumbnail(saved)
 
     # 5. DB保存
-    receipt = create_receipt(db, image_path, vision, raw_response, thumbnail_path=thumbnail_path)
-
-    return receipt
+    with stage("scan", "create_receipt"):
+        receipt = create_receipt(
+            db,
+            image_path,
+            vision,
+            raw_response,
+            thumbnail_path=thumbnail_path,
+            image_phash=saved.phash,
+            scan_metadata=scan_metadata,
+        )
+
+    response = ScanReceiptResponse.model_validate(receipt)
+    response.duplicates = duplicates
+    return response
+
+
+async def _scan_batch_file(file: UploadFile, db: Session) -> BatchScanResultItem:
+    """一括スキャンの1ファイル分を処理する。失敗しても例外は送出せず結果に記録する。"""
+    filename = file.filename or "unknown"
+    saved_image_path = None
+    try:
+        # 1. 画像保存
+        with stage("batch", "save_image"):
+            saved = await save_image(file, needs_vision=needs_vision_payload)
+        saved_image_path = saved.path
+        with stage("batch", "find_duplicates"):
+            duplicates = find_duplicates(db, saved.phash)
+
+        # 2. Vision API で解析
+        scan_metadata = _initial_scan_metadata(saved)
+        absolute_path = str(UPLOAD_DIR.parent / saved_image_path.lstrip("/"))
+        with stage("batch", "analyze_receipt"):
+            vision, raw_response = await analyze_receipt(
+                absolute_path,
+                image_hash=saved.sha256,
+                scan_metadata=scan_metadata,
+                image=saved.vision_image,
+                priority=PRIORITY_BACKGROUND,
+            )
+
+        # 3. カテゴリ補完
+        if not vision.category and vision.items:
+            items_dicts = [item.model_dump() for item in vision.items]
+            with stage("batch", "classify"):
+                inferred = classify_by_items(items_dicts)
+            if inferred:
+                vision.category = inferred
+
+        # 4. サムネイル生成
+        with stage("batch", "generate_thumbnail"):
+            thumbnail_path = await _make_thumbnail(saved)
+
+        # 5. DB保存（commit 後は他タスクの commit で属性が失効するため、すぐにレスポンスへ変換する）
+        with stage("batch", "create_receipt"):
+            receipt = create_receipt(
+                db,
+                saved_image_path,
+                vision,
+                raw_response,
+                thumbnail_path=thumbnail_path,
+                image_phash=saved.phash,
+                scan_metadata=scan_metadata,
+            )
+
+        return BatchScanResultItem(
+            filename=filename,
+            success=True,
+            receipt=ReceiptResponse.model_validate(receipt),
+            duplicates=duplicates,
+        )
+    except Exception as e:
+        logger.warning("Batch scan failed for %s: %s", filename, e)
+        # セッションは全ファイルで共有しているため、失敗した commit を巻き戻して後続のファイルを続行できるようにする
+        db.rollback()
+        if saved_image_path:
+            _cleanup_uploaded_file(saved_image_path)
+        return BatchScanResultItem(
+            filename=filename,
+            success=False,
+            error=str(e),
+        )
 
 
 @router.post("/scan/batch", response_model=BatchScanResponse, status_code=201)
@@ -84,56 +217,24 @@ async def batch_scan_receipts(
     files: list[UploadFile],
     db: Session = Depends(get_db),
 ):
-    """複数のレシート画像を一括アップロードし、順次AI解析してDBに保存する。"""
-    results: list[BatchScanResultItem] = []
-    success_count = 0
-    error_count = 0
-
-    for file in files:
-        filename = file.filename or "unknown"
-        saved_image_path = None
-        try:
-            # 1. 画像保存
-            saved_image_path = await save_image(file)
+    """複数のレシート画像を一括アップロードし、並行してAI解析してDBに保存する。
 
-            # 2. Vision API で解析
-            absolute_path = str(UPLOAD_DIR.parent / saved_image_path.lstrip("/"))
-            vision, raw_response = await analyze_receipt(absolute_path)
+    同時実行数は BATCH_SCAN_CONCURRENCY で制限する。結果はアップロード順に並ぶ。
+    """
+    semaphore = asyncio.Semaphore(BATCH_SCAN_CONCURRENCY)
 
-            # 3. カテゴリ補完
-            if not vision.category and vision.items:
-                items_dicts = [item.model_dump() for item in vision.items]
-                inferred = classify_by_items(items_dicts)
-                if inferred:
-                    vision.category = inferred
-
-            # 4. サムネイル生成
-            thumbnail_path = generate_thumbnail(saved_image_path)
-
-            # 5. DB保存
-            receipt = create_receipt(db, saved_image_path, vision, raw_response, thumbnail_path=thumbnail_path)
-
-            results.append(BatchScanResultItem(
-                filename=filename,
-                success=True,
-                receipt=ReceiptResponse.model_validate(receipt),
-            ))
-            success_count += 1
-        except Exception as e:
-            logger.warning("Batch scan failed for %s: %s", filename, e)
-            if saved_image_path:
-                _cleanup_uploaded_file(saved_image_path)
-            results.append(BatchScanResultItem(
-                filename=filename,
-                success=False,
-                error=str(e),
-            ))
-            error_count += 1
+    async def run(file: UploadFile) -> BatchScanResultItem:
+        async with semaphore:
+            with scans_in_flight.track_inprogress(pipeline="batch"):
+                return await _scan_batch_file(file, db)
 
+    results = await asyncio.gather(*(run(file) for file in files))
+
+    success_count = sum(1 for r in results if r.success)
     return BatchScanResponse(
         results=results,
         success_count=success_count,
-        error_count=error_count,
+        error_count=len(results) - success_count,
     )
 
 
@@ -141,6 +242,7 @@ async def batch_scan_receipts(
 def list_receipts(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None),
     sort_by: str = Query("created_at"),
     sort_order: str = Query("desc"),
     date_from: datetime.date | None = Query(None),
@@ -151,23 +253,41 @@ def list_receipts(
     search: str | None = Query(None),
     db: Session = Depends(get_db),
 ):
-    """レシート一覧を取得する（ページネーション・フィルタ・ソート対応）。"""
-    if sort_by not in ALLOWED_SORT_FIELDS:
+    """レシート一覧を取得する（ページネーション・フィルタ・ソート対応）。
+
+    skip/limit によるオフセット方式に加え、レスポンスの next_cursor を
+    cursor に渡すとキーセット方式で次のページを取得できる。
+    search は店名・品目名の全文検索で、sort_by=relevance で関連度順になる。
+    """
+    if sort_by not in ALLOWED_SORT_FIELDS and not (sort_by == RELEVANCE_SORT and search):
         raise HTTPException(status_code=400, detail="無効なソートフィールドです")
-    items, total = get_receipts(
-        db,
-        skip=skip,
-        limit=limit,
-        sort_by=sort_by,
-        sort_order=sort_order,
-        date_from=date_from,
-        date_to=date_to,
-        category=category,
-        amount_min=amount_min,
-        amount_max=amount_max,
-        search=search,
+    if sort_order not in ("asc", "desc"):
+        sort_order = "desc"
+    try:
+        items, total = get_receipts(
+            db,
+            skip=skip,
+            limit=limit,
+            sort_by=sort_by,
+            sort_order=sort_order,
+            date_from=date_from,
+            date_to=date_to,
+            category=category,
+            amount_min=amount_min,
+            amount_max=amount_max,
+            search=search,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    has_more = (
+        sort_by != RELEVANCE_SORT
+        and len(items) == limit
+        and (cursor is not None or skip + len(items) < total)
     )
-    return ReceiptListResponse(items=items, total=total)
+    next_cursor = encode_cursor(items[-1], sort_by, sort_order) if has_more else None
+    return ReceiptListResponse(items=items, total=total, next_cursor=next_cursor)
 
 
 @router.get("/export/csv")
@@ -185,10 +305,8 @@ def export_csv(
     """フィルタ条件に合致するレシートをCSVでエクスポートする。"""
     if sort_by not in ALLOWED_SORT_FIELDS:
         raise HTTPException(status_code=400, detail="無効なソートフィールドです")
-    items, _ = get_receipts(
+    batches = iter_receipt_batches(
         db,
-        skip=0,
-        limit=10000,
         sort_by=sort_by,
         sort_order=sort_order,
         date_from=date_from,
@@ -198,15 +316,72 @@ def export_csv(
         amount_max=amount_max,
         search=search,
     )
-    csv_content = generate_csv(items)
+
+    def stream():
+        # get_db の後処理はレスポンス送信前に走るため、セッションはストリーム完了時に閉じる
+        try:
+            yield from iter_csv(batches)
+        finally:
+            db.close()
 
     return StreamingResponse(
-        iter([csv_content]),
+        stream(),
         media_type="text/csv; charset=utf-8",
         headers={"Content-Disposition": "attachment; filename=receipts.csv"},
     )
 
 
+@router.post("/duplicates", response_model=DuplicateCheckResponse)
+async def check_duplicates(file: UploadFile, db: Session = Depends(get_db)):
+    """画像を保存・解析せずに、見た目が近い既存レシートを返す。"""
+    try:
+        phash = await compute_upload_phash(file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DuplicateCheckResponse(phash=phash, duplicates=find_duplicates(db, phash))
+
+
+@router.get("/{receipt_id}/duplicates", response_model=list[DuplicateCandidate])
+def read_receipt_duplicates(receipt_id: int, db: Session = Depends(get_db)):
+    """既存レシートと見た目が近い他のレシートを返す。"""
+    receipt = get_receipt(db, receipt_id)
+    if not receipt:
+        raise HTTPException(status_code=404, detail="レシートが見つかりません")
+    return find_duplicates(db, receipt.image_phash, exclude_id=receipt.id)
+
+
+@router.get("/{receipt_id}/image")
+async def read_receipt_image(
+    receipt_id: int,
+    w: int = Query(..., description="幅（px）。DERIVATIVE_WIDTHS のいずれか"),
+    fmt: str = Query("webp", description="webp / jpeg / png"),
+    if_none_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    """レシート画像を指定幅・形式に変換して返す（初回生成後はディスクキャッシュから配信）。"""
+    try:
+        validate_request(w, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    receipt = get_receipt(db, receipt_id)
+    if not receipt:
+        raise HTTPException(status_code=404, detail="レシートが見つかりません")
+
+    # ETag は生成せずに求められるため、一致すれば派生画像を作らずに 304 を返す
+    etag = derivative_etag(receipt.image_path, w, fmt)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    derivative = await run_image_task(get_derivative, receipt.image_path, w, fmt)
+    if derivative is None:
+        raise HTTPException(status_code=404, detail="画像ファイルが見つかりません")
+    # パスではなく開いたファイルから送るため、送信中に LRU で追い出されても途中で欠けない
+    headers["Content-Length"] = str(derivative.size)
+    return StreamingResponse(derivative.iter_chunks(), media_type=derivative.media_type, headers=headers)
+
+
 @router.get("/{receipt_id}", response_model=ReceiptResponse)
 def read_receipt(receipt_id: int, db: Session = Depends(get_db)):
     """レシート詳細を取得する。"""
@@ -0,0 +1,110 @@
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.schemas.scan_job import ScanBatchStatusResponse, ScanJobResponse
+from app.services import bulk_vision_service
+from app.services.image_service import save_image
+from app.services.scan_job_service import (
+    enqueue_job,
+    get_batch_jobs,
+    get_job,
+    record_failed_job,
+    worker_pool,
+)
+
+router = APIRouter(prefix="/scan-jobs", tags=["scan-jobs"])
+
+
+def _batch_status(batch_id: str, jobs: list) -> ScanBatchStatusResponse:
+    counts = {"queued": 0, "processing": 0, "submitted": 0, "succeeded": 0, "failed": 0}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return ScanBatchStatusResponse(
+        batch_id=batch_id,
+        total=len(jobs),
+        vision_batch_ids=sorted({job.vision_batch_id for job in jobs if job.vision_batch_id}),
+        jobs=[ScanJobResponse.model_validate(job) for job in jobs],
+        **counts,
+    )
+
+
+@router.post("", response_model=ScanJobResponse, status_code=202)
+async def create_scan_job(file: UploadFile, db: Session = Depends(get_db)):
+    """レシート画像を保存して解析ジョブを登録し、ジョブIDをすぐに返す。"""
+    try:
+        saved = await save_image(file, derivatives=False)  # サムネイル・Vision 送信用画像はワーカーが作る
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = enqueue_job(db, saved, filename=file.filename)
+    worker_pool.notify()
+    return job
+
+
+@router.post("/batch", response_model=ScanBatchStatusResponse, status_code=202)
+async def create_batch_scan_jobs(files: list[UploadFile], db: Session = Depends(get_db)):
+    """複数のレシート画像を一括登録する。保存できなかったファイルは失敗ジョブとして記録する。"""
+    batch_id = str(uuid.uuid4())
+    jobs = []
+    for file in files:
+        filename = file.filename or "unknown"
+        try:
+            saved = await save_image(file, derivatives=False)
+        except ValueError as e:
+            jobs.append(record_failed_job(db, filename, str(e), batch_id=batch_id))
+            continue
+        jobs.append(enqueue_job(db, saved, filename=filename, batch_id=batch_id))
+
+    worker_pool.notify()
+    return _batch_status(batch_id, jobs)
+
+
+@router.post("/bulk", response_model=ScanBatchStatusResponse, status_code=202)
+async def create_bulk_scan_jobs(files: list[UploadFile], db: Session = Depends(get_db)):
+    """大量のレシート画像を Message Batches API でまとめて解析する。
+
+    結果はバックグラウンドで取り込まれるため、進捗は GET /scan-jobs/batches/{batch_id} で確認する。
+    """
+    try:
+        bulk_vision_service.ensure_configured()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    batch_id = str(uuid.uuid4())
+    jobs, submitted = [], []
+    for file in files:
+        filename = file.filename or "unknown"
+        try:
+            # 送信用画像は submit_jobs がバッチごとにファイルから作る（全件分をメモリに持たない）
+            saved = await save_image(file, derivatives=False)
+        except ValueError as e:
+            jobs.append(record_failed_job(db, filename, str(e), batch_id=batch_id))
+            continue
+        job = enqueue_job(db, saved, filename=filename, batch_id=batch_id, status="submitted")
+        jobs.append(job)
+        submitted.append(job)
+
+    await bulk_vision_service.submit_jobs(db, submitted)
+    worker_pool.notify()  # 投入に失敗して queued に戻ったジョブを処理させる
+    return _batch_status(batch_id, jobs)
+
+
+@router.get("/batches/{batch_id}", response_model=ScanBatchStatusResponse)
+def read_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """バッチ内の各ジョブの状態と集計を返す。"""
+    jobs = get_batch_jobs(db, batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="バッチが見つかりません")
+    return _batch_status(batch_id, jobs)
+
+
+@router.get("/{job_id}", response_model=ScanJobResponse)
+def read_scan_job(job_id: str, db: Session = Depends(get_db)):
+    """ジョブの状態とステージごとのタイムスタンプを返す。"""
+    job = get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
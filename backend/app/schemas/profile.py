@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import datetime
+
+from pydantic import BaseModel
+
+
+class ProfileInfo(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: int
+    started_at: datetime.datetime
+    duration_ms: float
+    samples: int
@@ -42,6 +42,7 @@ class ReceiptResponse(ReceiptBase):
     id: int
     image_path: str
     thumbnail_path: str | None = None
+    scan_metadata: dict | None = None
     items: list[ReceiptItemResponse] = []
     created_at: datetime.datetime
     updated_at: datetime.datetime
@@ -52,6 +53,27 @@ class ReceiptResponse(ReceiptBase):
 class ReceiptListResponse(BaseModel):
     items: list[ReceiptResponse]
     total: int
+    next_cursor: str | None = None
+
+
+# --- Duplicate ---
+
+class DuplicateCandidate(BaseModel):
+    receipt_id: int
+    distance: int
+    store_name: str | None = None
+    date: datetime.date | None = None
+    total_amount: float | None = None
+    thumbnail_path: str | None = None
+
+
+class DuplicateCheckResponse(BaseModel):
+    phash: str
+    duplicates: list[DuplicateCandidate]
+
+
+class ScanReceiptResponse(ReceiptResponse):
+    duplicates: list[DuplicateCandidate] = []
 
 
 # --- Vision API ---
@@ -66,6 +88,7 @@ class BatchScanResultItem(BaseModel):
     filename: str
     success: bool
     receipt: ReceiptResponse | None = None
+    duplicates: list[DuplicateCandidate] = []
     error: str | None = None
 
 
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import datetime
+
+from pydantic import BaseModel
+
+
+class ScanJobResponse(BaseModel):
+    id: str
+    batch_id: str | None = None
+    filename: str | None = None
+    status: str
+    error: str | None = None
+    receipt_id: int | None = None
+    vision_batch_id: str | None = None
+    queued_at: datetime.datetime
+    started_at: datetime.datetime | None = None
+    analyzed_at: datetime.datetime | None = None
+    thumbnailed_at: datetime.datetime | None = None
+    finished_at: datetime.datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+
+class ScanBatchStatusResponse(BaseModel):
+    batch_id: str
+    total: int
+    queued: int
+    processing: int
+    submitted: int = 0
+    succeeded: int
+    failed: int
+    vision_batch_ids: list[str] = []
+    jobs: list[ScanJobResponse]
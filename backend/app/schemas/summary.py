@@ -25,3 +25,13 @@ class MonthOption(BaseModel):
 
 class MonthlyListResponse(BaseModel):
     months: list[MonthOption]
+
+
+class SummaryCacheStatsResponse(BaseModel):
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidations: int
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+
+
+class VisionCacheStatsResponse(BaseModel):
+    entries: int
+    total_bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class VisionCachePurgeResponse(BaseModel):
+    deleted: int
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+
+
+class VisionLimiterStatsResponse(BaseModel):
+    in_flight: int
+    queue_depth: int
+    max_concurrency: int
+    calls: int
+    retries: int
+    rejected: int
+    wait_count: int
+    wait_avg_ms: float
+    wait_max_ms: float
+    circuit_state: str
+    circuit_opened: int
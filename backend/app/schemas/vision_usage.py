@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import datetime
+
+from pydantic import BaseModel
+
+
+class VisionUsageDay(BaseModel):
+    date: datetime.date
+    model: str
+    calls: int
+    errors: int
+    batch_calls: int
+    input_tokens: int
+    output_tokens: int
+    cache_creation_input_tokens: int
+    cache_read_input_tokens: int
+    cache_read_ratio: float
+    estimated_cost_usd: float | None
+    avg_latency_ms: float | None
+    max_latency_ms: float | None
+
+
+class VisionUsageResponse(BaseModel):
+    date_from: datetime.date
+    date_to: datetime.date
+    days: list[VisionUsageDay]
+    total_estimated_cost_usd: float
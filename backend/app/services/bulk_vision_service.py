@@ -0,0 +1,280 @@
+"""Message Batches API による一括解析（過去レシートの大量取り込み用）。
+
+保存済み画像のスキャンジョブを submitted 状態で登録し、BULK_VISION_MAX_REQUESTS 件ずつ
+バッチとして投入する（解析キャッシュにある画像は投入しない）。Anthropic 側のバッチIDは vision_batches に保存し、BulkBatchPoller が
+定期的に完了を確認して、結果ごとに JSON 抽出 → カテゴリ補完 → サムネイル生成 → DB保存 を行う。
+未処理のバッチは vision_batches から再開するため、再起動しても結果は取り込まれる。
+"""
+import asyncio
+import logging
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+import anthropic
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import (
+    ANTHROPIC_API_KEY,
+    BULK_VISION_MAX_REQUESTS,
+    BULK_VISION_POLL_INTERVAL,
+    MOCK_VISION,
+    UPLOAD_DIR,
+    VISION_CACHE_ENABLED,
+    VISION_MODEL,
+)
+from app.database import SessionLocal
+from app.models.scan_job import ScanJob
+from app.models.vision_batch import VisionBatch
+from app.services import vision_cache_service, vision_usage_service
+from app.services.metrics import vision_errors_total
+from app.services.scan_job_service import complete_job, fail_job
+from app.services.vision_replay import replay_enabled
+from app.services.vision_service import (
+    PROMPT_VERSION,
+    _encode_image,
+    _get_client,
+    build_message_params,
+    message_text,
+    parse_vision_text,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def ensure_configured() -> None:
+    """一括取り込みが使える設定か確認する（モック解析・再生では Batches API を呼べない）。"""
+    if MOCK_VISION or replay_enabled():
+        raise ValueError("MOCK_VISION・VISION_REPLAY_DIR 有効時は一括取り込みを利用できません")
+    if not ANTHROPIC_API_KEY:
+        raise ValueError("ANTHROPIC_API_KEY が設定されていません")
+
+
+async def _complete_from_cache(db: Session, job: ScanJob) -> bool:
+    """解析キャッシュにある画像のジョブはバッチに含めず、その場で取り込む。取り込んだら True。"""
+    if not (VISION_CACHE_ENABLED and job.image_sha256):
+        return False
+    cached = vision_cache_service.get_cached_result(db, job.image_sha256, VISION_MODEL, PROMPT_VERSION)
+    if cached is None:
+        return False
+    vision, raw_text = cached
+    job.analyzed_at = _now()
+    try:
+        await complete_job(db, job, vision, raw_text, {"vision": {"cache_hit": True}}, pipeline="bulk")
+    except Exception as e:
+        fail_job(db, job, str(e))
+    return True
+
+
+def _requeue(db: Session, jobs: list[ScanJob]) -> None:
+    """投入できなかったジョブを通常のキューへ戻す（ワーカーが Messages API で解析する）。"""
+    for job in jobs:
+        job.status = "queued"
+        job.started_at = None
+    db.commit()
+
+
+async def submit_jobs(
+    db: Session,
+    jobs: list[ScanJob],
+    client: anthropic.AsyncAnthropic | None = None,
+) -> list[VisionBatch]:
+    """submitted 状態のジョブを BULK_VISION_MAX_REQUESTS 件ずつバッチとして投入する。
+
+    解析キャッシュにある画像は投入せずに取り込む。送信用画像はバッチごとに保存済みファイルから
+    作るため、メモリに載るのは1バッチ分だけ。画像を読めないジョブは failed にし、
+    投入に失敗したバッチのジョブは queued に戻す（画像は残る）。
+    """
+    client = client or _get_client()
+    pending = [job for job in jobs if not await _complete_from_cache(db, job)]
+    batches = []
+    for start in range(0, len(pending), BULK_VISION_MAX_REQUESTS):
+        requests, chunk = [], []
+        for job in pending[start:start + BULK_VISION_MAX_REQUESTS]:
+            absolute_path = str(UPLOAD_DIR.parent / job.image_path.lstrip("/"))
+            try:
+                b64_data, media_type = await _encode_image(absolute_path)
+            except Exception as e:
+                fail_job(db, job, f"画像を読み込めませんでした: {e}")
+                continue
+            requests.append({"custom_id": job.id, "params": build_message_params(b64_data, media_type)})
+            chunk.append(job)
+        if not chunk:
+            continue
+        try:
+            batch = await client.messages.batches.create(requests=requests)
+        except Exception as e:
+            logger.warning("一括解析バッチの投入に失敗したため、%d 件を通常のキューへ戻します: %s", len(chunk), e)
+            _requeue(db, chunk)
+            continue
+        del requests
+
+        record = VisionBatch(id=batch.id, scan_batch_id=chunk[0].batch_id, request_count=len(chunk))
+        db.add(record)
+        for job in chunk:
+            job.vision_batch_id = batch.id
+            job.started_at = _now()
+        db.commit()
+        batches.append(record)
+        logger.info("一括解析バッチを投入しました: %s（%d 件）", batch.id, len(chunk))
+    return batches
+
+
+def _result_error(result) -> str:
+    if result.type == "errored":
+        error = getattr(result.error, "error", None)
+        return f"解析エラー: {getattr(error, 'message', None) or getattr(error, 'type', 'unknown')}"
+    return f"バッチ内のリクエストが完了しませんでした: {result.type}"
+
+
+async def _apply_result(db: Session, job: ScanJob, result, vision_batch_id: str) -> bool:
+    """1件分のバッチ結果をジョブに反映する。成功なら True。"""
+    job.analyzed_at = _now()
+    if result.type != "succeeded":
+        if result.type == "errored":
+            vision_usage_service.record_call(db, VISION_MODEL, mode="batch", status="error")
+            vision_errors_total.inc(kind="api")
+        fail_job(db, job, _result_error(result))
+        return False
+    try:
+        usage = result.message.usage
+        vision_usage_service.record_call(db, VISION_MODEL, usage, mode="batch")
+        raw_text = message_text(result.message)
+        vision = parse_vision_text(raw_text)
+        if VISION_CACHE_ENABLED and job.image_sha256:
+            vision_cache_service.store_result(db, job.image_sha256, VISION_MODEL, PROMPT_VERSION, vision, raw_text)
+        scan_metadata = {
+            "vision": {
+                "bulk_batch_id": vision_batch_id,
+                **vision_usage_service.usage_fields(usage),
+            }
+        }
+        await complete_job(db, job, vision, raw_text, scan_metadata, pipeline="bulk")
+        return True
+    except Exception as e:
+        fail_job(db, job, str(e))
+        return False
+
+
+async def poll_batch(db: Session, record: VisionBatch, client: anthropic.AsyncAnthropic | None = None) -> bool:
+    """バッチの状態を確認し、終了していれば結果を取り込む。取り込んだら True。"""
+    client = client or _get_client()
+    batch = await client.messages.batches.retrieve(record.id)
+    record.last_polled_at = _now()
+    if batch.processing_status != "ended":
+        db.commit()
+        return False
+
+    record.ended_at = batch.ended_at or _now()
+    db.commit()
+    jobs = {job.id: job for job in db.query(ScanJob).filter(ScanJob.vision_batch_id == record.id)}
+    async for entry in await client.messages.batches.results(record.id):
+        job = jobs.pop(entry.custom_id, None)
+        if job is None or job.status != "submitted":  # 取り込み途中で停止した場合の再実行ではスキップ
+            continue
+        await _apply_result(db, job, entry.result, record.id)
+
+    for job in jobs.values():
+        if job.status == "submitted":
+            fail_job(db, job, "バッチ結果に含まれていませんでした")
+
+    statuses = [status for (status,) in db.query(ScanJob.status).filter(ScanJob.vision_batch_id == record.id)]
+    record.succeeded_count = statuses.count("succeeded")
+    record.failed_count = statuses.count("failed")
+    record.status = "processed"
+    record.processed_at = _now()
+    db.commit()
+    return True
+
+
+def pending_batches(db: Session) -> list[VisionBatch]:
+    """結果を取り込んでいないバッチを投入順に返す。"""
+    return (
+        db.query(VisionBatch)
+        .filter(VisionBatch.status == "in_progress")
+        .order_by(VisionBatch.submitted_at.asc())
+        .all()
+    )
+
+
+def requeue_unsubmitted_jobs(db: Session) -> int:
+    """投入前に停止して submitted のまま残ったジョブを通常のキューへ戻す。戻した件数を返す。"""
+    result = db.execute(
+        update(ScanJob)
+        .where(ScanJob.status == "submitted", ScanJob.vision_batch_id.is_(None))
+        .values(status="queued", started_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+
+class BulkBatchPoller:
+    """投入済みバッチの完了を定期的に確認し、結果を取り込むバックグラウンドタスク。"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        poll_interval: float = BULK_VISION_POLL_INTERVAL,
+        client_factory: Callable[[], anthropic.AsyncAnthropic] = _get_client,
+    ):
+        self._session_factory = session_factory
+        self._poll_interval = poll_interval
+        self._client_factory = client_factory
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        db = self._session_factory()
+        try:
+            requeued = requeue_unsubmitted_jobs(db)
+        finally:
+            db.close()
+        if requeued:
+            logger.info("未投入の一括解析ジョブを通常キューへ戻しました: %d 件", requeued)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def poll_once(self) -> int:
+        """未処理のバッチをすべて確認し、結果を取り込んだバッチ数を返す。"""
+        db = self._session_factory()
+        try:
+            batches = pending_batches(db)
+            if not batches:
+                return 0
+            client = self._client_factory()
+            processed = 0
+            for record in batches:
+                try:
+                    processed += await poll_batch(db, record, client)
+                except Exception:
+                    db.rollback()
+                    logger.warning("一括解析バッチ %s の確認に失敗しました", record.id, exc_info=True)
+            return processed
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.error("一括解析バッチの確認でエラーが発生しました", exc_info=True)
+            await asyncio.sleep(self._poll_interval)
+
+
+bulk_poller = BulkBatchPoller()
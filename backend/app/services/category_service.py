@@ -1,4 +1,5 @@
 """品目キーワードからカテゴリを補助分類するサービス。"""
+from collections.abc import Iterable, Mapping
 
 # キーワード → カテゴリ の辞書（品目名に含まれるキーワードで判定）
 KEYWORD_MAP: dict[str, str] = {
@@ -72,6 +73,93 @@ KEYWORD_MAP: dict[str, str] = {
 }
 
 
+class KeywordMatcher:
+    """キーワード辞書を Aho-Corasick オートマトンにコンパイルした多パターンマッチャー。
+
+    品目名を1回走査するだけで、含まれるキーワードのうち辞書順で最初のもの
+    （従来の「KEYWORD_MAP を先頭から調べて最初に一致したもの」と同じ）を求める。
+    空のキーワード（従来の走査ではすべての品目に一致する）は受け付けない。
+    """
+
+    _NO_MATCH = -1
+
+    def __init__(self, keyword_map: Mapping[str, str]):
+        self._categories: list[str] = []
+        self._goto: list[dict[str, int]] = [{}]
+        # 各状態で一致しうるキーワードのうち、辞書内の順位が最小のもの
+        self._best: list[int] = [self._NO_MATCH]
+
+        for keyword, category in keyword_map.items():
+            if not keyword:
+                raise ValueError(f"空のキーワードは登録できません（カテゴリ: {category}）")
+            priority = len(self._categories)
+            self._categories.append(category)
+            self._insert(keyword, priority)
+        self._build_failure_links()
+
+    def _insert(self, keyword: str, priority: int) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._best.append(self._NO_MATCH)
+            state = next_state
+        if self._best[state] == self._NO_MATCH:
+            self._best[state] = priority
+
+    def _build_failure_links(self) -> None:
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:  # 幅優先（queue は走査中に伸びる）
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._best[next_state] = self._min_priority(
+                    self._best[next_state], self._best[self._fail[next_state]]
+                )
+                queue.append(next_state)
+
+    @classmethod
+    def _min_priority(cls, a: int, b: int) -> int:
+        if a == cls._NO_MATCH:
+            return b
+        if b == cls._NO_MATCH:
+            return a
+        return min(a, b)
+
+    def first_match(self, text: str) -> str | None:
+        """text に含まれるキーワードのうち辞書順で最初のもののカテゴリを返す。"""
+        goto, fail, best = self._goto, self._fail, self._best
+        state = 0
+        found = self._NO_MATCH
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best[state] != self._NO_MATCH:
+                found = self._min_priority(found, best[state])
+                if found == 0:
+                    break
+        return self._categories[found] if found != self._NO_MATCH else None
+
+
+_matcher = KeywordMatcher(KEYWORD_MAP)
+
+
+def load_keyword_map(keyword_map: Mapping[str, str]) -> None:
+    """キーワード辞書を差し替え、マッチャーを再構築する。空のキーワードを含む場合は ValueError（辞書は変えない）。"""
+    global KEYWORD_MAP, _matcher
+    matcher = KeywordMatcher(keyword_map)
+    KEYWORD_MAP = dict(keyword_map)
+    _matcher = matcher
+
+
 def classify_by_items(items: list[dict[str, str | float | None]]) -> str | None:
     """品目リストからキーワードマッチでカテゴリを推定する。
 
@@ -84,14 +172,17 @@ def classify_by_items(items: list[dict[str, str | float | None]]) -> str | None:
     category_counts: dict[str, int] = {}
 
     for item in items:
-        name = item.get("name") or ""
-        for keyword, category in KEYWORD_MAP.items():
-            if keyword in name:
-                category_counts[category] = category_counts.get(category, 0) + 1
-                break
+        category = _matcher.first_match(item.get("name") or "")
+        if category is not None:
+            category_counts[category] = category_counts.get(category, 0) + 1
 
     if not category_counts:
         return None
 
     # 最も多いカテゴリを返す
     return max(category_counts, key=lambda k: category_counts[k])
+
+
+def classify_receipts(receipts: Iterable[list[dict[str, str | float | None]]]) -> list[str | None]:
+    """複数レシートの品目リストをまとめて分類する。結果は入力と同じ順に並ぶ。"""
+    return [classify_by_items(items) for items in receipts]
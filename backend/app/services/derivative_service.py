@@ -0,0 +1,185 @@
+"""元画像から指定幅・形式の派生画像をオンデマンドで生成し、ディスクにキャッシュする。
+
+派生画像は THUMBNAIL_DIR/derived/ に `{元画像名}_w{幅}.{拡張子}` で保存する。
+元画像は UUID 名で上書きされないため、同じ (画像, 幅, 形式) の派生画像は常に同一内容になる。
+合計サイズが DERIVATIVE_CACHE_MAX_BYTES を超えたら、最終参照（mtime）が古いものから削除する。
+get_derivative は派生画像を開いた状態で返すため、配信中に追い出されても読み終えるまで内容は残る。
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image, ImageOps
+
+from app.config import (
+    DERIVATIVE_CACHE_MAX_BYTES,
+    DERIVATIVE_DIR,
+    DERIVATIVE_FORMATS,
+    DERIVATIVE_QUALITY,
+    DERIVATIVE_WIDTHS,
+    UPLOAD_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_INFO = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "png": ("PNG", ".png", "image/png"),
+}
+
+CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_cache_bytes: int | None = None  # キャッシュ合計サイズ（初回に走査して以降は差分で更新）
+
+
+@dataclass(frozen=True)
+class Derivative:
+    """生成済み（またはキャッシュ済み）の派生画像。"""
+
+    path: Path
+    media_type: str
+    etag: str
+    file: BinaryIO  # 開いたままのファイル（iter_chunks で読み終えると閉じる）
+    size: int
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """ファイルを CHUNK_SIZE ずつ読み、読み終えたら閉じる。"""
+        try:
+            while chunk := self.file.read(CHUNK_SIZE):
+                yield chunk
+        finally:
+            self.file.close()
+
+
+def validate_request(width: int, fmt: str) -> None:
+    """幅と形式がホワイトリストに含まれるか検証する。"""
+    if width not in DERIVATIVE_WIDTHS:
+        raise ValueError(f"対応していない幅です: {width}（{', '.join(map(str, DERIVATIVE_WIDTHS))} のいずれか）")
+    if fmt not in DERIVATIVE_FORMATS:
+        raise ValueError(f"対応していない形式です: {fmt}（{', '.join(sorted(DERIVATIVE_FORMATS))} のいずれか）")
+
+
+def _derivative_path(image_name: str, width: int, fmt: str) -> Path:
+    return DERIVATIVE_DIR / f"{Path(image_name).stem}_w{width}{FORMAT_INFO[fmt][1]}"
+
+
+def derivative_etag(image_path: str, width: int, fmt: str) -> str:
+    """派生画像の ETag。元画像名（UUID で上書きされない）と幅・形式・品質から決まるため、生成せずに求められる。"""
+    key = f"{Path(image_path).name}:{width}:{fmt}:{DERIVATIVE_QUALITY}"
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def _render(source: Path, target: Path, width: int, fmt: str) -> BinaryIO:
+    """元画像を縮小・再エンコードして target に書き込み、書き込んだファイルを開いて返す。"""
+    pil_format = FORMAT_INFO[fmt][0]
+    with Image.open(source) as img:
+        # 回転後にどちらが横幅になっても width を下回らないよう、縦横とも width 以上で縮小デコード
+        img.draft("RGB", (width, width))
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:  # 拡大はしない
+            img = img.resize((width, round(img.height * width / img.width)), Image.Resampling.LANCZOS)
+        if pil_format == "JPEG" or img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGB")
+        tmp = target.with_name(f".{uuid.uuid4().hex}{target.suffix}")
+        try:
+            img.save(tmp, pil_format, quality=DERIVATIVE_QUALITY)
+            file = tmp.open("rb")  # 置き換え直後に追い出されても読めるよう、置き換える前に開く
+            os.replace(tmp, target)  # 同時生成されても中途半端なファイルは見えない
+        finally:
+            tmp.unlink(missing_ok=True)
+    return file
+
+
+def _scan_cache_bytes() -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(DERIVATIVE_DIR) if entry.is_file())
+
+
+def _add_bytes(delta: int) -> None:
+    """キャッシュ合計サイズを更新し、上限を超えていれば古いものから削除する。"""
+    global _cache_bytes
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = _scan_cache_bytes()
+        else:
+            _cache_bytes += delta
+        if _cache_bytes > DERIVATIVE_CACHE_MAX_BYTES:
+            _cache_bytes -= _evict(_cache_bytes - DERIVATIVE_CACHE_MAX_BYTES)
+
+
+def _evict(excess: int) -> int:
+    """mtime が古い派生画像から excess バイト以上を削除し、削除したバイト数を返す。"""
+    entries = sorted(
+        (entry for entry in os.scandir(DERIVATIVE_DIR) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    freed = 0
+    for entry in entries:
+        if freed >= excess:
+            break
+        size = entry.stat().st_size
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+        freed += size
+    return freed
+
+
+def get_derivative(image_path: str, width: int, fmt: str) -> Derivative | None:
+    """派生画像を開いて返す。キャッシュになければ生成する。元画像がなければ None。
+
+    返した Derivative のファイルは呼び出し側で閉じる（iter_chunks で読み切れば閉じる）。
+    Pillow のデコード・エンコードを含むため、run_image_task 経由で呼び出す。
+    """
+    image_name = Path(image_path).name
+    source = UPLOAD_DIR / image_name
+    target = _derivative_path(image_name, width, fmt)
+    media_type = FORMAT_INFO[fmt][2]
+    etag = derivative_etag(image_path, width, fmt)
+
+    try:
+        file = target.open("rb")
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            os.utime(target)  # LRU のため最終参照時刻を更新
+        except FileNotFoundError:
+            pass  # 開いた後に追い出されても内容は読める
+        return Derivative(target, media_type, etag, file, os.fstat(file.fileno()).st_size)
+
+    if not source.is_file():
+        return None
+    file = _render(source, target, width, fmt)
+    size = os.fstat(file.fileno()).st_size
+    _add_bytes(size)
+    return Derivative(target, media_type, etag, file, size)
+
+
+def delete_derivatives(image_path: str) -> None:
+    """元画像に紐づく派生画像をすべて削除する。"""
+    stem = Path(image_path).stem
+    freed = 0
+    for path in DERIVATIVE_DIR.glob(f"{stem}_w*"):
+        try:
+            freed += path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            continue
+    if freed:
+        _add_bytes(-freed)
+
+
+def reset_cache_size() -> None:
+    """キャッシュ合計サイズの記録を破棄する（次回アクセス時に再走査）。"""
+    global _cache_bytes
+    with _lock:
+        _cache_bytes = None
@@ -0,0 +1,155 @@
+"""知覚ハッシュ（dHash）による重複レシートの検出。
+
+登録済みレシートの dHash を BK-tree に保持し、ハミング距離が閾値以内の
+レシートを全件走査せずに探索する。インデックスは初回参照時に DB から構築し、
+以降は receipt_service の作成・削除に合わせて更新する（単一プロセス前提）。
+"""
+import threading
+
+from sqlalchemy.orm import Session
+
+from app.config import DUPLICATE_MAX_DISTANCE, DUPLICATE_MAX_RESULTS
+from app.models.receipt import Receipt
+from app.schemas.receipt import DuplicateCandidate
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """ハミング距離の BK-tree。同じハッシュを持つ複数レシートは1ノードにまとめる。"""
+
+    def __init__(self):
+        # ノード: [hash, receipt_id の集合, {距離: 子ノード}]
+        self._root: list | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, receipt_id: int) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, {receipt_id}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].add(receipt_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {receipt_id}, {}]
+                return
+            node = child
+
+    def remove(self, value: int, receipt_id: int) -> None:
+        """receipt_id を取り除く。ノード自体は木構造を保つため残す。"""
+        node = self._root
+        while node is not None:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                if receipt_id in node[1]:
+                    node[1].discard(receipt_id)
+                    self._size -= 1
+                return
+            node = node[2].get(distance)
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        """距離 max_distance 以内の (距離, receipt_id) を距離の昇順で返す。"""
+        if self._root is None:
+            return []
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, receipt_id) for receipt_id in node[1])
+            # 三角不等式により、子の距離が [d - max, d + max] の範囲だけを辿ればよい
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in node[2].items() if low <= d <= high)
+        results.sort()
+        return results
+
+
+class DuplicateIndex:
+    """レシートの dHash インデックス。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._loaded = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tree = BKTree()
+            self._loaded = False
+
+    def _ensure_loaded(self, db: Session) -> None:
+        if self._loaded:
+            return
+        tree = BKTree()
+        rows = db.query(Receipt.id, Receipt.image_phash).filter(Receipt.image_phash.isnot(None))
+        for receipt_id, phash in rows.yield_per(1000):
+            tree.add(int(phash, 16), receipt_id)
+        self._tree = tree
+        self._loaded = True
+
+    def add(self, receipt_id: int, phash: str) -> None:
+        with self._lock:
+            # 未構築なら次回の構築時に DB から読み込まれる
+            if self._loaded:
+                self._tree.add(int(phash, 16), receipt_id)
+
+    def remove(self, receipt_id: int, phash: str) -> None:
+        with self._lock:
+            if self._loaded:
+                self._tree.remove(int(phash, 16), receipt_id)
+
+    def search(self, db: Session, phash: str, max_distance: int) -> list[tuple[int, int]]:
+        with self._lock:
+            self._ensure_loaded(db)
+            return self._tree.search(int(phash, 16), max_distance)
+
+
+duplicate_index = DuplicateIndex()
+
+
+def find_duplicates(
+    db: Session,
+    phash: str | None,
+    max_distance: int = DUPLICATE_MAX_DISTANCE,
+    limit: int = DUPLICATE_MAX_RESULTS,
+    exclude_id: int | None = None,
+) -> list[DuplicateCandidate]:
+    """dHash が近い既存レシートを距離の昇順で返す。"""
+    if not phash:
+        return []
+
+    matches = [
+        (distance, receipt_id)
+        for distance, receipt_id in duplicate_index.search(db, phash, max_distance)
+        if receipt_id != exclude_id
+    ][:limit]
+    if not matches:
+        return []
+
+    receipts = {
+        r.id: r
+        for r in db.query(Receipt).filter(Receipt.id.in_([receipt_id for _, receipt_id in matches]))
+    }
+    return [
+        DuplicateCandidate(
+            receipt_id=receipt_id,
+            distance=distance,
+            store_name=receipts[receipt_id].store_name,
+            date=receipts[receipt_id].date,
+            total_amount=receipts[receipt_id].total_amount,
+            thumbnail_path=receipts[receipt_id].thumbnail_path,
+        )
+        for distance, receipt_id in matches
+        if receipt_id in receipts
+    ]
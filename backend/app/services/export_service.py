@@ -1,5 +1,6 @@
 import csv
 import io
+from collections.abc import Iterable, Iterator
 
 from app.models.receipt import Receipt
 
@@ -18,6 +19,24 @@ HEADERS = [
 ]
 
 
+def _to_row(receipt: Receipt) -> list:
+    items_str = " / ".join(
+        f"{item.name or '不明'}×{item.quantity or 1}"
+        for item in receipt.items
+    ) if receipt.items else ""
+
+    return [
+        receipt.id,
+        str(receipt.date) if receipt.date else "",
+        receipt.store_name or "",
+        receipt.total_amount if receipt.total_amount is not None else "",
+        receipt.tax if receipt.tax is not None else "",
+        receipt.payment_method or "",
+        receipt.category or "",
+        items_str,
+    ]
+
+
 def generate_csv(receipts: list[Receipt]) -> str:
     """レシート一覧からBOM付きUTF-8のCSV文字列を生成する。"""
     output = io.StringIO()
@@ -27,20 +46,25 @@ def generate_csv(receipts: list[Receipt]) -> str:
     writer.writerow(HEADERS)
 
     for receipt in receipts:
-        items_str = " / ".join(
-            f"{item.name or '不明'}×{item.quantity or 1}"
-            for item in receipt.items
-        ) if receipt.items else ""
-
-        writer.writerow([
-            receipt.id,
-            str(receipt.date) if receipt.date else "",
-            receipt.store_name or "",
-            receipt.total_amount if receipt.total_amount is not None else "",
-            receipt.tax if receipt.tax is not None else "",
-            receipt.payment_method or "",
-            receipt.category or "",
-            items_str,
-        ])
+        writer.writerow(_to_row(receipt))
 
     return output.getvalue()
+
+
+def iter_csv(batches: Iterable[list[Receipt]]) -> Iterator[bytes]:
+    """レシートのバッチを受け取り、UTF-8 エンコード済みのCSVをバッチ単位で返す。
+
+    出力を連結すると generate_csv と同じ内容（BOM・列構成）になる。
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    output.write(BOM)
+    writer.writerow(HEADERS)
+    yield output.getvalue().encode("utf-8")
+
+    for batch in batches:
+        output.seek(0)
+        output.truncate()
+        writer.writerows(_to_row(receipt) for receipt in batch)
+        yield output.getvalue().encode("utf-8")
@@ -1,13 +1,34 @@
 import asyncio
+import functools
+import hashlib
 import io
 import logging
+import math
+import os
+import time
 import uuid
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
 from fastapi import UploadFile
-from PIL import Image
+from PIL import Image, ImageOps
 
-from app.config import ALLOWED_MIME_TYPES, MAX_FILE_SIZE, THUMBNAIL_DIR, UPLOAD_DIR
+from app.config import (
+    ALLOWED_MIME_TYPES,
+    IMAGE_EXECUTOR,
+    IMAGE_WORKERS,
+    MAX_FILE_SIZE,
+    THUMBNAIL_DIR,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_DIR,
+    VISION_GRAYSCALE,
+    VISION_IMAGE_FORMAT,
+    VISION_IMAGE_NORMALIZE,
+    VISION_IMAGE_QUALITY,
+    VISION_MAX_LONG_EDGE,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +46,48 @@ FORMAT_TO_EXT = {
     "WEBP": ".webp",
 }
 
+FORMAT_TO_MIME = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class VisionImage:
+    """Vision API に送る画像。"""
+
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+    source_bytes: int  # 正規化前のファイルサイズ
+
+
+@dataclass(frozen=True)
+class SavedImage:
+    """保存済み画像の情報。"""
+
+    path: str  # /uploads/xxx.jpg 形式の相対パス
+    sha256: str  # 画像バイト列の SHA-256（16進）
+    phash: str | None = None  # 知覚ハッシュ（dHash 64bit の16進）
+    thumbnail: bytes | None = None  # 保存時のデコードから作ったサムネイル（JPEG、未書き出し）
+    vision_image: VisionImage | None = None  # 保存時のデコードから作った Vision API 送信用画像
+    cpu_ms: dict[str, float] | None = None  # 画像処理の段階ごとの CPU 時間（ミリ秒）
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    """1回のデコードから得た検証結果と派生データ。"""
+
+    image_format: str
+    phash: str
+    thumbnail: bytes | None
+    vision_image: VisionImage | None
+    cpu_ms: dict[str, float]
+
 
 def validate_image(file: UploadFile) -> None:
     """MIMEタイプを検証する（Content-Type ヘッダーの事前チェック）。"""
@@ -34,39 +97,262 @@ def validate_image(file: UploadFile) -> None:
         )
 
 
-def _validate_image_content(content: bytes) -> str:
-    """マジックバイトを検証し、検出された画像フォーマットを返す。"""
+def sniff_image_format(head: bytes) -> str | None:
+    """先頭バイト（マジックバイト）から画像フォーマットを判定する。対応外なら None。"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _open_image(source: bytes | Path) -> Image.Image:
+    return Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def compute_dhash(source: bytes | Path | Image.Image) -> str:
+    """画像の dHash（隣接ピクセルの明暗差による 64bit 知覚ハッシュ）を16進文字列で返す。
+
+    撮り直し・再圧縮・多少のリサイズでは値がほとんど変わらないため、
+    ハミング距離で同じレシートの別写真を検出できる。
+    デコード済みの画像を渡した場合は、EXIF回転の適用済みとみなしてそのまま縮小する。
+    """
+    if not isinstance(source, Image.Image):
+        with _open_image(source) as img:
+            img.draft("L", (64, 64))
+            return compute_dhash(ImageOps.exif_transpose(img))
+
+    gray = source.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:016x}"
+
+
+def _decode_scaled(img: Image.Image, max_long_edge: int, draft_mode: str) -> tuple[Image.Image, bool]:
+    """EXIF回転を適用してデコードし、(画像, 回転または縮小が必要だったか) を返す。
+
+    長辺が max_long_edge を超える JPEG は、それ以上を保つ 1/2^n スケールでデコードする。
+    """
+    rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+    long_edge = max(img.size)
+    if long_edge > max_long_edge:
+        scale = max_long_edge / long_edge
+        img.draft(draft_mode, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    return ImageOps.exif_transpose(img), rotated or long_edge > max_long_edge
+
+
+def _to_vision_image(
+    decoded: Image.Image,
+    transformed: bool,
+    source: bytes | Path,
+    source_format: str,
+    max_long_edge: int,
+    grayscale: bool,
+    image_format: str,
+    quality: int,
+) -> VisionImage:
+    """デコード済み画像を Vision API 用に縮小・再エンコードする。
+
+    回転・縮小・グレースケール化のいずれも不要で、再エンコードしても小さくならない場合は元のまま返す。
+    """
+    pil_format = "WEBP" if image_format == "webp" else "JPEG"
+    transformed = transformed or max(decoded.size) > max_long_edge or (grayscale and decoded.mode != "L")
+    normalized = decoded.convert("L" if grayscale else "RGB")
+    normalized.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    normalized.save(buffer, pil_format, quality=quality)
+    data = buffer.getvalue()
+    width, height = normalized.size
+
+    source_bytes = len(source) if isinstance(source, bytes) else source.stat().st_size
+    if not transformed and len(data) >= source_bytes:
+        original = source if isinstance(source, bytes) else source.read_bytes()
+        return VisionImage(original, FORMAT_TO_MIME[source_format], width, height, source_bytes)
+    return VisionImage(data, FORMAT_TO_MIME[pil_format], width, height, source_bytes)
+
+
+def normalize_for_vision(
+    content: bytes,
+    max_long_edge: int = VISION_MAX_LONG_EDGE,
+    grayscale: bool = VISION_GRAYSCALE,
+    image_format: str = VISION_IMAGE_FORMAT,
+    quality: int = VISION_IMAGE_QUALITY,
+) -> VisionImage:
+    """Vision API 用に画像を正規化する（EXIF回転の適用・長辺の縮小・グレースケール化・再エンコード）。"""
+    with Image.open(io.BytesIO(content)) as img:
+        source_format = img.format
+        decoded, transformed = _decode_scaled(img, max_long_edge, "L" if grayscale else "RGB")
+    return _to_vision_image(
+        decoded, transformed, content, source_format, max_long_edge, grayscale, image_format, quality
+    )
+
+
+def _lap(cpu_ms: dict[str, float], stage: str, start: float) -> float:
+    now = time.thread_time()
+    cpu_ms[stage] = round((now - start) * 1000, 2)
+    return now
+
+
+def process_image(
+    source: Path, derivatives: bool = True, vision: bool = True, thumbnail_size: tuple[int, int] = (200, 200)
+) -> ProcessedImage:
+    """画像を1回だけデコードし、検証済みフォーマット・dHash・サムネイル・Vision 送信用画像を作る。
+
+    derivatives=False の場合は検証と dHash のみ行う。vision=False の場合は Vision 送信用画像を作らない。
+    各段階の CPU 時間（このスレッドの thread_time）を cpu_ms に記録する。
+    """
+    cpu_ms: dict[str, float] = {}
+    start = time.thread_time()
     try:
-        img = Image.open(io.BytesIO(content))
-        img.verify()
-        if img.format not in ALLOWED_IMAGE_FORMATS:
-            raise ValueError("サポートされていない画像形式です")
-        return img.format
+        with Image.open(source) as img:
+            image_format = img.format
+            if image_format not in ALLOWED_IMAGE_FORMATS:
+                raise ValueError("サポートされていない画像形式です")
+            # サムネイルはカラーで作るため、グレースケール設定でも RGB でデコードする
+            decoded, transformed = _decode_scaled(img, VISION_MAX_LONG_EDGE, "RGB")
     except ValueError:
         raise
     except Exception:
         raise ValueError("有効な画像ファイルではありません")
+    start = _lap(cpu_ms, "decode", start)
 
+    # dHash は縮小済みのサムネイル画像から求める（大きな画像から 9x8 へ縮めるより安い）
+    thumb = decoded.copy()
+    thumb.thumbnail(thumbnail_size)
+    thumbnail = None
+    if derivatives:
+        buffer = io.BytesIO()
+        thumb.convert("RGB").save(buffer, "JPEG", quality=85)
+        thumbnail = buffer.getvalue()
+    start = _lap(cpu_ms, "thumbnail", start)
 
-async def save_image(file: UploadFile) -> str:
-    """画像をUUID名で uploads/ に保存し、相対パスを返す。"""
-    validate_image(file)
+    phash = compute_dhash(thumb)
+    start = _lap(cpu_ms, "phash", start)
+    if not derivatives:
+        return ProcessedImage(image_format, phash, None, None, cpu_ms)
 
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise ValueError(
-            f"ファイルサイズが上限を超えています: {len(content)} bytes（上限: {MAX_FILE_SIZE // 1024 // 1024}MB）"
+    vision_image = None
+    if vision and VISION_IMAGE_NORMALIZE:
+        vision_image = _to_vision_image(
+            decoded,
+            transformed,
+            source,
+            image_format,
+            VISION_MAX_LONG_EDGE,
+            VISION_GRAYSCALE,
+            VISION_IMAGE_FORMAT,
+            VISION_IMAGE_QUALITY,
         )
+        _lap(cpu_ms, "vision_encode", start)
+    return ProcessedImage(image_format, phash, thumbnail, vision_image, cpu_ms)
 
-    image_format = _validate_image_content(content)
 
-    ext = FORMAT_TO_EXT.get(image_format, ".jpg")
+@dataclass(frozen=True)
+class _StagedUpload:
+    """検証済みで uploads/ 内の一時ファイルに書き出されたアップロード画像。"""
+
+    temp_path: Path
+    sha256: str
+    processed: ProcessedImage
+
+
+def _size_limit_error() -> ValueError:
+    return ValueError(f"ファイルサイズが上限を超えています（上限: {MAX_FILE_SIZE // 1024 // 1024}MB）")
+
+
+async def _stream_to_temp(
+    file: UploadFile, derivatives: bool, needs_vision: Callable[[str], bool] | None = None
+) -> _StagedUpload:
+    """アップロードを UPLOAD_CHUNK_SIZE ずつ一時ファイルへ書き出しながらハッシュを計算し、process_image にかける。
+
+    メモリに載るのは1チャンク分だけで、上限を超えた時点で読み込みを打ち切る。
+    一時ファイルは UPLOAD_DIR 内に作るため、保存時は同一ファイルシステム上の rename で済む。
+    needs_vision(sha256) が False を返す場合（解析キャッシュにある等）は Vision 送信用画像を作らない。
+    """
+    validate_image(file)
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise _size_limit_error()
+
+    temp_path = UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    sniffed = None
+    try:
+        with open(temp_path, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if sniffed is None:
+                    sniffed = sniff_image_format(chunk)
+                    if sniffed is None:
+                        raise ValueError("有効な画像ファイルではありません")
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise _size_limit_error()
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        if sniffed is None:
+            raise ValueError("有効な画像ファイルではありません")
+
+        sha256 = digest.hexdigest()
+        vision = derivatives and (needs_vision is None or await asyncio.to_thread(needs_vision, sha256))
+        processed = await run_image_task(process_image, temp_path, derivatives, vision)
+        if processed.image_format != sniffed:
+            raise ValueError("有効な画像ファイルではありません")
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return _StagedUpload(temp_path, sha256, processed)
+
+
+async def compute_upload_phash(file: UploadFile) -> str:
+    """アップロード画像を保存せずに検証し、dHash を返す（重複チェック用）。"""
+    staged = await _stream_to_temp(file, derivatives=False)
+    staged.temp_path.unlink(missing_ok=True)
+    return staged.processed.phash
+
+
+async def save_image(
+    file: UploadFile, derivatives: bool = True, needs_vision: Callable[[str], bool] | None = None
+) -> SavedImage:
+    """画像をUUID名で uploads/ に保存し、相対パス・内容のハッシュと1回のデコードで作った派生データを返す。
+
+    ワーカーが後で処理するジョブ登録では derivatives=False にし、検証と dHash だけ行う
+    （サムネイル・Vision 送信用画像はワーカーが作るため、リクエスト中に作っても捨てるだけになる）。
+    needs_vision は _stream_to_temp を参照。
+    """
+    staged = await _stream_to_temp(file, derivatives, needs_vision)
+    processed = staged.processed
+
+    ext = FORMAT_TO_EXT.get(processed.image_format, ".jpg")
     filename = f"{uuid.uuid4()}{ext}"
-    filepath = UPLOAD_DIR / filename
+    os.replace(staged.temp_path, UPLOAD_DIR / filename)  # 書き込み途中のファイルが見えないよう一括で置き換える
 
-    await asyncio.to_thread(filepath.write_bytes, content)
+    return SavedImage(
+        path=f"/uploads/{filename}",
+        sha256=staged.sha256,
+        phash=processed.phash,
+        thumbnail=processed.thumbnail,
+        vision_image=processed.vision_image,
+        cpu_ms=processed.cpu_ms,
+    )
 
-    return f"/uploads/{filename}"
+
+def store_thumbnail(data: bytes) -> str | None:
+    """生成済みのサムネイル（JPEG）を uploads/thumbs/ に書き出し、パスを返す。"""
+    try:
+        thumb_name = f"{uuid.uuid4()}.jpg"
+        (THUMBNAIL_DIR / thumb_name).write_bytes(data)
+        return f"/uploads/thumbs/{thumb_name}"
+    except Exception:
+        logger.warning("サムネイルの保存に失敗しました", exc_info=True)
+        return None
 
 
 def generate_thumbnail(image_path: str, size: tuple[int, int] = (200, 200)) -> str | None:
@@ -80,6 +366,8 @@ def generate_thumbnail(image_path: str, size: tuple[int, int] = (200, 200)) -> s
             return None
 
         with Image.open(source) as img:
+            # JPEG はデコード時点で縮小する（size 以上を保つ最小の 1/2^n スケール）
+            img.draft("RGB", size)
             img.thumbnail(size)
             thumb_name = f"{uuid.uuid4()}.jpg"
             thumb_path = THUMBNAIL_DIR / thumb_name
@@ -89,3 +377,42 @@ def generate_thumbnail(image_path: str, size: tuple[int, int] = (200, 200)) -> s
     except Exception:
         logger.warning("サムネイル生成に失敗しました: %s", image_path, exc_info=True)
         return None
+
+
+_image_executor: Executor | None = None
+
+
+def _get_image_executor() -> Executor:
+    """画像処理用のプールを返す（初回呼び出し時に作成）。"""
+    global _image_executor
+    if _image_executor is None:
+        if IMAGE_EXECUTOR == "process":
+            _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        else:
+            _image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+    return _image_executor
+
+
+async def run_image_task(func: Callable, *args, **kwargs):
+    """CPU を使う画像処理をプールで実行し、イベントループを塞がないようにする。
+
+    process プールの場合、func と引数は pickle 可能である必要がある。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_image_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_image_executor() -> None:
+    """画像処理用のプールを停止する。"""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=True)
+        _image_executor = None
+
+
+def delete_image(image_path: str) -> None:
+    """uploads/ 配下の画像を削除する（存在しなければ何もしない）。"""
+    try:
+        (UPLOAD_DIR / Path(image_path).name).unlink(missing_ok=True)
+    except Exception:
+        logger.warning("画像の削除に失敗しました: %s", image_path, exc_info=True)
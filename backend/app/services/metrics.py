@@ -0,0 +1,327 @@
+"""プロセス内のメトリクス（カウンター・ゲージ・ヒストグラム）と Prometheus テキスト形式への出力。
+
+外部のコレクターやクライアントライブラリは使わず、GET /metrics（app/main.py）で registry.render() を返す。
+ラベルはキーワード引数で渡す。既存のサービスが持つ統計（キャッシュのヒット数・vision_limiter の状態）は
+CallbackMetric で出力時に読み出す。
+"""
+import bisect
+import threading
+from abc import ABC, abstractmethod
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from app.services import vision_cache_service
+from app.services.summary_cache import summary_cache
+from app.services.vision_limiter import vision_limiter
+
+# 秒単位のヒストグラムの既定バケット（Vision API の応答待ちまで収まるよう 60 秒まで）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = tuple[str, ...]
+
+INF_BUCKET = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def reset(self) -> None: ...
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]: ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """ブロックを実行している間だけ 1 増やす。"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelValues, list] = {}  # ラベル -> [バケットごとの件数, 合計, 件数]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """ブロックの所要時間（秒）を記録する。例外で抜けた場合も記録する。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, INF_BUCKET)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class CallbackMetric(Metric):
+    """出力時に collect() を呼んで値を読み出すメトリクス。collect は {ラベル値のタプル: 値} を返す。"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        collect: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def reset(self) -> None:
+        pass
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"メトリクス {metric.name} は登録済みです")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def reset(self) -> None:
+        """計測値をすべて 0 に戻す（テスト用）。"""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+scan_stage_seconds = registry.histogram(
+    "receipt_scan_stage_seconds",
+    "スキャンの各段階の所要時間（pipeline: scan=単発 / batch=一括 / job=ジョブキュー / bulk=Batches API）",
+    ("pipeline", "stage"),
+)
+scans_in_flight = registry.gauge("receipt_scans_in_flight", "処理中のスキャン数", ("pipeline",))
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "API リクエストの所要時間（レスポンス送信完了まで）", ("method", "route", "status")
+)
+vision_api_seconds = registry.histogram(
+    "vision_api_request_duration_seconds", "Vision API の応答時間（最後の試行のみ。待ち・再試行は含まない）"
+)
+vision_wait_seconds = registry.histogram(
+    "vision_api_wait_duration_seconds", "Vision API 呼び出しの同時実行枠・レート制限の待ちと再試行にかかった時間"
+)
+vision_errors_total = registry.counter(
+    "vision_api_errors_total",
+    "Vision 解析の失敗数（kind: unavailable=制限・サーキット / api=API エラー / parse=応答の解析失敗）",
+    ("kind",),
+)
+
+
+def _cache_lookups() -> dict[LabelValues, float]:
+    vision_hits, vision_misses = vision_cache_service.lookup_counts()
+    summary = summary_cache.stats()
+    return {
+        ("vision", "hit"): vision_hits,
+        ("vision", "miss"): vision_misses,
+        ("summary", "hit"): summary.hits,
+        ("summary", "miss"): summary.misses,
+    }
+
+
+def _limiter_stat(key: str) -> Callable[[], dict[LabelValues, float]]:
+    return lambda: {(): vision_limiter.stats()[key]}
+
+
+registry.register(CallbackMetric(
+    "cache_lookups_total", "キャッシュの参照数（cache: vision=解析キャッシュ / summary=月次集計）", "counter",
+    _cache_lookups, ("cache", "result"),
+))
+registry.register(CallbackMetric(
+    "vision_limiter_in_flight", "実行中の Vision API 呼び出し数", "gauge", _limiter_stat("in_flight"),
+))
+registry.register(CallbackMetric(
+    "vision_limiter_queue_depth", "同時実行枠を待っている Vision API 呼び出し数", "gauge", _limiter_stat("queue_depth"),
+))
+registry.register(CallbackMetric(
+    "vision_limiter_retries_total", "Vision API 呼び出しの再試行数", "counter", _limiter_stat("retries"),
+))
+registry.register(CallbackMetric(
+    "vision_circuit_open",
+    "Vision API のサーキットが開いていれば 1",
+    "gauge",
+    lambda: {(): float(vision_limiter.stats()["circuit_state"] != "closed")},
+))
+
+
+@contextmanager
+def stage(pipeline: str, name: str) -> Iterator[None]:
+    """スキャンの1段階の所要時間を receipt_scan_stage_seconds に記録する。"""
+    with scan_stage_seconds.time(pipeline=pipeline, stage=name):
+        yield
+
+
+class MetricsMiddleware:
+    """API リクエストの所要時間をルートのパステンプレート単位で記録する ASGI ミドルウェア。
+
+    ルートに一致しなかったリクエスト（静的ファイル・404）は記録しない。
+    StreamingResponse（CSV エクスポートなど）は本文を送り終えるまでを計測する。
+    """
+
+    def __init__(self, app, histogram: Histogram = http_request_seconds, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.histogram = histogram
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path is not None and path not in self.exclude:
+                self.histogram.observe(
+                    time.perf_counter() - start, method=scope["method"], route=path, status=str(status)
+                )
@@ -0,0 +1,174 @@
+"""リクエスト単位のサンプリングプロファイラ（本番での遅いリクエストの調査用）。
+
+PROFILING_ENABLED のときだけ app/main.py が ProfilingMiddleware を組み込む（無効時はミドルウェア自体がない）。
+X-Profile: 1 ヘッダーか ?profile=1 を付けたリクエストの間、別スレッドから PROFILE_INTERVAL_MS ごとに
+全スレッドのスタックを採取し、折りたたみスタック形式（flamegraph.pl / speedscope で読める）で
+PROFILE_DIR/<プロファイルID>.collapsed に保存する。プロファイルIDはレスポンスの X-Profile-Id で返し、
+GET /api/admin/profiles/{id} でダウンロードできる。新しい PROFILE_KEEP 件だけを残す。
+
+イベントループやスレッドプールは他のリクエストと共有しているため、同時に処理中の別リクエストのスタックも混ざる。
+待機中のスレッド（ロック・キュー・select 待ち）は除く。同時に採取するプロファイルは1件までで、
+採取中に届いた指定は無視する（プロファイルなしで処理する）。
+"""
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from app.config import BASE_DIR, PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_KEEP
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_SUFFIX = ".collapsed"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# 葉のフレームがこれらのファイルにあるスタックは待機中とみなして捨てる
+IDLE_FILES = {"threading.py", "selectors.py", "queue.py"}
+
+
+def _frame_name(code) -> str:
+    path = Path(code.co_filename)
+    try:
+        filename = path.relative_to(BASE_DIR).as_posix()
+    except ValueError:
+        filename = path.name
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """start() から stop() までの間、全スレッドのスタックを一定間隔で採取する。"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or Path(frame.f_code.co_filename).name in IDLE_FILES:
+                    continue
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = (thread.name if thread else str(ident)).replace(";", ":")
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names[ident])
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """プロファイルを <id>.collapsed と <id>.json（リクエストの情報）として保存し、新しい keep 件を残す。"""
+
+    def __init__(self, directory: Path, keep: int):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, profile_id: str, stacks: Counter[str], info: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        (self.directory / f"{profile_id}{PROFILE_SUFFIX}").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        (self.directory / f"{profile_id}.json").write_text(
+            json.dumps({"id": profile_id, **info}, ensure_ascii=False), encoding="utf-8"
+        )
+        self._prune()
+
+    def _prune(self) -> None:
+        for path in self._info_paths()[self.keep:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(PROFILE_SUFFIX).unlink(missing_ok=True)
+
+    def _info_paths(self) -> list[Path]:
+        """新しい順の <id>.json。"""
+        if not self.directory.exists():
+            return []
+        paths = [p for p in self.directory.glob("*.json") if PROFILE_ID_PATTERN.match(p.stem)]
+        return sorted(paths, key=lambda p: p.stat().st_mtime_ns, reverse=True)
+
+    def list(self) -> list[dict]:
+        return [json.loads(path.read_text(encoding="utf-8")) for path in self._info_paths()]
+
+    def path(self, profile_id: str) -> Path | None:
+        """保存済みプロファイルのパス。ID が不正・存在しなければ None。"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}{PROFILE_SUFFIX}"
+        return path if path.exists() else None
+
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+
+def _requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value.strip().lower() in (b"1", b"true")
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[-1].lower() in ("1", "true")
+
+
+class ProfilingMiddleware:
+    """プロファイルの指定があるリクエストだけを SamplingProfiler の下で処理する ASGI ミドルウェア。"""
+
+    def __init__(self, app, store: ProfileStore | None = None, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.app = app
+        self.store = store or profile_store
+        self.interval = interval_ms / 1000
+        self._active = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope) or not self._active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (PROFILE_ID_HEADER, profile_id.encode())]}
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval)
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = profiler.stop()
+            duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            self._active.release()
+            self.store.save(profile_id, stacks, {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "started_at": started_at.isoformat(),
+                "duration_ms": duration_ms,
+                "samples": profiler.samples,
+            })
@@ -1,12 +1,24 @@
-from datetime import date
+import base64
+import binascii
+import json
+from collections.abc import Iterator
+from datetime import date, datetime
 from pathlib import Path
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
 
+from app.config import EXPORT_BATCH_SIZE
 from app.models.receipt import Receipt, ReceiptItem
 from app.schemas.receipt import ReceiptUpdate, VisionResponse
+from app.services import rollup_service  # noqa: F401  flush 時のロールアップ更新を登録する
+from app.services.derivative_service import delete_derivatives
+from app.services.duplicate_service import duplicate_index
+from app.services.search_service import search_subquery
 
 ALLOWED_SORT_FIELDS = {"created_at", "date", "total_amount", "store_name"}
+# search 指定時のみ使える関連度順（BM25）。キーセットページネーションには対応しない
+RELEVANCE_SORT = "relevance"
 
 
 def create_receipt(
@@ -15,6 +27,8 @@ def create_receipt(
     vision: VisionResponse,
     raw_response: str,
     thumbnail_path: str | None = None,
+    image_phash: str | None = None,
+    scan_metadata: dict | None = None,
 ) -> Receipt:
     """解析結果からレシートをDBに保存する。"""
     receipt = Receipt(
@@ -27,6 +41,8 @@ def create_receipt(
         image_path=image_path,
         thumbnail_path=thumbnail_path,
         raw_response=raw_response,
+        image_phash=image_phash,
+        scan_metadata=scan_metadata or None,
     )
     for item_data in vision.items:
         receipt.items.append(
@@ -40,26 +56,21 @@ def create_receipt(
     db.add(receipt)
     db.commit()
     db.refresh(receipt)
+    if image_phash:
+        duplicate_index.add(receipt.id, image_phash)
     return receipt
 
 
-def get_receipts(
-    db: Session,
-    skip: int = 0,
-    limit: int = 20,
-    sort_by: str = "created_at",
-    sort_order: str = "desc",
+def _apply_filters(
+    query,
     date_from: date | None = None,
     date_to: date | None = None,
     category: str | None = None,
     amount_min: float | None = None,
     amount_max: float | None = None,
     search: str | None = None,
-) -> tuple[list[Receipt], int]:
-    """レシート一覧を取得する。(items, total) を返す。"""
-    query = db.query(Receipt)
-
-    # フィルタ
+):
+    """一覧・エクスポート共通の絞り込み条件を付与する（Query / Select の両方に対応）。"""
     if date_from:
         query = query.filter(Receipt.date >= date_from)
     if date_to:
@@ -70,27 +81,181 @@ def get_receipts(
         query = query.filter(Receipt.total_amount >= amount_min)
     if amount_max is not None:
         query = query.filter(Receipt.total_amount <= amount_max)
-    if search:
-        query = query.filter(Receipt.store_name.ilike(f"%{search}%"))
+    if search and search.strip():
+        query = query.filter(Receipt.id.in_(select(search_subquery(search).c.rowid)))
+    return query
 
-    total = query.count()
 
-    # ソート（許可されたフィールドのみ）
+def _apply_sort(query, sort_by: str, sort_order: str):
+    """許可されたフィールドでソートする。同値の並びは id で安定させる。"""
     if sort_by not in ALLOWED_SORT_FIELDS:
         sort_by = "created_at"
     sort_column = getattr(Receipt, sort_by)
     if sort_order == "asc":
-        query = query.order_by(sort_column.asc())
+        return query.order_by(sort_column.asc(), Receipt.id.asc())
+    return query.order_by(sort_column.desc(), Receipt.id.desc())
+
+
+def _cursor_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _parse_cursor_value(sort_by: str, value):
+    if value is None:
+        return None
+    if sort_by == "created_at":
+        return datetime.fromisoformat(value)
+    if sort_by == "date":
+        return date.fromisoformat(value)
+    if sort_by == "total_amount":
+        return float(value)
+    return str(value)
+
+
+def encode_cursor(receipt: Receipt, sort_by: str, sort_order: str) -> str:
+    """receipt の次から読み始めるための不透明なカーソル文字列を返す。"""
+    payload = {
+        "s": sort_by,
+        "o": sort_order,
+        "v": _cursor_value(getattr(receipt, sort_by)),
+        "id": receipt.id,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    """カーソルを (ソート値, id) に戻す。ソート条件が一致しない・壊れている場合は ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["s"] != sort_by or payload["o"] != sort_order:
+            raise ValueError("ソート条件がカーソルと一致しません")
+        return _parse_cursor_value(sort_by, payload["v"]), int(payload["id"])
+    except (binascii.Error, json.JSONDecodeError, KeyError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError("無効なカーソルです") from e
+
+
+def _apply_cursor(query, sort_by: str, sort_order: str, value, last_id: int):
+    """(ソート値, id) より後ろの行だけに絞り込む（キーセットページネーション）。
+
+    SQLite の NULL の並び（昇順で先頭・降順で末尾）に合わせて条件を組み立てる。
+    """
+    column = getattr(Receipt, sort_by)
+    if sort_order == "asc":
+        if value is None:
+            return query.filter(or_(and_(column.is_(None), Receipt.id > last_id), column.isnot(None)))
+        return query.filter(or_(column > value, and_(column == value, Receipt.id > last_id)))
+
+    if value is None:
+        return query.filter(column.is_(None), Receipt.id < last_id)
+    return query.filter(
+        or_(column < value, and_(column == value, Receipt.id < last_id), column.is_(None))
+    )
+
+
+def get_receipts(
+    db: Session,
+    skip: int = 0,
+    limit: int = 20,
+    sort_by: str = "created_at",
+    sort_order: str = "desc",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    category: str | None = None,
+    amount_min: float | None = None,
+    amount_max: float | None = None,
+    search: str | None = None,
+    cursor: str | None = None,
+) -> tuple[list[Receipt], int]:
+    """レシート一覧を取得する。(items, total) を返す。
+
+    cursor を指定するとキーセット方式で続きを返す（skip は無視する）。
+    search 指定時は sort_by="relevance" で関連度順に並べられる。
+    不正なカーソルには ValueError を送出する。
+    """
+    by_relevance = sort_by == RELEVANCE_SORT and bool(search and search.strip())
+    if sort_by not in ALLOWED_SORT_FIELDS:
+        sort_by = "created_at"
+    if by_relevance and cursor:
+        raise ValueError("関連度順ではカーソルを使用できません")
+    position = decode_cursor(cursor, sort_by, sort_order) if cursor else None
+
+    query = _apply_filters(
+        db.query(Receipt),
+        date_from=date_from,
+        date_to=date_to,
+        category=category,
+        amount_min=amount_min,
+        amount_max=amount_max,
+        search=search,
+    )
+
+    total = query.count()
+
+    # ソート（許可されたフィールドのみ）
+    if by_relevance:
+        ranked = search_subquery(search)
+        query = query.join(ranked, ranked.c.rowid == Receipt.id).order_by(
+            ranked.c.rank.asc(), Receipt.created_at.desc(), Receipt.id.desc()
+        )
     else:
-        query = query.order_by(sort_column.desc())
+        query = _apply_sort(query, sort_by, sort_order)
+    if position is not None:
+        query = _apply_cursor(query, sort_by, sort_order, *position)
+    else:
+        query = query.offset(skip)
 
-    items = query.offset(skip).limit(limit).all()
+    # 品目はページ分をまとめて IN 句で読み込む（1件ずつの遅延ロードを避ける）
+    items = query.options(selectinload(Receipt.items)).limit(limit).all()
     return items, total
 
 
+def iter_receipt_batches(
+    db: Session,
+    sort_by: str = "created_at",
+    sort_order: str = "desc",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    category: str | None = None,
+    amount_min: float | None = None,
+    amount_max: float | None = None,
+    search: str | None = None,
+    batch_size: int | None = None,
+) -> Iterator[list[Receipt]]:
+    """条件に合致するレシートを batch_size 件ずつ返す（件数上限なし）。
+
+    カーソルから少しずつ読み出し、品目はバッチごとに IN 句でまとめて読み込むため、
+    メモリ使用量は総件数によらずバッチサイズ分で一定になる。
+    """
+    stmt = _apply_filters(
+        select(Receipt),
+        date_from=date_from,
+        date_to=date_to,
+        category=category,
+        amount_min=amount_min,
+        amount_max=amount_max,
+        search=search,
+    )
+    stmt = (
+        _apply_sort(stmt, sort_by, sort_order)
+        .options(selectinload(Receipt.items))
+        .execution_options(yield_per=batch_size or EXPORT_BATCH_SIZE)
+    )
+    for batch in db.execute(stmt).scalars().partitions():
+        yield batch
+
+
 def get_receipt(db: Session, receipt_id: int) -> Receipt | None:
     """IDでレシートを取得する。見つからなければ None。"""
-    return db.query(Receipt).filter(Receipt.id == receipt_id).first()
+    return (
+        db.query(Receipt)
+        .options(joinedload(Receipt.items))
+        .filter(Receipt.id == receipt_id)
+        .first()
+    )
 
 
 def update_receipt(db: Session, receipt: Receipt, data: ReceiptUpdate) -> Receipt:
@@ -122,17 +287,21 @@ def delete_receipt(db: Session, receipt: Receipt, upload_dir: Path) -> None:
     """レシートをDBから削除し、画像ファイルも削除する。"""
     image_name = Path(receipt.image_path).name
     thumbnail_name = Path(receipt.thumbnail_path).name if receipt.thumbnail_path else None
+    receipt_id, image_phash = receipt.id, receipt.image_phash
 
     # DB削除を先に行い、成功後にファイル削除
     db.delete(receipt)
     db.commit()
+    if image_phash:
+        duplicate_index.remove(receipt_id, image_phash)
 
     # 画像ファイル削除
     image_file = upload_dir / image_name
     if image_file.exists():
         image_file.unlink()
 
-    # サムネイル削除
+    # 派生画像・サムネイル削除
+    delete_derivatives(image_name)
     if thumbnail_name:
         thumb_file = upload_dir / "thumbs" / thumbnail_name
         if thumb_file.exists():
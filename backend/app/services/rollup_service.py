@@ -0,0 +1,154 @@
+"""月次カテゴリ別集計（monthly_category_totals）の増分更新。
+
+Session の flush 直前に Receipt の追加・更新・削除を検出し、差分を同じ
+トランザクションでロールアップテーブルに反映する。create_receipt /
+update_receipt / delete_receipt を含む ORM 経由の変更はすべて対象になる。
+Core の一括 INSERT や Query.delete() などは対象外なので、その後は
+rebuild_rollup() で作り直す。
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from sqlalchemy import delete, event, extract, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.monthly_category_total import MonthlyCategoryTotal
+from app.models.receipt import Receipt
+from app.services.summary_cache import CHANGED_MONTHS_KEY, summary_cache
+
+UNCATEGORIZED = "未分類"
+
+_TRACKED_ATTRS = ("date", "category", "total_amount")
+
+
+@dataclass(frozen=True)
+class RollupMismatch:
+    year: int
+    month: int
+    category: str
+    expected: tuple[float, int]  # receipts からの集計 (合計金額, 件数)
+    actual: tuple[float, int]  # ロールアップテーブルの値
+
+
+def _collect_deltas(session: Session) -> dict[tuple[int, int, str], list]:
+    deltas: dict[tuple[int, int, str], list] = defaultdict(lambda: [0.0, 0])
+
+    def add(date, category, amount, sign: int) -> None:
+        if date is None:
+            return
+        delta = deltas[(date.year, date.month, category or UNCATEGORIZED)]
+        delta[0] += sign * (amount or 0)
+        delta[1] += sign
+
+    for obj in session.new:
+        if isinstance(obj, Receipt):
+            add(obj.date, obj.category, obj.total_amount, +1)
+
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, Receipt)
+        and obj not in session.deleted
+        and any(inspect(obj).attrs[attr].history.has_changes() for attr in _TRACKED_ATTRS)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Receipt)]
+    if not changed and not deleted:
+        return deltas
+
+    # 変更前の値は未ロードの場合があるため、flush 前の DB から読む
+    ids = [obj.id for obj in changed + deleted]
+    previous = {
+        row.id: row
+        for row in session.execute(
+            select(Receipt.id, Receipt.date, Receipt.category, Receipt.total_amount).where(Receipt.id.in_(ids))
+        )
+    }
+    for obj in deleted:
+        if obj.id in previous:
+            row = previous[obj.id]
+            add(row.date, row.category, row.total_amount, -1)
+    for obj in changed:
+        if obj.id in previous:
+            row = previous[obj.id]
+            add(row.date, row.category, row.total_amount, -1)
+        add(obj.date, obj.category, obj.total_amount, +1)
+    return deltas
+
+
+def apply_deltas(session: Session, deltas: dict[tuple[int, int, str], list]) -> None:
+    """(年, 月, カテゴリ) ごとの (金額差分, 件数差分) をロールアップに加算する。"""
+    changed = {key: delta for key, delta in deltas.items() if delta[1] != 0 or delta[0] != 0}
+    if not changed:
+        return
+    for (year, month, category), (amount, count) in changed.items():
+        stmt = sqlite_insert(MonthlyCategoryTotal).values(
+            year=year, month=month, category=category, total_amount=amount, count=count
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["year", "month", "category"],
+            set_={
+                "total_amount": MonthlyCategoryTotal.total_amount + stmt.excluded.total_amount,
+                "count": MonthlyCategoryTotal.count + stmt.excluded.count,
+            },
+        )
+        session.execute(stmt)
+    session.execute(delete(MonthlyCategoryTotal).where(MonthlyCategoryTotal.count <= 0))
+
+
+@event.listens_for(Session, "before_flush")
+def _update_rollup_before_flush(session: Session, flush_context, instances) -> None:
+    deltas = _collect_deltas(session)
+    apply_deltas(session, deltas)
+    if deltas:
+        # コミット後に summary_cache が該当年月を無効化する
+        session.info.setdefault(CHANGED_MONTHS_KEY, set()).update((year, month) for year, month, _ in deltas)
+
+
+def _raw_aggregate():
+    """receipts から直接集計する SELECT（再構築・整合性チェック用）。"""
+    year = extract("year", Receipt.date)
+    month = extract("month", Receipt.date)
+    category = func.coalesce(Receipt.category, UNCATEGORIZED)
+    return (
+        select(
+            year.label("year"),
+            month.label("month"),
+            category.label("category"),
+            func.coalesce(func.sum(Receipt.total_amount), 0).label("total_amount"),
+            func.count(Receipt.id).label("count"),
+        )
+        .where(Receipt.date.isnot(None))
+        .group_by(year, month, category)
+    )
+
+
+def rebuild_rollup(db) -> int:
+    """ロールアップを receipts から作り直す。作成した行数を返す（Session / Connection のどちらでも可）。"""
+    summary_cache.clear()
+    db.execute(delete(MonthlyCategoryTotal))
+    result = db.execute(
+        MonthlyCategoryTotal.__table__.insert().from_select(
+            ["year", "month", "category", "total_amount", "count"],
+            _raw_aggregate(),
+        )
+    )
+    return result.rowcount
+
+
+def check_consistency(db: Session, tolerance: float = 0.005) -> list[RollupMismatch]:
+    """ロールアップと receipts からの集計を比較し、食い違う行を返す。"""
+    expected = {
+        (int(row.year), int(row.month), row.category): (float(row.total_amount), row.count)
+        for row in db.execute(_raw_aggregate())
+    }
+    actual = {
+        (row.year, row.month, row.category): (row.total_amount, row.count)
+        for row in db.query(MonthlyCategoryTotal)
+    }
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        exp = expected.get(key, (0.0, 0))
+        act = actual.get(key, (0.0, 0))
+        if exp[1] != act[1] or abs(exp[0] - act[0]) > tolerance:
+            mismatches.append(RollupMismatch(*key, expected=exp, actual=act))
+    return mismatches
@@ -0,0 +1,299 @@
+"""スキャンジョブ（非同期解析）のキューとワーカープール。
+
+アップロード時はジョブを scan_jobs テーブルに登録してすぐに返し、
+アプリ内のワーカーが Vision 解析 → カテゴリ補完 → サムネイル生成 → DB保存 を実行する。
+キューは SQLite 上にあるため、再起動時も未処理ジョブは引き継がれる。
+
+ワーカーはアプリと同じ1プロセスで動かす前提（uvicorn --workers 1）。起動時に processing のジョブを
+すべて中断扱いで戻すため、複数プロセスで起動すると他プロセスが処理中のジョブを二重に処理する。
+"""
+import asyncio
+import logging
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import SCAN_JOB_POLL_INTERVAL, SCAN_JOB_WORKERS, UPLOAD_DIR
+from app.database import SessionLocal
+from app.models.receipt import Receipt
+from app.models.scan_job import ScanJob
+from app.schemas.receipt import VisionResponse
+from app.services.category_service import classify_by_items
+from app.services.image_service import SavedImage, delete_image, generate_thumbnail, run_image_task
+from app.services.metrics import scans_in_flight, stage
+from app.services.receipt_service import create_receipt
+from app.services.vision_limiter import PRIORITY_BACKGROUND, VisionUnavailableError, vision_limiter
+from app.services.vision_service import analyze_receipt
+
+logger = logging.getLogger(__name__)
+
+# submitted は一括取り込み（Message Batches API）で投入済みのジョブ。ワーカーは処理しない
+JOB_STATUSES = ("queued", "processing", "submitted", "succeeded", "failed")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_job(
+    db: Session,
+    saved: SavedImage,
+    filename: str | None = None,
+    batch_id: str | None = None,
+    status: str = "queued",
+) -> ScanJob:
+    """保存済み画像の解析ジョブを登録する。"""
+    job = ScanJob(
+        id=str(uuid.uuid4()),
+        batch_id=batch_id,
+        status=status,
+        filename=filename,
+        image_path=saved.path,
+        image_sha256=saved.sha256,
+        image_phash=saved.phash,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def record_failed_job(db: Session, filename: str | None, error: str, batch_id: str | None = None) -> ScanJob:
+    """画像保存に失敗したファイルを失敗済みジョブとして記録する（バッチ状況に含めるため）。"""
+    now = _now()
+    job = ScanJob(
+        id=str(uuid.uuid4()),
+        batch_id=batch_id,
+        filename=filename,
+        status="failed",
+        error=error,
+        queued_at=now,
+        finished_at=now,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: str) -> ScanJob | None:
+    """IDでジョブを取得する。見つからなければ None。"""
+    return db.query(ScanJob).filter(ScanJob.id == job_id).first()
+
+
+def get_batch_jobs(db: Session, batch_id: str) -> list[ScanJob]:
+    """バッチに属するジョブを登録順に返す。"""
+    return (
+        db.query(ScanJob)
+        .filter(ScanJob.batch_id == batch_id)
+        .order_by(ScanJob.queued_at.asc(), ScanJob.id.asc())
+        .all()
+    )
+
+
+def claim_next_job(db: Session) -> ScanJob | None:
+    """最も古い queued ジョブを processing に遷移させて返す。
+
+    UPDATE の WHERE 条件に status を含めることで、複数ワーカーが同じジョブを取らないようにする。
+    """
+    while True:
+        job_id = (
+            db.query(ScanJob.id)
+            .filter(ScanJob.status == "queued")
+            .order_by(ScanJob.queued_at.asc())
+            .limit(1)
+            .scalar()
+        )
+        if job_id is None:
+            return None
+        result = db.execute(
+            update(ScanJob)
+            .where(ScanJob.id == job_id, ScanJob.status == "queued")
+            .values(status="processing", started_at=_now())
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return get_job(db, job_id)
+
+
+def requeue_interrupted_jobs(db: Session) -> int:
+    """前回の停止時に processing のまま残ったジョブを queued に戻す。戻した件数を返す。
+
+    処理中のプロセスがほかにないこと（単一プロセスでの起動時）を前提にする。
+    """
+    result = db.execute(
+        update(ScanJob)
+        .where(ScanJob.status == "processing")
+        .values(status="queued", started_at=None, analyzed_at=None, thumbnailed_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+
+async def complete_job(
+    db: Session,
+    job: ScanJob,
+    vision: VisionResponse,
+    raw_response: str,
+    scan_metadata: dict | None = None,
+    pipeline: str = "job",
+) -> None:
+    """解析済みのジョブについてカテゴリ補完 → サムネイル生成 → DB保存 を行い、成功として記録する。
+
+    pipeline は各段階の所要時間を記録するメトリクスのラベル（一括取り込みは bulk）。
+    """
+    # カテゴリ補完
+    if not vision.category and vision.items:
+        items_dicts = [item.model_dump() for item in vision.items]
+        with stage(pipeline, "classify"):
+            inferred = classify_by_items(items_dicts)
+        if inferred:
+            vision.category = inferred
+
+    # サムネイル生成
+    with stage(pipeline, "generate_thumbnail"):
+        thumbnail_path = await run_image_task(generate_thumbnail, job.image_path)
+    job.thumbnailed_at = _now()
+
+    # DB保存
+    with stage(pipeline, "create_receipt"):
+        receipt = create_receipt(
+            db,
+            job.image_path,
+            vision,
+            raw_response,
+            thumbnail_path=thumbnail_path,
+            image_phash=job.image_phash,
+            scan_metadata=scan_metadata,
+        )
+    job.receipt_id = receipt.id
+    job.status = "succeeded"
+    job.finished_at = _now()
+    db.commit()
+
+
+def fail_job(db: Session, job: ScanJob, error: str) -> None:
+    """ジョブを失敗として記録し、レシートが作られていなければ保存済み画像を削除する。
+
+    DB保存の後で失敗した場合（ジョブの更新に失敗したなど）は、作成済みのレシートが画像を参照しているため残す。
+    """
+    logger.warning("Scan job %s failed: %s", job.id, error)
+    db.rollback()
+    if job.receipt_id is None and not db.query(Receipt.id).filter(Receipt.image_path == job.image_path).first():
+        delete_image(job.image_path)
+    job.status = "failed"
+    job.error = error
+    job.finished_at = _now()
+    db.commit()
+
+
+async def _run_job(db: Session, job: ScanJob) -> None:
+    """1ジョブ分の解析パイプラインを実行し、結果をジョブに記録する。
+
+    Vision API のサーキットが開いている間はジョブを失敗させずにキューへ戻し、再開まで待つ。
+    """
+    try:
+        scan_metadata: dict = {}
+        absolute_path = str(UPLOAD_DIR.parent / job.image_path.lstrip("/"))
+        with stage("job", "analyze_receipt"):
+            vision, raw_response = await analyze_receipt(
+                absolute_path, image_hash=job.image_sha256, scan_metadata=scan_metadata, priority=PRIORITY_BACKGROUND
+            )
+        job.analyzed_at = _now()
+        await complete_job(db, job, vision, raw_response, scan_metadata)
+    except VisionUnavailableError as e:
+        job.status = "queued"
+        job.started_at = None
+        db.commit()
+        # retry_after が 0 に近くてもすぐ取り直して空回りしないよう、ポーリング間隔以上は待つ
+        await asyncio.sleep(max(e.retry_after, SCAN_JOB_POLL_INTERVAL))
+    except Exception as e:
+        fail_job(db, job, str(e))
+
+
+async def process_next_job(session_factory: Callable[[], Session] = SessionLocal) -> bool:
+    """キューから1件取り出して処理する。処理したジョブがなければ False。"""
+    db = session_factory()
+    try:
+        job = claim_next_job(db)
+        if job is None:
+            return False
+        with scans_in_flight.track_inprogress(pipeline="job"):
+            await _run_job(db, job)
+        return True
+    finally:
+        db.close()
+
+
+class ScanWorkerPool:
+    """アプリプロセス内でスキャンジョブを処理する asyncio ワーカー群。"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = SCAN_JOB_WORKERS,
+        poll_interval: float = SCAN_JOB_POLL_INTERVAL,
+    ):
+        self._session_factory = session_factory
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """中断されたジョブを再キューし、ワーカーを起動する。"""
+        if self._tasks or self._workers <= 0:
+            return
+        db = self._session_factory()
+        try:
+            requeued = requeue_interrupted_jobs(db)
+        finally:
+            db.close()
+        if requeued:
+            logger.info("中断されたスキャンジョブを再キューしました: %d 件", requeued)
+
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self) -> None:
+        """ワーカーを停止する。処理中のジョブは次回起動時に再実行される。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+    def notify(self) -> None:
+        """新しいジョブが登録されたことをワーカーに通知する。"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self) -> None:
+        while True:
+            # サーキットが開いている間はジョブを取り出さない（取り出しても解析できずキューへ戻すだけになる）
+            blocked = vision_limiter.breaker.blocked_for()
+            if blocked > 0:
+                await asyncio.sleep(max(blocked, self._poll_interval))
+                continue
+            try:
+                processed = await process_next_job(self._session_factory)
+            except Exception:
+                logger.error("スキャンワーカーでエラーが発生しました", exc_info=True)
+                processed = False
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+worker_pool = ScanWorkerPool()
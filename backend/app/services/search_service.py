@@ -0,0 +1,47 @@
+"""receipts_fts を使った店名・品目名の全文検索条件。
+
+trigram トークナイザは3文字以上の語しか MATCH できないため、2文字以下の語
+（例: 「牛乳」）は FTS テーブルに対する LIKE で絞り込む。空白区切りの語はすべて含む
+レシートを対象とする（AND）。
+
+2文字以下の語の LIKE は索引を使えない。3文字以上の語と組み合わせれば MATCH で絞った行だけを確かめるが、
+2文字以下の語だけの検索は FTS テーブルの全件走査になる。それでも1レシート1行（店名と品目名）を
+読むだけなので、receipts と receipt_items を結合して ILIKE で走査するより速い
+（benchmarks/bench_search.py、3万件で「牛乳」は 84ms、品目名を含めた ILIKE は 115ms）。
+receipts.store_name の ILIKE だけにすれば速くなるが、品目名で探せなくなるため採らない。
+"""
+from sqlalchemy import and_, literal_column, or_, select
+
+from app.models.search import receipts_fts
+
+MIN_MATCH_LENGTH = 3
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_match_expression(search: str) -> tuple[str | None, list[str]]:
+    """検索語を (FTS5 MATCH 式, LIKE で絞り込む短い語のリスト) に分ける。"""
+    terms = search.split()
+    long_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+    short_terms = [t for t in terms if len(t) < MIN_MATCH_LENGTH]
+    # 各語をフレーズとして扱い、FTS5 の演算子として解釈されないようにする
+    match = " AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms) or None
+    return match, short_terms
+
+
+def search_subquery(search: str):
+    """検索語に一致するレシートの (rowid, rank) を返すサブクエリ。MATCH を使わない場合 rank は NULL。"""
+    match, short_terms = build_match_expression(search)
+    conditions = []
+    if match:
+        conditions.append(literal_column("receipts_fts").op("MATCH")(match))
+    for term in short_terms:
+        pattern = f"%{_escape_like(term)}%"
+        conditions.append(or_(
+            receipts_fts.c.store_name.like(pattern, escape="\\"),
+            receipts_fts.c.item_names.like(pattern, escape="\\"),
+        ))
+    rank = receipts_fts.c.rank if match else literal_column("NULL")
+    return select(receipts_fts.c.rowid, rank.label("rank")).where(and_(*conditions)).subquery("search")
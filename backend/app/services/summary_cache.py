@@ -0,0 +1,115 @@
+"""月次集計レスポンスのプロセス内キャッシュ。
+
+レシートの変更で集計が変わる年月は rollup_service が flush 時に記録し、
+コミット成功後に該当する年月と年月リストだけを無効化する（ロールバック時は何もしない）。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL
+from app.schemas.summary import SummaryCacheStatsResponse
+
+# rollup_service が変更のあった (年, 月) を書き込む Session.info のキー
+CHANGED_MONTHS_KEY = "summary_changed_months"
+
+MONTH_LIST_KEY = ("monthly-list",)
+
+
+def monthly_key(year: int, month: int) -> tuple:
+    return ("monthly", year, month)
+
+
+class SummaryCache:
+    """件数上限付きの LRU キャッシュ（TTL は任意、0 以下で無期限）。
+
+    集計の読み出し中にコミットされた変更で無効化が先に走ると、古い結果を put してしまう。
+    これを防ぐため、読み出し前に generation() を取り、put に渡す。
+    その間に該当キーが無効化されていれば put しない。
+    """
+
+    def __init__(self, max_entries: int, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._generations: dict[tuple, int] = {}  # キーごとの無効化回数
+        self._clears = 0
+
+    def generation(self, key: tuple) -> tuple[int, int]:
+        """キーの現在の世代。無効化・全削除のたびに変わる。"""
+        with self._lock:
+            return self._clears, self._generations.get(key, 0)
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value, generation: tuple[int, int] | None = None) -> None:
+        """値を保存する。generation を渡した場合、取得後に無効化されていれば保存しない。"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._generations.get(key, 0)):
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_months(self, months: set[tuple[int, int]]) -> None:
+        """指定年月の集計と、件数を含む年月リストを無効化する。"""
+        with self._lock:
+            for key in [*(monthly_key(year, month) for year, month in months), MONTH_LIST_KEY]:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._clears += 1
+            self._invalidations += 1
+
+    def stats(self) -> SummaryCacheStatsResponse:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return SummaryCacheStatsResponse(
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl,
+                hits=self._hits,
+                misses=self._misses,
+                hit_rate=self._hits / lookups if lookups else 0.0,
+                invalidations=self._invalidations,
+            )
+
+
+summary_cache = SummaryCache(SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    months = session.info.pop(CHANGED_MONTHS_KEY, None)
+    if months:
+        summary_cache.invalidate_months(months)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(CHANGED_MONTHS_KEY, None)
@@ -1,27 +1,29 @@
-from sqlalchemy import extract, func
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.models.receipt import Receipt
+from app.models.monthly_category_total import MonthlyCategoryTotal
 from app.schemas.summary import (
     CategorySummary,
     MonthlyListResponse,
     MonthlySummaryResponse,
     MonthOption,
 )
+from app.services import rollup_service  # noqa: F401  flush 時のロールアップ更新を登録する
+from app.services.summary_cache import MONTH_LIST_KEY, monthly_key, summary_cache
 
 
 def get_monthly_summary(db: Session, year: int, month: int) -> MonthlySummaryResponse:
-    """指定年月のカテゴリ別集計を返す。"""
+    """指定年月のカテゴリ別集計を返す（月次ロールアップから読む）。"""
+    key = monthly_key(year, month)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = summary_cache.generation(key)  # 集計中に無効化されたら結果を保存しない
+
     rows = (
-        db.query(
-            func.coalesce(Receipt.category, "未分類").label("category"),
-            func.sum(Receipt.total_amount).label("total_amount"),
-            func.count(Receipt.id).label("count"),
-        )
-        .filter(Receipt.date.isnot(None))
-        .filter(extract("year", Receipt.date) == year)
-        .filter(extract("month", Receipt.date) == month)
-        .group_by(func.coalesce(Receipt.category, "未分類"))
+        db.query(MonthlyCategoryTotal)
+        .filter(MonthlyCategoryTotal.year == year, MonthlyCategoryTotal.month == month)
+        .order_by(MonthlyCategoryTotal.category)
         .all()
     )
 
@@ -37,38 +39,40 @@ def get_monthly_summary(db: Session, year: int, month: int) -> MonthlySummaryRes
     total_amount = sum(c.total_amount for c in categories)
     total_count = sum(c.count for c in categories)
 
-    return MonthlySummaryResponse(
+    result = MonthlySummaryResponse(
         year=year,
         month=month,
         total_amount=total_amount,
         total_count=total_count,
         categories=categories,
     )
+    summary_cache.put(key, result, generation)
+    return result
 
 
 def get_available_months(db: Session) -> MonthlyListResponse:
     """レシートが存在する年月リストを返す（降順）。"""
+    cached = summary_cache.get(MONTH_LIST_KEY)
+    if cached is not None:
+        return cached
+    generation = summary_cache.generation(MONTH_LIST_KEY)
+
     rows = (
         db.query(
-            extract("year", Receipt.date).label("year"),
-            extract("month", Receipt.date).label("month"),
-            func.count(Receipt.id).label("count"),
-        )
-        .filter(Receipt.date.isnot(None))
-        .group_by(
-            extract("year", Receipt.date),
-            extract("month", Receipt.date),
-        )
-        .order_by(
-            extract("year", Receipt.date).desc(),
-            extract("month", Receipt.date).desc(),
+            MonthlyCategoryTotal.year,
+            MonthlyCategoryTotal.month,
+            func.sum(MonthlyCategoryTotal.count).label("count"),
         )
+        .group_by(MonthlyCategoryTotal.year, MonthlyCategoryTotal.month)
+        .order_by(MonthlyCategoryTotal.year.desc(), MonthlyCategoryTotal.month.desc())
         .all()
     )
 
     months = [
-        MonthOption(year=int(row.year), month=int(row.month), count=row.count)
+        MonthOption(year=row.year, month=row.month, count=row.count)
         for row in rows
     ]
 
-    return MonthlyListResponse(months=months)
+    result = MonthlyListResponse(months=months)
+    summary_cache.put(MONTH_LIST_KEY, result, generation)
+    return result
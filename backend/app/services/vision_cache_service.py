@@ -0,0 +1,142 @@
+"""Vision API の解析結果を画像ハッシュ単位で保存する永続キャッシュ。
+
+キーは (画像の SHA-256, VISION_MODEL, プロンプトバージョン)。
+合計サイズが VISION_CACHE_MAX_BYTES を超えたら、最終参照が古いものから削除する。
+"""
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import VISION_CACHE_MAX_BYTES
+from app.models.vision_cache import VisionCacheEntry
+from app.schemas.receipt import VisionResponse
+from app.schemas.vision_cache import VisionCacheStatsResponse
+
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def _count(hit: bool) -> None:
+    global _hits, _misses
+    with _lock:
+        if hit:
+            _hits += 1
+        else:
+            _misses += 1
+
+
+def lookup_counts() -> tuple[int, int]:
+    """プロセス起動後の (ヒット数, ミス数)。"""
+    with _lock:
+        return _hits, _misses
+
+
+def get_cached_result(
+    db: Session, image_sha256: str, model: str, prompt_version: str
+) -> tuple[VisionResponse, str] | None:
+    """キャッシュ済みの (VisionResponse, raw_response) を返す。なければ None。"""
+    entry = db.get(VisionCacheEntry, (image_sha256, model, prompt_version))
+    if entry is None:
+        _count(hit=False)
+        return None
+
+    entry.hit_count += 1
+    entry.last_accessed_at = datetime.now(timezone.utc)
+    db.commit()
+    _count(hit=True)
+    return VisionResponse.model_validate_json(entry.response_json), entry.raw_response
+
+
+def has_result(db: Session, image_sha256: str, model: str, prompt_version: str) -> bool:
+    """キャッシュ済みかどうかだけを返す（ヒット数・最終参照日時は更新しない）。"""
+    return db.query(
+        db.query(VisionCacheEntry)
+        .filter_by(image_sha256=image_sha256, model=model, prompt_version=prompt_version)
+        .exists()
+    ).scalar()
+
+
+def store_result(
+    db: Session,
+    image_sha256: str,
+    model: str,
+    prompt_version: str,
+    vision: VisionResponse,
+    raw_response: str,
+) -> None:
+    """解析結果をキャッシュに保存し、上限を超えた分を追い出す。"""
+    response_json = vision.model_dump_json()
+    size_bytes = len(response_json.encode("utf-8")) + len(raw_response.encode("utf-8"))
+    db.merge(
+        VisionCacheEntry(
+            image_sha256=image_sha256,
+            model=model,
+            prompt_version=prompt_version,
+            response_json=response_json,
+            raw_response=raw_response,
+            size_bytes=size_bytes,
+            hit_count=0,
+            last_accessed_at=datetime.now(timezone.utc),
+        )
+    )
+    db.flush()
+    evict(db, VISION_CACHE_MAX_BYTES)
+    db.commit()
+
+
+def evict(db: Session, max_bytes: int) -> int:
+    """合計サイズが max_bytes 以下になるまで LRU 順に削除する。削除件数を返す。"""
+    total = db.query(func.coalesce(func.sum(VisionCacheEntry.size_bytes), 0)).scalar()
+    if total <= max_bytes:
+        return 0
+
+    expired = []
+    rows = (
+        db.query(
+            VisionCacheEntry.image_sha256,
+            VisionCacheEntry.model,
+            VisionCacheEntry.prompt_version,
+            VisionCacheEntry.size_bytes,
+        )
+        .order_by(VisionCacheEntry.last_accessed_at.asc())
+        .yield_per(500)
+    )
+    for sha, model, prompt_version, size_bytes in rows:
+        if total <= max_bytes:
+            break
+        total -= size_bytes
+        expired.append((sha, model, prompt_version))
+
+    for key in expired:
+        db.delete(db.get(VisionCacheEntry, key))
+    db.flush()
+    return len(expired)
+
+
+def purge(db: Session) -> int:
+    """キャッシュを全削除し、削除件数を返す。"""
+    deleted = db.query(VisionCacheEntry).delete()
+    db.commit()
+    return deleted
+
+
+def get_stats(db: Session) -> VisionCacheStatsResponse:
+    """キャッシュの件数・サイズとプロセス起動後のヒット/ミス数を返す。"""
+    entries, total_bytes = db.query(
+        func.count(),
+        func.coalesce(func.sum(VisionCacheEntry.size_bytes), 0),
+    ).select_from(VisionCacheEntry).one()
+    with _lock:
+        hits, misses = _hits, _misses
+    lookups = hits + misses
+    return VisionCacheStatsResponse(
+        entries=entries,
+        total_bytes=total_bytes,
+        max_bytes=VISION_CACHE_MAX_BYTES,
+        hits=hits,
+        misses=misses,
+        hit_rate=hits / lookups if lookups else 0.0,
+    )
@@ -0,0 +1,302 @@
+"""Vision API 呼び出しのプロセス全体での流量制御。
+
+- 同時実行数の上限（VISION_MAX_CONCURRENCY）。空き待ちは優先度順で、単発スキャン
+  （PRIORITY_INTERACTIVE）は一括スキャン・ジョブ（PRIORITY_BACKGROUND）より先に枠を得る
+- トークンバケットによる送信レートの上限（VISION_RATE_PER_MINUTE / VISION_RATE_BURST）
+- 429 / 529 / 5xx / タイムアウト / 接続エラーは指数バックオフ（フルジッター）で再試行する。
+  retry-after ヘッダーがあればその秒数だけ全体の送信を止める
+- 再試行可能なエラーが VISION_BREAKER_THRESHOLD 回続くとサーキットを開き、
+  VISION_BREAKER_COOLDOWN 秒間は API を呼ばずに VisionUnavailableError を送出する
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import anthropic
+
+from app.config import (
+    VISION_BREAKER_COOLDOWN,
+    VISION_BREAKER_THRESHOLD,
+    VISION_MAX_CONCURRENCY,
+    VISION_MAX_RETRIES,
+    VISION_RATE_BURST,
+    VISION_RATE_PER_MINUTE,
+    VISION_RETRY_BASE_DELAY,
+    VISION_RETRY_MAX_DELAY,
+)
+
+T = TypeVar("T")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# half_open の試行中に届いた呼び出しへ返す retry_after（秒）
+PROBE_RETRY_AFTER = 1.0
+
+
+class VisionUnavailableError(Exception):
+    """サーキットが開いている間の Vision 呼び出しで送出する。retry_after は再開までの秒数。"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Vision API が不安定なため一時的に解析を停止しています（約{retry_after:.0f}秒後に再開）")
+        self.retry_after = retry_after
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (anthropic.APITimeoutError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def retry_after_seconds(exc: Exception) -> float | None:
+    """エラー応答の retry-after-ms / retry-after ヘッダーを秒で返す（無ければ None）。"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class TokenBucket:
+    """rate_per_sec で補充され、最大 burst 個まで貯まるトークンバケット（rate 0 以下で無制限）。"""
+
+    def __init__(self, rate_per_sec: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_sec
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """トークンを1つ予約し、送信してよくなるまでの待ち秒数を返す。"""
+        now = self._clock()
+        delay = max(0.0, self._blocked_until - now)
+        if self.rate <= 0:
+            return delay
+        self._refill(now)
+        self._tokens -= 1
+        if self._tokens < 0:
+            delay = max(delay, -self._tokens / self.rate)
+        return delay
+
+    def block(self, seconds: float) -> None:
+        """retry-after を受けたときに、全体の送信を seconds 秒止める。"""
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+class CircuitBreaker:
+    """連続失敗で開き、クールダウン後に1件だけ試行（half_open）して閉じるか再び開く。"""
+
+    def __init__(self, threshold: int, cooldown: float, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened_count = 0
+
+    def before_call(self) -> None:
+        if self.threshold <= 0 or self.state == "closed":
+            return
+        remaining = self._opened_at + self.cooldown - self._clock()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "open" or self._probing:
+            raise VisionUnavailableError(self.blocked_for())
+        self._probing = True
+
+    def blocked_for(self) -> float:
+        """呼び出しを受け付けるまでの目安の秒数（受け付けるなら 0）。状態は変えない。
+
+        half_open の試行中は結果が出るまで分からないため PROBE_RETRY_AFTER を返す。
+        """
+        if self.threshold <= 0 or self.state == "closed":
+            return 0.0
+        remaining = self._opened_at + self.cooldown - self._clock()
+        if self.state == "open" and remaining > 0:
+            return remaining
+        return PROBE_RETRY_AFTER if self._probing else 0.0
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self._failures = 0
+        self._probing = False
+
+    def cancel_probe(self) -> None:
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.threshold > 0 and (self.state == "half_open" or self._failures >= self.threshold):
+            if self.state != "open":
+                self.opened_count += 1
+            self.state = "open"
+            self._opened_at = self._clock()
+
+
+class VisionLimiter:
+    def __init__(
+        self,
+        max_concurrency: int = VISION_MAX_CONCURRENCY,
+        rate_per_minute: float = VISION_RATE_PER_MINUTE,
+        burst: int = VISION_RATE_BURST,
+        max_retries: int = VISION_MAX_RETRIES,
+        base_delay: float = VISION_RETRY_BASE_DELAY,
+        max_delay: float = VISION_RETRY_MAX_DELAY,
+        breaker_threshold: int = VISION_BREAKER_THRESHOLD,
+        breaker_cooldown: float = VISION_BREAKER_COOLDOWN,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.reset()
+
+    def reset(self) -> None:
+        """待ち行列・統計・サーキットの状態を初期化する（テスト用）。"""
+        self.bucket = TokenBucket(self.bucket.rate, self.bucket.burst)
+        self.breaker = CircuitBreaker(self.breaker.threshold, self.breaker.cooldown)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._calls = 0
+        self._retries = 0
+        self._rejected = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def check_available(self) -> None:
+        """サーキットが呼び出しを受け付けない間は VisionUnavailableError を送出する（呼び出し前の事前確認用）。"""
+        blocked = self.breaker.blocked_for()
+        if blocked > 0:
+            self._rejected += 1
+            raise VisionUnavailableError(blocked)
+
+    async def _acquire(self, priority: int) -> None:
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future  # 枠は _release から引き渡される
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def _wait_turn(self, priority: int) -> None:
+        start = time.perf_counter()
+        await self._acquire(priority)
+        try:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._release()
+            raise
+        waited = time.perf_counter() - start
+        self._wait_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def _backoff(self, attempt: int, exc: Exception) -> float | None:
+        """次の試行までの待ち秒数。retry-after が上限を超える場合は再試行しない（None）。"""
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            self.bucket.block(retry_after)
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, func: Callable[[], Awaitable[T]], priority: int = PRIORITY_INTERACTIVE) -> T:
+        """流量制御・再試行・サーキットブレーカーを通して func() を実行する。"""
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except VisionUnavailableError:
+                self._rejected += 1
+                raise
+            try:
+                await self._wait_turn(priority)
+            except BaseException:
+                self.breaker.cancel_probe()  # 枠を待つ間に取り消された試行（half_open）を解除する
+                raise
+            try:
+                self._calls += 1
+                result = await func()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()  # 応答は返っているので API 自体は稼働している
+                    raise
+                self.breaker.record_failure()
+                delay = self._backoff(attempt, e) if attempt < self.max_retries else None
+                if delay is None:
+                    raise
+            except BaseException:
+                self.breaker.cancel_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self._release()
+            attempt += 1
+            self._retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "calls": self._calls,
+            "retries": self._retries,
+            "rejected": self._rejected,
+            "wait_count": self._wait_count,
+            "wait_avg_ms": round(self._wait_total / self._wait_count * 1000, 1) if self._wait_count else 0.0,
+            "wait_max_ms": round(self._wait_max * 1000, 1),
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened_count,
+        }
+
+
+vision_limiter = VisionLimiter()
@@ -0,0 +1,167 @@
+"""記録済みの raw_response を再生する Vision バックエンド（オフライン負荷試験用）。
+
+VISION_REPLAY_DIR を指定すると、analyze_receipt は Anthropic API の代わりに ReplayVisionClient を使う。
+ディレクトリ内の *.txt（1ファイル1レスポンス。scripts/vision_replay.py export で receipts から書き出せる）を
+ランダムに返し、応答までの待ち時間は VISION_REPLAY_LATENCY の分布から引く。
+
+    fixed:<ms>                 固定
+    uniform:<min_ms>:<max_ms>  一様分布
+    lognormal:<median_ms>:<sigma>
+    empirical                  VISION_REPLAY_DIR/latencies_ms.txt（1行1値）から復元抽出
+
+VISION_REPLAY_ERROR_RATE / VISION_REPLAY_429_RATE の確率で 529 / 429（retry-after 付き）を、
+VISION_REPLAY_MALFORMED_RATE の確率で途中で切れた応答を返す。応答は実際の API と同じく
+vision_limiter・_extract_json・VisionResponse の検証を通るため、再試行やパース失敗も再現される。
+再生した応答は解析キャッシュに保存せず、vision_usage には model・mode を replay として記録する。
+"""
+import asyncio
+import math
+import random
+from collections.abc import Callable
+from pathlib import Path
+
+import anthropic
+import httpx
+from anthropic.types import Message, TextBlock, Usage
+
+from app.config import (
+    VISION_MODEL,
+    VISION_REPLAY_429_RATE,
+    VISION_REPLAY_DIR,
+    VISION_REPLAY_ERROR_RATE,
+    VISION_REPLAY_LATENCY,
+    VISION_REPLAY_MALFORMED_RATE,
+    VISION_REPLAY_RETRY_AFTER,
+    VISION_REPLAY_SEED,
+)
+
+LATENCY_FILE = "latencies_ms.txt"
+
+# vision_usage に記録するモデル名（料金表にないため費用は出ない）
+REPLAY_MODEL = "replay"
+
+# 再生時の usage（画像1枚 + プロンプトの入力トークンの目安と、出力1トークンあたりの文字数の目安）
+REPLAY_INPUT_TOKENS = 1600
+CHARS_PER_OUTPUT_TOKEN = 2
+
+LatencySampler = Callable[[random.Random], float]
+
+
+def load_responses(directory: Path) -> list[str]:
+    """ディレクトリ内の *.txt を名前順に読み込む。"""
+    paths = [path for path in sorted(directory.glob("*.txt")) if path.name != LATENCY_FILE]
+    responses = [path.read_text(encoding="utf-8") for path in paths]
+    if not responses:
+        raise ValueError(f"再生する raw_response がありません: {directory}")
+    return responses
+
+
+def parse_latency_spec(spec: str, directory: Path | None = None) -> LatencySampler:
+    """レイテンシ分布の指定を、秒を返すサンプラーに変換する。"""
+    kind, _, rest = spec.partition(":")
+    args = [float(v) for v in rest.split(":")] if rest else []
+    if kind == "fixed" and len(args) == 1:
+        return lambda rng: args[0] / 1000
+    if kind == "uniform" and len(args) == 2:
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal" and len(args) == 2:
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1]) / 1000
+    if kind == "empirical" and not args and directory is not None:
+        lines = (directory / LATENCY_FILE).read_text(encoding="utf-8").split()
+        samples = [float(v) / 1000 for v in lines]
+        if not samples:
+            raise ValueError(f"{LATENCY_FILE} にレイテンシがありません")
+        return lambda rng: rng.choice(samples)
+    raise ValueError(f"VISION_REPLAY_LATENCY の指定が不正です: {spec}")
+
+
+def _status_error(cls, status: int, message: str, headers: dict | None = None) -> anthropic.APIStatusError:
+    request = httpx.Request("POST", "https://replay.invalid/v1/messages")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    body = {"type": "error", "error": {"type": "replay_error", "message": message}}
+    return cls(message, response=response, body=body)
+
+
+class _ReplayMessages:
+    def __init__(self, client: "ReplayVisionClient"):
+        self._client = client
+
+    async def create(self, **params) -> Message:
+        return await self._client.respond(params)
+
+
+class ReplayVisionClient:
+    """anthropic.AsyncAnthropic の messages.create / with_options だけを模したクライアント。"""
+
+    def __init__(
+        self,
+        responses: list[str],
+        latency: LatencySampler,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int | None = None,
+    ):
+        self.responses = responses
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.messages = _ReplayMessages(self)
+        self.calls = 0
+
+    def with_options(self, **kwargs) -> "ReplayVisionClient":
+        return self
+
+    async def respond(self, params: dict) -> Message:
+        self.calls += 1
+        await asyncio.sleep(self.latency(self.rng))
+        draw = self.rng.random()
+        if draw < self.rate_limit_rate:
+            raise _status_error(
+                anthropic.RateLimitError, 429, "replay: rate limited", {"retry-after": str(self.retry_after)}
+            )
+        if draw < self.rate_limit_rate + self.error_rate:
+            raise _status_error(anthropic.InternalServerError, 529, "replay: overloaded")
+
+        text = self.rng.choice(self.responses)
+        if self.rng.random() < self.malformed_rate:
+            text = text[: len(text) // 2]  # max_tokens で途中終了したような応答
+        return Message(
+            id=f"msg_replay_{self.calls}",
+            type="message",
+            role="assistant",
+            model=params.get("model", VISION_MODEL),
+            content=[TextBlock(type="text", text=text)],
+            stop_reason="end_turn",
+            stop_sequence=None,
+            usage=Usage(input_tokens=REPLAY_INPUT_TOKENS, output_tokens=max(1, len(text) // CHARS_PER_OUTPUT_TOKEN)),
+        )
+
+
+_client: ReplayVisionClient | None = None
+
+
+def replay_enabled() -> bool:
+    return VISION_REPLAY_DIR is not None
+
+
+def get_replay_client() -> ReplayVisionClient:
+    """VISION_REPLAY_* の設定から再生クライアントを作る（初回のみ読み込む）。"""
+    global _client
+    if _client is None:
+        directory = Path(VISION_REPLAY_DIR)
+        _client = ReplayVisionClient(
+            load_responses(directory),
+            parse_latency_spec(VISION_REPLAY_LATENCY, directory),
+            error_rate=VISION_REPLAY_ERROR_RATE,
+            rate_limit_rate=VISION_REPLAY_429_RATE,
+            malformed_rate=VISION_REPLAY_MALFORMED_RATE,
+            retry_after=VISION_REPLAY_RETRY_AFTER,
+            seed=VISION_REPLAY_SEED,
+        )
+    return _client
@@ -1,12 +1,33 @@
+import asyncio
 import base64
+import hashlib
 import json
+import logging
 import re
+import time
 from pathlib import Path
 
 import anthropic
 
-from app.config import ANTHROPIC_API_KEY, MOCK_VISION, VISION_MODEL
+from app.config import (
+    ANTHROPIC_API_KEY,
+    ANTHROPIC_BASE_URL,
+    MOCK_VISION,
+    MOCK_VISION_LATENCY,
+    VISION_CACHE_ENABLED,
+    VISION_IMAGE_NORMALIZE,
+    VISION_MODEL,
+    VISION_PROMPT_CACHE,
+)
+from app.database import SessionLocal
 from app.schemas.receipt import VisionResponse
+from app.services import vision_cache_service, vision_usage_service
+from app.services.image_service import VisionImage, normalize_for_vision, run_image_task
+from app.services.metrics import vision_api_seconds, vision_errors_total, vision_wait_seconds
+from app.services.vision_limiter import PRIORITY_INTERACTIVE, VisionUnavailableError, vision_limiter
+from app.services.vision_replay import REPLAY_MODEL, get_replay_client, replay_enabled
+
+logger = logging.getLogger(__name__)
 
 _client: anthropic.AsyncAnthropic | None = None
 
@@ -14,7 +35,7 @@ _client: anthropic.AsyncAnthropic | None = None
 def _get_client() -> anthropic.AsyncAnthropic:
     global _client
     if _client is None:
-        _client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        _client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL)
     return _client
 
 MOCK_RESPONSE = {
@@ -70,6 +91,13 @@ PROMPT = """このレシート画像から以下の情報をJSON形式で抽出
 - items の quantity が不明なら 1 としてください
 - JSON のみ出力してください（説明文は不要）"""
 
+# PROMPT は全リクエスト共通のため system に置き、プロンプトキャッシュの対象にする。画像は user 側で送る
+USER_TEXT = "このレシート画像を解析してください。"
+
+# プロンプトを変更するとキャッシュキーも変わり、古い解析結果は使われなくなる。
+# 抽出ルール（PROMPT）だけから求め、system への移動や USER_TEXT では解析キャッシュを無効化しない
+PROMPT_VERSION = hashlib.sha256(PROMPT.encode("utf-8")).hexdigest()[:12]
+
 MIME_MAP = {
     ".jpg": "image/jpeg",
     ".jpeg": "image/jpeg",
@@ -78,12 +106,35 @@ MIME_MAP = {
 }
 
 
-async def _encode_image(image_path: str) -> tuple[str, str]:
-    """画像ファイルをbase64エンコードし、(base64文字列, media_type) を返す。"""
-    import asyncio
-    path = Path(image_path)
-    media_type = MIME_MAP.get(path.suffix.lower(), "image/jpeg")
-    data = await asyncio.to_thread(path.read_bytes)
+async def _encode_image(
+    image_path: str, metadata: dict | None = None, image: VisionImage | None = None
+) -> tuple[str, str]:
+    """画像ファイルを（正規化して）base64エンコードし、(base64文字列, media_type) を返す。
+
+    正規化済みの image が渡された場合はファイルを読み直さずにそれを使う。
+    metadata が渡された場合は元サイズ・送信サイズ・削減量・正規化時間を記録する。
+    """
+    start = time.perf_counter()
+    if image is None:
+        path = Path(image_path)
+        data = await asyncio.to_thread(path.read_bytes)
+        media_type = MIME_MAP.get(path.suffix.lower(), "image/jpeg")
+        original_bytes = len(data)
+        if VISION_IMAGE_NORMALIZE:
+            try:
+                image = await run_image_task(normalize_for_vision, data)
+            except Exception:
+                logger.warning("画像の正規化に失敗したため元画像を送信します: %s", image_path, exc_info=True)
+    if image is not None:
+        data, media_type, original_bytes = image.data, image.media_type, image.source_bytes
+        if metadata is not None:
+            metadata["width"], metadata["height"] = image.width, image.height
+
+    if metadata is not None:
+        metadata["normalize_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        metadata["original_bytes"] = original_bytes
+        metadata["sent_bytes"] = len(data)
+        metadata["bytes_saved"] = original_bytes - len(data)
     return base64.standard_b64encode(data).decode("utf-8"), media_type
 
 
@@ -102,28 +153,20 @@ def _extract_json(text: str) -> dict:
     raise ValueError("APIレスポンスからJSONを抽出できませんでした")
 
 
-async def analyze_receipt(image_path: str) -> tuple[VisionResponse, str]:
-    """
-    画像を Claude Vision API で解析し、構造化データを返す。
+def build_message_params(b64_data: str, media_type: str) -> dict:
+    """Messages API（および Message Batches API の params）に渡すリクエスト内容を組み立てる。
 
-    Returns:
-        (VisionResponse, raw_response): 解析結果と生レスポンス文字列
+    静的な PROMPT を先頭の system ブロックに置き、VISION_PROMPT_CACHE 有効時は cache_control を付ける
+    （PROMPT がモデルの最小キャッシュ長に満たない間は API 側でキャッシュされない。config.py 参照）。
     """
-    if MOCK_VISION:
-        raw = json.dumps(MOCK_RESPONSE, ensure_ascii=False)
-        return VisionResponse.model_validate(MOCK_RESPONSE), raw
-
-    if not ANTHROPIC_API_KEY:
-        raise ValueError("ANTHROPIC_API_KEY が設定されていません")
-
-    b64_data, media_type = await _encode_image(image_path)
-
-    client = _get_client()
-
-    message = await client.messages.create(
-        model=VISION_MODEL,
-        max_tokens=2048,
-        messages=[
+    system_block = {"type": "text", "text": PROMPT}
+    if VISION_PROMPT_CACHE:
+        system_block["cache_control"] = {"type": "ephemeral"}
+    return {
+        "model": VISION_MODEL,
+        "max_tokens": 2048,
+        "system": [system_block],
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -137,19 +180,178 @@ async def analyze_receipt(image_path: str) -> tuple[VisionResponse, str]:
                     },
                     {
                         "type": "text",
-                        "text": PROMPT,
+                        "text": USER_TEXT,
                     },
                 ],
             }
         ],
-    )
+    }
 
+
+def message_text(message) -> str:
+    """API の Message からテキストを取り出す。"""
     if not message.content or not hasattr(message.content[0], "text"):
         raise ValueError("APIレスポンスにテキストが含まれていません")
-    raw_text = message.content[0].text
+    return message.content[0].text
+
+
+def parse_vision_text(raw_text: str) -> VisionResponse:
+    """API の応答テキストから JSON を抽出し、VisionResponse に変換する。"""
     parsed = _extract_json(raw_text)
     if parsed.get("items") is None:
         parsed["items"] = []
-    vision_response = VisionResponse.model_validate(parsed)
+    return VisionResponse.model_validate(parsed)
+
+
+def _lookup_cache(image_hash: str) -> tuple[VisionResponse, str] | None:
+    db = SessionLocal()
+    try:
+        return vision_cache_service.get_cached_result(db, image_hash, VISION_MODEL, PROMPT_VERSION)
+    except Exception:
+        logger.warning("Vision キャッシュの参照に失敗しました", exc_info=True)
+        return None
+    finally:
+        db.close()
+
+
+def needs_vision_payload(image_hash: str) -> bool:
+    """analyze_receipt が画像を API に送る見込みがあるか（モック・解析キャッシュのヒット時は送らない）。
+
+    save_image の needs_vision に渡し、使われない Vision 送信用画像を作らないようにする。
+    """
+    if MOCK_VISION:
+        return False
+    if not VISION_CACHE_ENABLED:
+        return True
+    db = SessionLocal()
+    try:
+        return not vision_cache_service.has_result(db, image_hash, VISION_MODEL, PROMPT_VERSION)
+    except Exception:
+        logger.warning("Vision キャッシュの参照に失敗しました", exc_info=True)
+        return True
+    finally:
+        db.close()
+
+
+def _record_usage(usage, latency_ms: float, status: str = "ok", replay: bool = False) -> None:
+    """使用量を記録する。再生した応答は実際のモデルと混ざらないよう model・mode を replay にする。"""
+    model, mode = (REPLAY_MODEL, "replay") if replay else (VISION_MODEL, "sync")
+    db = SessionLocal()
+    try:
+        vision_usage_service.record_call(db, model, usage, latency_ms, mode=mode, status=status)
+    except Exception:
+        db.rollback()
+        logger.warning("Vision API の使用量の記録に失敗しました", exc_info=True)
+    finally:
+        db.close()
+
+
+def _store_cache(image_hash: str, vision: VisionResponse, raw_text: str) -> None:
+    db = SessionLocal()
+    try:
+        vision_cache_service.store_result(db, image_hash, VISION_MODEL, PROMPT_VERSION, vision, raw_text)
+    except Exception:
+        db.rollback()
+        logger.warning("Vision キャッシュの保存に失敗しました", exc_info=True)
+    finally:
+        db.close()
+
+
+async def analyze_receipt(
+    image_path: str,
+    image_hash: str | None = None,
+    scan_metadata: dict | None = None,
+    image: VisionImage | None = None,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> tuple[VisionResponse, str]:
+    """
+    画像を Claude Vision API で解析し、構造化データを返す。
+
+    image_hash（画像の SHA-256）が渡された場合は解析キャッシュを参照し、
+    ヒットすれば API を呼ばずにキャッシュ済みの結果を返す。
+    scan_metadata が渡された場合は scan_metadata["vision"] に送信画像のサイズ・
+    各処理の所要時間・トークン使用量を記録する（レシートの scan_metadata として保存される）。
+    API 呼び出しごとの使用量と所要時間は vision_usage にも記録する。
+    image（save_image で作った送信用画像）が渡された場合は、ファイルの再読み込みと正規化を省く。
+    API 呼び出しは vision_limiter を通し、priority の小さい呼び出しから同時実行枠を割り当てる。
+    VISION_REPLAY_DIR 指定時は API の代わりに記録済みの応答を再生する（vision_replay 参照）。
+
+    Returns:
+        (VisionResponse, raw_response): 解析結果と生レスポンス文字列
+    """
+    if MOCK_VISION:
+        if MOCK_VISION_LATENCY > 0:
+            await asyncio.sleep(MOCK_VISION_LATENCY)
+        raw = json.dumps(MOCK_RESPONSE, ensure_ascii=False)
+        return VisionResponse.model_validate(MOCK_RESPONSE), raw
+
+    metadata: dict = {}
+    if scan_metadata is not None:
+        scan_metadata["vision"] = metadata
+
+    use_cache = VISION_CACHE_ENABLED and image_hash is not None
+    if use_cache:
+        cached = _lookup_cache(image_hash)
+        metadata["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+
+    replay = replay_enabled()
+    if not ANTHROPIC_API_KEY and not replay:
+        raise ValueError("ANTHROPIC_API_KEY が設定されていません")
+
+    # サーキットが開いている間は、画像のエンコードより前に失敗させる
+    try:
+        vision_limiter.check_available()
+    except VisionUnavailableError:
+        vision_errors_total.inc(kind="unavailable")
+        raise
+
+    b64_data, media_type = await _encode_image(image_path, metadata, image)
+
+    # 再試行は vision_limiter が行うため、SDK 側の自動再試行は無効にする
+    client = (get_replay_client() if replay else _get_client()).with_options(max_retries=0)
+    params = build_message_params(b64_data, media_type)
+
+    # API の所要時間は試行ごとに測り、最後の試行（成功すればその試行）の値を記録する。
+    # 同時実行枠・レート制限の待ちと、再試行（失敗した試行とバックオフ）の時間は limiter_wait_ms に分ける
+    attempt_seconds: list[float] = []
+
+    async def create():
+        attempt_start = time.perf_counter()
+        try:
+            return await client.messages.create(**params)
+        finally:
+            attempt_seconds.append(time.perf_counter() - attempt_start)
+
+    start = time.perf_counter()
+    try:
+        message = await vision_limiter.call(create, priority)
+    except VisionUnavailableError:
+        vision_errors_total.inc(kind="unavailable")
+        raise
+    except Exception:
+        vision_errors_total.inc(kind="api")
+        latency = attempt_seconds[-1] if attempt_seconds else 0.0
+        _record_usage(None, round(latency * 1000, 1), status="error", replay=replay)
+        raise
+    elapsed = attempt_seconds[-1]
+    wait = time.perf_counter() - start - elapsed
+    vision_api_seconds.observe(elapsed)
+    vision_wait_seconds.observe(wait)
+    metadata["api_latency_ms"] = round(elapsed * 1000, 1)
+    metadata["limiter_wait_ms"] = round(wait * 1000, 1)
+    metadata.update(vision_usage_service.usage_fields(message.usage))
+    _record_usage(message.usage, metadata["api_latency_ms"], replay=replay)
+
+    try:
+        raw_text = message_text(message)
+        vision_response = parse_vision_text(raw_text)
+    except ValueError:  # pydantic の ValidationError も ValueError
+        vision_errors_total.inc(kind="parse")
+        raise
+
+    if use_cache and not replay:  # 再生した応答は実際の解析結果ではないため保存しない
+        _store_cache(image_hash, vision_response, raw_text)
 
     return vision_response, raw_text
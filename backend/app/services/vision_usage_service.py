@@ -0,0 +1,155 @@
+"""Vision API 呼び出しのトークン使用量・所要時間の記録と、日別・モデル別の集計。
+
+費用は記録時ではなく集計時に VISION_PRICING から見積もるため、料金表を直せば過去分にも反映される。
+日付は UTC で区切る。
+"""
+import datetime
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.config import VISION_PRICING
+from app.models.vision_usage import VisionUsage
+from app.schemas.vision_usage import VisionUsageDay, VisionUsageResponse
+
+# 入力単価に対する倍率（キャッシュ書き込み・キャッシュ読み込み）と、Message Batches API の割引率
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+BATCH_DISCOUNT = 0.5
+
+
+def usage_fields(usage) -> dict:
+    """API の usage から記録するトークン数を取り出す（キャッシュ系は未対応モデルで None になる）。"""
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+    }
+
+
+def record_call(
+    db: Session,
+    model: str,
+    usage=None,
+    latency_ms: float | None = None,
+    mode: str = "sync",
+    status: str = "ok",
+) -> VisionUsage:
+    """API 呼び出し1回分を記録する。失敗した呼び出しは usage なしで status="error" として残す。"""
+    entry = VisionUsage(
+        model=model,
+        mode=mode,
+        status=status,
+        latency_ms=latency_ms,
+        **(usage_fields(usage) if usage is not None else {}),
+    )
+    db.add(entry)
+    db.commit()
+    return entry
+
+
+def _pricing(model: str) -> tuple[float, float] | None:
+    matches = [prefix for prefix in VISION_PRICING if model.startswith(prefix)]
+    return VISION_PRICING[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_creation_input_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
+    batch: bool = False,
+) -> float | None:
+    """トークン数から費用（USD）を見積もる。料金表にないモデルは None。"""
+    pricing = _pricing(model)
+    if pricing is None:
+        return None
+    input_price, output_price = pricing
+    cost = (
+        input_tokens * input_price
+        + cache_creation_input_tokens * input_price * CACHE_WRITE_MULTIPLIER
+        + cache_read_input_tokens * input_price * CACHE_READ_MULTIPLIER
+        + output_tokens * output_price
+    ) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def get_daily_usage(db: Session, date_from: datetime.date, date_to: datetime.date) -> VisionUsageResponse:
+    """date_from〜date_to（両端を含む）の使用量・費用・レイテンシを日別・モデル別に集計する。"""
+    day = func.date(VisionUsage.created_at)
+    start = datetime.datetime.combine(date_from, datetime.time.min)
+    end = datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min)
+    token_columns = (
+        VisionUsage.input_tokens,
+        VisionUsage.output_tokens,
+        VisionUsage.cache_creation_input_tokens,
+        VisionUsage.cache_read_input_tokens,
+    )
+    rows = (
+        db.query(
+            day.label("day"),
+            VisionUsage.model,
+            VisionUsage.mode,
+            func.count().label("calls"),
+            func.sum(case((VisionUsage.status != "ok", 1), else_=0)).label("errors"),
+            *(func.sum(column).label(column.key) for column in token_columns),
+            func.sum(VisionUsage.latency_ms).label("latency_total"),
+            func.count(VisionUsage.latency_ms).label("latency_count"),
+            func.max(VisionUsage.latency_ms).label("latency_max"),
+        )
+        .filter(VisionUsage.created_at >= start, VisionUsage.created_at < end)
+        .group_by(day, VisionUsage.model, VisionUsage.mode)
+        .order_by(day, VisionUsage.model)
+        .all()
+    )
+
+    # sync / batch は単価が違うため別々に費用を出し、日・モデルごとにまとめる
+    groups: dict[tuple[str, str], dict] = {}
+    for row in rows:
+        group = groups.setdefault((row.day, row.model), {
+            "calls": 0, "errors": 0, "batch_calls": 0,
+            **{column.key: 0 for column in token_columns},
+            "cost": 0.0, "latency_total": 0.0, "latency_count": 0, "latency_max": None,
+        })
+        tokens = {column.key: getattr(row, column.key) or 0 for column in token_columns}
+        cost = estimate_cost(row.model, **tokens, batch=row.mode == "batch")
+        group["calls"] += row.calls
+        group["errors"] += row.errors
+        group["batch_calls"] += row.calls if row.mode == "batch" else 0
+        for key, value in tokens.items():
+            group[key] += value
+        group["cost"] = None if cost is None or group["cost"] is None else group["cost"] + cost
+        group["latency_total"] += row.latency_total or 0
+        group["latency_count"] += row.latency_count
+        if row.latency_max is not None:
+            group["latency_max"] = max(group["latency_max"] or 0, row.latency_max)
+
+    days = []
+    for (day_value, model), group in groups.items():
+        prompt_tokens = group["input_tokens"] + group["cache_creation_input_tokens"] + group["cache_read_input_tokens"]
+        days.append(VisionUsageDay(
+            date=datetime.date.fromisoformat(day_value),
+            model=model,
+            calls=group["calls"],
+            errors=group["errors"],
+            batch_calls=group["batch_calls"],
+            input_tokens=group["input_tokens"],
+            output_tokens=group["output_tokens"],
+            cache_creation_input_tokens=group["cache_creation_input_tokens"],
+            cache_read_input_tokens=group["cache_read_input_tokens"],
+            cache_read_ratio=round(group["cache_read_input_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+            estimated_cost_usd=round(group["cost"], 6) if group["cost"] is not None else None,
+            avg_latency_ms=(
+                round(group["latency_total"] / group["latency_count"], 1) if group["latency_count"] else None
+            ),
+            max_latency_ms=group["latency_max"],
+        ))
+
+    return VisionUsageResponse(
+        date_from=date_from,
+        date_to=date_to,
+        days=days,
+        total_estimated_cost_usd=round(sum(d.estimated_cost_usd or 0 for d in days), 6),
+    )
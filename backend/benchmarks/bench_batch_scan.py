@@ -0,0 +1,85 @@
+"""一括スキャンの並行度ベンチマーク。
+
+MOCK_VISION と MOCK_VISION_LATENCY で Vision API の待ち時間を再現し、
+ファイル数 N と同時実行数ごとの所要時間（wall-clock）を計測する。
+
+    cd backend
+    python -m benchmarks.bench_batch_scan --latency 0.2 --sizes 1 5 10 30 --concurrency 1 4 8
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["MOCK_VISION"] = "1"
+os.environ.setdefault("MOCK_VISION_LATENCY", "0.2")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmpdir.name) / 'bench.db'}"
+
+from unittest.mock import patch  # noqa: E402
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.config import UPLOAD_DIR  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def _make_jpeg(width: int = 800, height: int = 1200) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (240, 240, 235)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _cleanup(results: list[dict]) -> None:
+    """ベンチマークで作成した画像・サムネイルを削除する。"""
+    for result in results:
+        receipt = result.get("receipt")
+        if not receipt:
+            continue
+        for path in (receipt["image_path"], receipt.get("thumbnail_path")):
+            if path:
+                (UPLOAD_DIR.parent / path.lstrip("/")).unlink(missing_ok=True)
+
+
+def run(sizes: list[int], concurrencies: list[int]) -> None:
+    client = TestClient(app)
+    image = _make_jpeg()
+    latency = float(os.environ["MOCK_VISION_LATENCY"])
+
+    print(f"MOCK_VISION_LATENCY={latency}s")
+    print(f"{'N':>5} {'concurrency':>12} {'elapsed(s)':>12} {'per file(s)':>12}")
+    for n in sizes:
+        for concurrency in concurrencies:
+            files = [("files", (f"r{i}.jpg", image, "image/jpeg")) for i in range(n)]
+            with patch("app.routers.receipts.BATCH_SCAN_CONCURRENCY", concurrency):
+                start = time.perf_counter()
+                response = client.post("/api/receipts/scan/batch", files=files)
+                elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            body = response.json()
+            _cleanup(body["results"])
+            assert body["success_count"] == n, body
+            print(f"{n:>5} {concurrency:>12} {elapsed:>12.3f} {elapsed / n:>12.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, help="Vision API の疑似レイテンシ（秒）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 30])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    if args.latency is not None:
+        import app.services.vision_service as vision_service
+
+        vision_service.MOCK_VISION_LATENCY = args.latency
+        os.environ["MOCK_VISION_LATENCY"] = str(args.latency)
+
+    run(args.sizes, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""カテゴリ分類の辞書線形走査と Aho-Corasick マッチャーの比較。
+
+合成したキーワード辞書（既定 5,000 語）と品目名で、
+旧方式（KEYWORD_MAP を先頭から `in` で調べる）と KeywordMatcher を計測する。
+
+    cd backend
+    python -m benchmarks.bench_category --keywords 5000 --items 20000
+"""
+import argparse
+import random
+import time
+
+from app.services.category_service import KEYWORD_MAP, KeywordMatcher
+
+KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン"
+
+
+def build_keyword_map(size: int, rng: random.Random) -> dict[str, str]:
+    keyword_map = dict(KEYWORD_MAP)
+    categories = sorted(set(KEYWORD_MAP.values()))
+    while len(keyword_map) < size:
+        keyword = "".join(rng.choice(KANA) for _ in range(rng.randint(2, 6)))
+        keyword_map.setdefault(keyword, rng.choice(categories))
+    return keyword_map
+
+
+def build_names(count: int, keyword_map: dict[str, str], rng: random.Random) -> list[str]:
+    keywords = list(keyword_map)
+    names = []
+    for _ in range(count):
+        noise = "".join(rng.choice(KANA) for _ in range(rng.randint(4, 16)))
+        if rng.random() < 0.5:
+            pos = rng.randint(0, len(noise))
+            noise = noise[:pos] + rng.choice(keywords) + noise[pos:]
+        names.append(noise)
+    return names
+
+
+def _naive_first_match(keyword_map: dict[str, str], name: str) -> str | None:
+    for keyword, category in keyword_map.items():
+        if keyword in name:
+            return category
+    return None
+
+
+def run(keywords: int, items: int) -> None:
+    rng = random.Random(0)
+    keyword_map = build_keyword_map(keywords, rng)
+    names = build_names(items, keyword_map, rng)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keyword_map)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    naive = [_naive_first_match(keyword_map, name) for name in names]
+    naive_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [matcher.first_match(name) for name in names]
+    fast_s = time.perf_counter() - start
+
+    assert naive == fast, "マッチ結果が一致しません"
+    print(f"keywords={len(keyword_map)} items={items} matcher build={build_ms:.1f}ms")
+    print(f"{'method':<14} {'total(ms)':>10} {'items/s':>12}")
+    print(f"{'linear scan':<14} {naive_s * 1000:>10.1f} {items / naive_s:>12.0f}")
+    print(f"{'aho-corasick':<14} {fast_s * 1000:>10.1f} {items / fast_s:>12.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keywords", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.keywords, args.items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""スキャン時の画像処理: 段階ごとに読み直す旧方式と、1回デコードの process_image の比較。
+
+旧方式は検証（verify）・dHash・Vision 用の正規化・サムネイル生成で毎回ファイルを開いてデコードする。
+どちらも CPU 時間（thread_time）で計測し、process_image は段階ごとの内訳も表示する。
+
+    cd backend
+    python -m benchmarks.bench_image_pipeline
+    python -m benchmarks.bench_image_pipeline --images ./uploads --limit 20
+"""
+import argparse
+import io
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from app.services.image_service import compute_dhash, normalize_for_vision, process_image
+from benchmarks.bench_vision_payload import load_samples, synthetic_samples
+
+
+def _legacy_pipeline(path: Path) -> None:
+    with Image.open(path) as img:
+        img.verify()
+    compute_dhash(path)
+    normalize_for_vision(path.read_bytes())
+    with Image.open(path) as img:
+        img.draft("RGB", (200, 200))
+        img.thumbnail((200, 200))
+        img.convert("RGB").save(io.BytesIO(), "JPEG", quality=85)
+
+
+def _cpu_ms(fn, *args) -> float:
+    start = time.thread_time()
+    fn(*args)
+    return (time.thread_time() - start) * 1000
+
+
+def run(samples: list[tuple[str, bytes]], repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'image':<28} {'legacy ms':>10} {'single ms':>10} {'decode':>8} {'phash':>7} {'thumb':>7} {'vision':>7}")
+        legacy_all, single_all = [], []
+        for name, data in samples:
+            path = Path(tmp) / name.replace(" ", "_")
+            path.write_bytes(data)
+            legacy = statistics.median(_cpu_ms(_legacy_pipeline, path) for _ in range(repeat))
+            results = [process_image(path) for _ in range(repeat)]
+            single = statistics.median(sum(r.cpu_ms.values()) for r in results)
+            stages = {k: statistics.median(r.cpu_ms[k] for r in results) for k in results[0].cpu_ms}
+            legacy_all.append(legacy)
+            single_all.append(single)
+            print(
+                f"{name:<28} {legacy:>10.1f} {single:>10.1f} {stages['decode']:>8.1f} {stages['phash']:>7.1f} "
+                f"{stages['thumbnail']:>7.1f} {stages.get('vision_encode', 0):>7.1f}"
+            )
+        print(f"{'total':<28} {sum(legacy_all):>10.1f} {sum(single_all):>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=Path, help="サンプル画像のディレクトリ（未指定なら合成画像）")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    samples = load_samples(args.images, args.limit) if args.images else synthetic_samples()
+    run(samples, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
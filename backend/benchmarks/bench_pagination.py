@@ -0,0 +1,100 @@
+"""一覧APIのページネーション方式ごとの深いページのレイテンシ比較。
+
+大量のレシートを一時DBに投入し、skip/limit（OFFSET）とカーソル（キーセット）で
+同じ深さのページを取得する時間を計測する。
+
+    cd backend
+    python -m benchmarks.bench_pagination --rows 200000 --depths 0 1000 10000 100000
+"""
+import argparse
+import datetime
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.receipt import Receipt
+from app.services.receipt_service import encode_cursor, get_receipts
+
+STORES = ["セブンイレブン", "ファミリーマート", "ローソン", "イオン", "マツモトキヨシ", "ENEOS"]
+
+
+def seed(session_factory, rows: int) -> None:
+    rng = random.Random(0)
+    start = datetime.datetime(2023, 1, 1)
+    batch = []
+    with session_factory() as db:
+        for i in range(rows):
+            created = start + datetime.timedelta(seconds=i * 60)
+            batch.append({
+                "store_name": rng.choice(STORES),
+                "date": created.date(),
+                "total_amount": float(rng.randrange(100, 20000)),
+                "category": "食費",
+                "image_path": f"/uploads/{i}.jpg",
+                "created_at": created,
+                "updated_at": created,
+            })
+            if len(batch) == 10000:
+                db.execute(Receipt.__table__.insert(), batch)
+                batch.clear()
+        if batch:
+            db.execute(Receipt.__table__.insert(), batch)
+        db.commit()
+
+
+def _time(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(rows: int, depths: list[int], limit: int, sort_by: str, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+
+        start = time.perf_counter()
+        seed(session_factory, rows)
+        print(f"seeded {rows} rows in {time.perf_counter() - start:.1f}s")
+        print(f"{'depth':>8} {'offset(ms)':>12} {'cursor(ms)':>12}")
+
+        with session_factory() as db:
+            for depth in depths:
+                if depth >= rows:
+                    continue
+                # 直前のページ末尾の行からカーソルを作る
+                cursor = None
+                if depth > 0:
+                    previous, _ = get_receipts(db, skip=depth - 1, limit=1, sort_by=sort_by)
+                    cursor = encode_cursor(previous[0], sort_by, "desc")
+
+                offset_ms = _time(lambda: get_receipts(db, skip=depth, limit=limit, sort_by=sort_by), repeat) * 1000
+                cursor_ms = _time(
+                    lambda: get_receipts(db, limit=limit, sort_by=sort_by, cursor=cursor), repeat
+                ) * 1000
+                print(f"{depth:>8} {offset_ms:>12.2f} {cursor_ms:>12.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1_000, 10_000, 100_000, 190_000])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--sort-by", default="created_at")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.depths, args.limit, args.sort_by, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
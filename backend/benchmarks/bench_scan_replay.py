@@ -0,0 +1,145 @@
+"""単発スキャン（POST /api/receipts/scan）の負荷試験。Vision API の代わりに記録済みの応答を再生する。
+
+VISION_REPLAY_DIR の応答・レイテンシ分布・エラー注入（app/services/vision_replay.py 参照）で
+Vision API を再現し、同時リクエスト数ごとのスループット・レイテンシ分布・ステータス内訳と
+vision_limiter の待ち時間・再試行回数を表示する。--replay-dir を省略すると MOCK_RESPONSE を元にした
+合成の応答を使う。同じ画像の解析キャッシュが効かないよう VISION_CACHE_ENABLED は無効にする。
+
+    cd backend
+    python -m scripts.vision_replay export ./replay
+    python -m benchmarks.bench_scan_replay --replay-dir ./replay --latency empirical --requests 200 --concurrency 1 8 32
+    python -m benchmarks.bench_scan_replay --latency lognormal:2000:0.5 --error-rate 0.05 --rate-limit-rate 0.05
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+_tmpdir = tempfile.TemporaryDirectory()
+
+
+def _write_synthetic_responses(directory: Path, count: int = 20) -> None:
+    from app.services.vision_service import MOCK_RESPONSE
+
+    for i in range(count):
+        response = dict(MOCK_RESPONSE, total_amount=MOCK_RESPONSE["total_amount"] + i * 10)
+        items = MOCK_RESPONSE["items"] * (1 + i % 4)  # 応答サイズにばらつきを持たせる
+        text = json.dumps(dict(response, items=items), ensure_ascii=False, indent=2)
+        (directory / f"{i:03d}.txt").write_text(f"```json\n{text}\n```", encoding="utf-8")
+
+
+def _make_jpeg(seed: int) -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (900, 1400), (240, 240, 235 - seed % 20)).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+async def _run_level(client, images: list[bytes], requests: int, concurrency: int) -> tuple[float, list, Counter]:
+    from app.config import UPLOAD_DIR
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            files = {"file": (f"r{i}.jpg", images[i % len(images)], "image/jpeg")}
+            start = time.perf_counter()
+            response = await client.post("/api/receipts/scan", files=files)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] += 1
+            if response.status_code == 201:
+                body = response.json()
+                for path in (body["image_path"], body.get("thumbnail_path")):
+                    if path:
+                        (UPLOAD_DIR.parent / path.lstrip("/")).unlink(missing_ok=True)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+async def run(requests: int, concurrencies: list[int]) -> None:
+    import httpx
+
+    from app.main import app
+    from app.services.vision_limiter import vision_limiter
+    from app.services.vision_replay import get_replay_client
+
+    replay = get_replay_client()
+    print(f"VISION_REPLAY_DIR={os.environ['VISION_REPLAY_DIR']}（{len(replay.responses)} 件の応答）")
+    print(f"VISION_REPLAY_LATENCY={os.environ['VISION_REPLAY_LATENCY']}")
+    images = [_make_jpeg(i) for i in range(8)]
+    print(
+        f"{'concurrency':>11} {'elapsed(s)':>10} {'req/s':>7} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8}"
+        f" {'wait avg(ms)':>12} {'retries':>7}  status"
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in concurrencies:
+            vision_limiter.reset()
+            elapsed, latencies, statuses = await _run_level(client, images, requests, concurrency)
+            stats = vision_limiter.stats()
+            status_text = " ".join(f"{code}:{count}" for code, count in sorted(statuses.items()))
+            print(
+                f"{concurrency:>11} {elapsed:>10.2f} {requests / elapsed:>7.1f}"
+                f" {_percentile(latencies, 50):>8.0f} {_percentile(latencies, 95):>8.0f} {_percentile(latencies, 99):>8.0f}"
+                f" {stats['wait_avg_ms']:>12.1f} {stats['retries']:>7}  {status_text}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replay-dir", type=Path, help="raw_response の *.txt を置いたディレクトリ")
+    parser.add_argument("--latency", default="lognormal:3000:0.4", help="VISION_REPLAY_LATENCY の分布指定")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="529 を返す確率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 を返す確率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="途中で切れた応答を返す確率")
+    parser.add_argument("--rate-per-minute", type=float, help="VISION_RATE_PER_MINUTE（0 で無制限）")
+    parser.add_argument("--max-concurrency", type=int, help="VISION_MAX_CONCURRENCY")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # app の設定は import 時に読まれるため、先に環境変数を決める
+    replay_dir = args.replay_dir
+    if replay_dir is None:
+        replay_dir = Path(_tmpdir.name) / "replay"
+        replay_dir.mkdir()
+    os.environ.update({
+        "VISION_REPLAY_DIR": str(replay_dir),
+        "VISION_REPLAY_LATENCY": args.latency,
+        "VISION_REPLAY_ERROR_RATE": str(args.error_rate),
+        "VISION_REPLAY_429_RATE": str(args.rate_limit_rate),
+        "VISION_REPLAY_MALFORMED_RATE": str(args.malformed_rate),
+        "VISION_REPLAY_SEED": str(args.seed),
+        "VISION_CACHE_ENABLED": "false",
+        "MOCK_VISION": "",
+        "SCAN_JOB_WORKERS": "0",
+        "DATABASE_URL": f"sqlite:///{Path(_tmpdir.name) / 'bench.db'}",
+    })
+    if args.rate_per_minute is not None:
+        os.environ["VISION_RATE_PER_MINUTE"] = str(args.rate_per_minute)
+    if args.max_concurrency is not None:
+        os.environ["VISION_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    if args.replay_dir is None:
+        _write_synthetic_responses(replay_dir)
+
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""レシート検索の FTS5（trigram）と ILIKE の比較。
+
+大量のレシート・品目を一時DBに投入し、同じ検索語で
+旧方式（店名 ILIKE / 品目名を含めた ILIKE）と get_receipts の全文検索を計測する。
+
+    cd backend
+    python -m benchmarks.bench_search --rows 100000
+"""
+import argparse
+import datetime
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, exists, or_
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import search  # noqa: F401  receipts_fts を作成する
+from app.models.receipt import Receipt, ReceiptItem
+from app.services.receipt_service import get_receipts
+
+STORES = ["セブンイレブン", "ファミリーマート", "ローソン", "イオン", "マツモトキヨシ", "ENEOS", "ユニクロ", "紀伊國屋書店"]
+ITEMS = ["牛乳", "食パン", "おにぎり 鮭", "緑茶 500ml", "ヨーグルト", "洗剤", "ティッシュ", "歯ブラシ",
+         "ボールペン", "ガソリン", "シャンプー", "チョコレート", "カップラーメン", "コーヒー", "雑誌"]
+TERMS = ["牛乳", "チョコレート", "イオン", "ボールペン", "存在しない商品"]
+
+
+def seed(session_factory, rows: int) -> None:
+    rng = random.Random(0)
+    start = datetime.datetime(2023, 1, 1)
+    receipts, items = [], []
+    with session_factory() as db:
+        for i in range(1, rows + 1):
+            created = start + datetime.timedelta(minutes=i)
+            receipts.append({
+                "id": i,
+                "store_name": rng.choice(STORES),
+                "date": created.date(),
+                "total_amount": float(rng.randrange(100, 20000)),
+                "image_path": f"/uploads/{i}.jpg",
+                "created_at": created,
+                "updated_at": created,
+            })
+            items.extend({"receipt_id": i, "name": rng.choice(ITEMS), "quantity": 1} for _ in range(rng.randint(1, 6)))
+            if len(receipts) == 5000:
+                db.execute(Receipt.__table__.insert(), receipts)
+                db.execute(ReceiptItem.__table__.insert(), items)
+                receipts.clear()
+                items.clear()
+        if receipts:
+            db.execute(Receipt.__table__.insert(), receipts)
+            db.execute(ReceiptItem.__table__.insert(), items)
+        db.commit()
+
+
+def _legacy_store_ilike(db, term):
+    query = db.query(Receipt).filter(Receipt.store_name.ilike(f"%{term}%"))
+    return query.order_by(Receipt.created_at.desc()).limit(20).all(), query.count()
+
+
+def _legacy_items_ilike(db, term):
+    item_match = exists().where(ReceiptItem.receipt_id == Receipt.id, ReceiptItem.name.ilike(f"%{term}%"))
+    query = db.query(Receipt).filter(or_(Receipt.store_name.ilike(f"%{term}%"), item_match))
+    return query.order_by(Receipt.created_at.desc()).limit(20).all(), query.count()
+
+
+def _time(fn, repeat: int) -> tuple[float, int]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, total = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, total
+
+
+def run(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+
+        start = time.perf_counter()
+        seed(session_factory, rows)
+        print(f"seeded {rows} receipts in {time.perf_counter() - start:.1f}s")
+        print(f"{'term':<16} {'ILIKE store(ms)':>16} {'ILIKE +items(ms)':>17} {'FTS5(ms)':>10} {'FTS5 rel(ms)':>13} {'hits':>8}")
+
+        with session_factory() as db:
+            for term in TERMS:
+                store_ms, _ = _time(lambda: _legacy_store_ilike(db, term), repeat)
+                items_ms, _ = _time(lambda: _legacy_items_ilike(db, term), repeat)
+                fts_ms, hits = _time(lambda: get_receipts(db, search=term), repeat)
+                rel_ms, _ = _time(lambda: get_receipts(db, search=term, sort_by="relevance"), repeat)
+                print(f"{term:<16} {store_ms:>16.2f} {items_ms:>17.2f} {fts_ms:>10.2f} {rel_ms:>13.2f} {hits:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
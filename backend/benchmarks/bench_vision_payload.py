@@ -0,0 +1,89 @@
+"""Vision API 送信前の画像正規化による送信サイズと処理時間の比較。
+
+サンプル画像（--images で指定したディレクトリ、未指定ならスマホ写真相当の合成画像）を
+設定ごとに normalize_for_vision で変換し、送信バイト数（base64 後）と変換時間を計測する。
+
+    cd backend
+    python -m benchmarks.bench_vision_payload
+    python -m benchmarks.bench_vision_payload --images ./uploads --limit 20
+"""
+import argparse
+import io
+import statistics
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from app.services.image_service import normalize_for_vision
+
+# (ラベル, 長辺上限, グレースケール, 形式, 品質)
+CONFIGS = [
+    ("jpeg q85 1568px", 1568, False, "jpeg", 85),
+    ("jpeg q70 1568px", 1568, False, "jpeg", 70),
+    ("webp q80 1568px", 1568, False, "webp", 80),
+    ("gray jpeg q85", 1568, True, "jpeg", 85),
+    ("jpeg q85 1024px", 1024, False, "jpeg", 85),
+]
+
+# 合成サンプル: 12MP / 8MP / 3MP の縦長写真
+SYNTHETIC_SIZES = [(3024, 4032), (2448, 3264), (1536, 2048)]
+
+
+def synthetic_samples() -> list[tuple[str, bytes]]:
+    """レシート風（白地に文字行 + センサーノイズ）の JPEG を作る。"""
+    samples = []
+    for width, height in SYNTHETIC_SIZES:
+        noise = Image.effect_noise((width, height), 24).convert("RGB")
+        img = Image.blend(Image.new("RGB", (width, height), (235, 232, 225)), noise, 0.15)
+        draw = ImageDraw.Draw(img)
+        for y in range(height // 10, height - height // 10, height // 60):
+            draw.text((width // 8, y), "おにぎり 鮭    ¥150   x2   TOTAL ¥1,580", fill=(30, 30, 30))
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=92)
+        samples.append((f"synthetic {width}x{height}", buffer.getvalue()))
+    return samples
+
+
+def load_samples(directory: Path, limit: int) -> list[tuple[str, bytes]]:
+    paths = sorted(p for p in directory.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))
+    return [(p.name, p.read_bytes()) for p in paths[:limit]]
+
+
+def _b64_size(size: int) -> int:
+    return (size + 2) // 3 * 4
+
+
+def run(samples: list[tuple[str, bytes]], repeat: int) -> None:
+    original_total = sum(len(data) for _, data in samples)
+    print(f"{len(samples)} images, original total {original_total / 1024:.0f} KiB (base64 {_b64_size(original_total) / 1024:.0f} KiB)")
+    print(f"{'config':<18} {'sent KiB':>10} {'b64 KiB':>10} {'saved %':>8} {'median ms':>10} {'max ms':>8}")
+
+    for label, max_edge, grayscale, image_format, quality in CONFIGS:
+        sent_total = 0
+        timings = []
+        for _, data in samples:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                image = normalize_for_vision(data, max_edge, grayscale, image_format, quality)
+                timings.append((time.perf_counter() - start) * 1000)
+            sent_total += len(image.data)
+        saved = 100 * (1 - sent_total / original_total)
+        print(
+            f"{label:<18} {sent_total / 1024:>10.0f} {_b64_size(sent_total) / 1024:>10.0f} {saved:>8.1f} "
+            f"{statistics.median(timings):>10.1f} {max(timings):>8.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=Path, help="サンプル画像のディレクトリ（未指定なら合成画像）")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    samples = load_samples(args.images, args.limit) if args.images else synthetic_samples()
+    run(samples, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
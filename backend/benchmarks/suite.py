@@ -0,0 +1,353 @@
+"""バックエンドのホットパス全体のベンチマークスイート（ネットワーク不要）。
+
+レシート 10k / 100k / 1M 件のDBを用意し、一覧・検索・月次集計・CSVエクスポート・重複検索の
+サービス関数と API、カテゴリ推定・サムネイル生成・画像処理、単発スキャンの全工程
+（Vision は記録済み応答の再生で代替）を計測して、結果を JSON に書き出す。
+--compare に以前の結果を渡すと、ケースごとの中央値の比率を表示し、--threshold を超えて
+遅くなったケースがあれば終了コード 1 を返す（コミット間の比較用）。
+
+    cd backend
+    python -m benchmarks.suite                                        # 10k / 100k / 1M
+    python -m benchmarks.suite --sizes 10000 --repeat 3 --output bench-10k.json
+    python -m benchmarks.suite --cache-dir .bench-cache --compare bench-baseline.json
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+_tmpdir = tempfile.TemporaryDirectory()
+_replay_dir = Path(_tmpdir.name) / "replay"
+_replay_dir.mkdir()
+(_replay_dir / "receipt.txt").write_text(
+    "```json\n"
+    + json.dumps(
+        {
+            "store_name": "ベンチマート",
+            "date": "2024-05-01",
+            "total_amount": 1580,
+            "tax": 143,
+            "items": [{"name": "牛乳", "quantity": 1, "price": 230}, {"name": "食パン", "quantity": 2, "price": 180}],
+            "payment_method": "現金",
+            "category": None,
+        },
+        ensure_ascii=False,
+    )
+    + "\n```",
+    encoding="utf-8",
+)
+# app の設定は import 時に読まれるため、Vision は待ち時間なしの再生にし、付随するDB書き込みは一時DBへ向ける
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{Path(_tmpdir.name) / 'app.db'}",
+    "MOCK_VISION": "",
+    "VISION_REPLAY_DIR": str(_replay_dir),
+    "VISION_REPLAY_LATENCY": "fixed:0",
+    "VISION_CACHE_ENABLED": "false",
+    "VISION_RATE_PER_MINUTE": "0",
+    "SCAN_JOB_WORKERS": "0",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.config import UPLOAD_DIR  # noqa: E402
+from app.database import Base, get_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+from app.models.receipt import Receipt  # noqa: E402
+from app.services.category_service import classify_by_items, classify_receipts  # noqa: E402
+from app.services.duplicate_service import duplicate_index, find_duplicates  # noqa: E402
+from app.services.export_service import generate_csv, iter_csv  # noqa: E402
+from app.services.image_service import generate_thumbnail, process_image  # noqa: E402
+from app.services.receipt_service import encode_cursor, get_receipts, iter_receipt_batches  # noqa: E402
+from app.services.summary_cache import summary_cache  # noqa: E402
+from app.services.summary_service import get_available_months, get_monthly_summary  # noqa: E402
+from scripts.generate_dataset import ITEMS, generate  # noqa: E402
+
+# データセットの生成方法を変えたら上げる（--cache-dir の古いDBを使わないため）
+DATASET_VERSION = 2
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DATE_START = datetime.date(2022, 1, 1)
+DATE_DAYS = 3 * 365
+TARGET_MONTH = (2023, 6)
+SEARCH_TERM = "牛乳"
+
+
+def seed_database(path: Path, rows: int, seed: int = 0) -> None:
+    """scripts/generate_dataset.py の生成器で rows 件のレシートを投入する。"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    generate(engine, rows, seed=seed, start=DATE_START, days=DATE_DAYS)
+    engine.dispose()
+
+
+def prepare_database(rows: int, seed: int, cache_dir: Path | None) -> Path:
+    """データセットのDBを用意する。cache_dir があれば再利用する。"""
+    directory = cache_dir or Path(_tmpdir.name)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"receipts-{rows}-s{seed}-v{DATASET_VERSION}.db"
+    if path.exists():
+        print(f"[{rows}] データセットを再利用します: {path}")
+        return path
+    start = time.perf_counter()
+    partial = path.with_suffix(".part")
+    partial.unlink(missing_ok=True)
+    seed_database(partial, rows, seed)
+    partial.replace(path)
+    print(f"[{rows}] データセットを作成しました: {time.perf_counter() - start:.1f}s")
+    return path
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[], object]
+    setup: Callable[[], None] | None = None  # 各試行の前に実行する（計測しない）
+    teardown: Callable[[object], None] | None = None  # run の戻り値を受け取って後始末する（計測しない）
+
+
+def measure(case: Case, repeat: int, warmup: int = 1) -> list[float]:
+    samples = []
+    for i in range(warmup + repeat):
+        if case.setup:
+            case.setup()
+        start = time.perf_counter()
+        result = case.run()
+        elapsed = (time.perf_counter() - start) * 1000
+        if case.teardown:
+            case.teardown(result)
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+def summarize(name: str, rows: int | None, samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "name": name,
+        "rows": rows,
+        "repeat": len(samples),
+        "median_ms": round(statistics.median(ordered), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "min_ms": round(ordered[0], 3),
+        "max_ms": round(ordered[-1], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))], 3),
+    }
+
+
+def _sample_jpeg(size: tuple[int, int]) -> bytes:
+    buf = io.BytesIO()
+    Image.effect_noise(size, 32).convert("RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _month_range(year: int, month: int) -> tuple[datetime.date, datetime.date]:
+    first = datetime.date(year, month, 1)
+    return first, (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+
+
+def database_cases(session_factory, client: TestClient, rows: int, scan_image: bytes) -> list[Case]:
+    """データ件数に依存するケース（サービス関数と API）。"""
+    db = session_factory()
+    year, month = TARGET_MONTH
+    date_from, date_to = _month_range(year, month)
+    previous, _ = get_receipts(db, skip=rows // 2 - 1, limit=1)
+    middle_cursor = encode_cursor(previous[0], "created_at", "desc")
+    phash = db.query(Receipt.image_phash).filter(Receipt.id == rows // 2).scalar()
+    csv_receipts, _ = get_receipts(db, limit=1000)
+    csv_receipts += get_receipts(db, cursor=encode_cursor(csv_receipts[-1], "created_at", "desc"), limit=1000)[0]
+    month_params = {"date_from": date_from.isoformat(), "date_to": date_to.isoformat()}
+
+    def export_month():
+        return sum(len(chunk) for chunk in iter_csv(iter_receipt_batches(db, date_from=date_from, date_to=date_to)))
+
+    def scan():
+        response = client.post("/api/receipts/scan", files={"file": ("bench.jpg", scan_image, "image/jpeg")})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    return [
+        Case("service.get_receipts.first_page", lambda: get_receipts(db, limit=20)),
+        Case("service.get_receipts.category_month", lambda: get_receipts(
+            db, limit=20, category="食費", date_from=date_from, date_to=date_to)),
+        Case("service.get_receipts.deep_offset", lambda: get_receipts(db, skip=rows // 2, limit=20)),
+        Case("service.get_receipts.deep_cursor", lambda: get_receipts(db, limit=20, cursor=middle_cursor)),
+        Case("service.get_receipts.search", lambda: get_receipts(db, limit=20, search=SEARCH_TERM)),
+        Case("service.get_receipts.search_relevance", lambda: get_receipts(
+            db, limit=20, search=SEARCH_TERM, sort_by="relevance")),
+        Case("service.summary.monthly", lambda: get_monthly_summary(db, year, month), setup=summary_cache.clear),
+        Case("service.summary.monthly_cached", lambda: get_monthly_summary(db, year, month)),
+        Case("service.summary.monthly_list", lambda: get_available_months(db), setup=summary_cache.clear),
+        Case("service.export.iter_csv_month", export_month),
+        Case("service.export.generate_csv_2000", lambda: generate_csv(csv_receipts)),
+        Case("service.duplicates.index_build", lambda: find_duplicates(db, phash), setup=duplicate_index.reset),
+        Case("service.duplicates.find", lambda: find_duplicates(db, phash)),
+        Case("api.receipts.list", lambda: client.get("/api/receipts").raise_for_status()),
+        Case("api.receipts.list_filtered", lambda: client.get(
+            "/api/receipts", params={"category": "食費", **month_params}).raise_for_status()),
+        Case("api.receipts.search", lambda: client.get(
+            "/api/receipts", params={"search": SEARCH_TERM}).raise_for_status()),
+        Case("api.summary.monthly", lambda: client.get(
+            "/api/summary/monthly", params={"year": year, "month": month}).raise_for_status(),
+            setup=summary_cache.clear),
+        Case("api.summary.monthly_list", lambda: client.get("/api/summary/monthly-list").raise_for_status(),
+             setup=summary_cache.clear),
+        Case("api.receipts.export_csv_month", lambda: client.get(
+            "/api/receipts/export/csv", params=month_params).raise_for_status()),
+        Case("api.receipts.scan", scan, teardown=lambda receipt_id: client.delete(f"/api/receipts/{receipt_id}")),
+    ]
+
+
+def standalone_cases(image_path: str, image_file: Path) -> list[Case]:
+    """データ件数に依存しないケース（カテゴリ推定・画像処理）。"""
+    rng = random.Random(1)
+    pools = list(ITEMS)
+    receipts = [
+        [{"name": item[0], "price": 100} for item in rng.choices(ITEMS[rng.choice(pools)], k=rng.randint(1, 6))]
+        for _ in range(10_000)
+    ]
+
+    def remove_thumbnail(thumbnail_path):
+        if thumbnail_path:
+            (UPLOAD_DIR.parent / thumbnail_path.lstrip("/")).unlink(missing_ok=True)
+
+    return [
+        Case("category.classify_by_items", lambda: classify_by_items(receipts[0])),
+        Case("category.classify_receipts_10k", lambda: classify_receipts(receipts)),
+        Case("image.generate_thumbnail", lambda: generate_thumbnail(image_path), teardown=remove_thumbnail),
+        Case("image.process_image", lambda: process_image(image_file)),
+    ]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_result(result: dict) -> None:
+    rows = result["rows"] if result["rows"] is not None else "-"
+    print(f"{result['name']:<40} {rows:>9} {result['median_ms']:>11.2f} {result['p95_ms']:>11.2f}")
+
+
+def run(sizes: list[int], repeat: int, seed: int, cache_dir: Path | None, only: str | None) -> dict:
+    selected = (lambda name: re.search(only, name)) if only else (lambda name: True)
+    results = []
+    print(f"{'case':<40} {'rows':>9} {'median(ms)':>11} {'p95(ms)':>11}")
+
+    image_bytes = _sample_jpeg((3024, 4032))
+    image_file = UPLOAD_DIR / "bench-suite-source.jpg"
+    image_file.write_bytes(image_bytes)
+    try:
+        for case in standalone_cases(f"/uploads/{image_file.name}", image_file):
+            if selected(case.name):
+                results.append(summarize(case.name, None, measure(case, repeat)))
+                _print_result(results[-1])
+
+        scan_image = _sample_jpeg((1200, 1600))
+        client = TestClient(app)
+        for rows in sizes:
+            engine = create_engine(f"sqlite:///{prepare_database(rows, seed, cache_dir)}")
+            session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+            def override_get_db():
+                db = session_factory()
+                try:
+                    yield db
+                finally:
+                    db.close()
+
+            app.dependency_overrides[get_db] = override_get_db
+            duplicate_index.reset()
+            summary_cache.clear()
+            try:
+                for case in database_cases(session_factory, client, rows, scan_image):
+                    if selected(case.name):
+                        results.append(summarize(case.name, rows, measure(case, repeat)))
+                        _print_result(results[-1])
+            finally:
+                app.dependency_overrides.clear()
+                duplicate_index.reset()
+                engine.dispose()
+    finally:
+        image_file.unlink(missing_ok=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+            "dataset_version": DATASET_VERSION,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """中央値の比率を表示し、threshold 倍より遅くなったケース名を返す。"""
+    previous = {(r["name"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n比較対象: {baseline['meta'].get('commit')}（{baseline['meta'].get('timestamp')}）")
+    print(f"{'case':<40} {'rows':>9} {'before(ms)':>11} {'after(ms)':>11} {'ratio':>7}")
+    for result in current["results"]:
+        before = previous.get((result["name"], result["rows"]))
+        if before is None or before["median_ms"] <= 0:
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        flag = "  !" if ratio > threshold else ""
+        rows = result["rows"] if result["rows"] is not None else "-"
+        print(f"{result['name']:<40} {rows:>9} {before['median_ms']:>11.2f} {result['median_ms']:>11.2f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(f"{result['name']}@{rows}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-dir", type=Path, help="作成したデータセットのDBを保存・再利用するディレクトリ")
+    parser.add_argument("--only", help="ケース名の正規表現（一致するものだけ計測する）")
+    parser.add_argument("--output", type=Path, default=Path("bench-results.json"))
+    parser.add_argument("--compare", type=Path, help="比較する以前の結果（JSON）")
+    parser.add_argument("--threshold", type=float, default=1.2, help="この倍率より遅くなったら失敗とする")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.repeat, args.seed, args.cache_dir, args.only)
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n結果を書き出しました: {args.output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print(f"{args.threshold} 倍より遅くなったケース: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""レシート・品目の合成データを receipts.db に高速投入する（本番規模の再現用）。
+
+ORM を通さず Core の executemany で、--transaction-rows 件ごとの大きなトランザクションにまとめて書き込む。
+全文検索のトリガーは投入中だけ外して最後に一括で索引し直し、月次ロールアップも作り直す。
+同じ --seed なら同じデータになる。--images を付けると、レシートごとにプレースホルダー画像と
+サムネイルを uploads/ に書き出す（dHash も画像から計算する）。
+
+    cd backend
+    python -m scripts.generate_dataset --rows 1000000
+    python -m scripts.generate_dataset --rows 10000 --images --raw-response --replace
+    python -m scripts.generate_dataset --rows 100000 --database-url sqlite:///./big.db --start 2020-01-01 --days 1825
+"""
+import argparse
+import datetime
+import io
+import json
+import random
+import re
+import sys
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from sqlalchemy import Connection, Engine, create_engine, delete, func, select
+
+from app.config import CATEGORIES, DATABASE_URL, THUMBNAIL_DIR, UPLOAD_DIR
+from app.database import Base
+from app.migrations import run_migrations
+from app.models import search
+from app.models.receipt import Receipt, ReceiptItem
+from app.services.image_service import compute_dhash
+from app.services.rollup_service import rebuild_rollup
+
+# カテゴリの出現比率（None はカテゴリ未判定のレシート）
+CATEGORY_WEIGHTS: dict[str | None, int] = {
+    "食費": 40, "交通費": 8, "日用品": 10, "医療費": 4, "通信費": 2, "光熱費": 3, "交際費": 3, "衣服・美容": 6,
+    "教育・書籍": 4, "娯楽・趣味": 6, "住居費": 1, "保険": 1, "税金": 1, "雑費": 4, "その他": 4, None: 3,
+}
+
+STORES: dict[str, list[str]] = {
+    "食費": ["セブンイレブン", "ファミリーマート", "ローソン", "イオン", "西友", "ライフ", "成城石井", "業務スーパー",
+           "すき家", "松屋", "サイゼリヤ", "スターバックス", "ドトールコーヒー", "マクドナルド"],
+    "交通費": ["ENEOS", "出光", "JR東日本", "東京メトロ", "日本交通", "タイムズ駐車場", "NEXCO東日本"],
+    "日用品": ["マツモトキヨシ", "ウエルシア", "ダイソー", "セリア", "カインズ", "コーナン", "無印良品"],
+    "医療費": ["さくら薬局", "日本調剤", "中央クリニック", "あおば歯科"],
+    "通信費": ["ドコモショップ", "auショップ", "ソフトバンクショップ"],
+    "光熱費": ["東京電力", "東京ガス", "水道局"],
+    "交際費": ["高島屋", "日比谷花壇", "鳥貴族", "和民"],
+    "衣服・美容": ["ユニクロ", "GU", "しまむら", "ZARA", "ホワイト急便", "ヘアサロン Lien"],
+    "教育・書籍": ["紀伊國屋書店", "丸善", "ジュンク堂書店", "ロフト", "ブックオフ"],
+    "娯楽・趣味": ["TOHOシネマズ", "ヨドバシカメラ", "ビックカメラ", "ラウンドワン", "アニメイト"],
+    "住居費": ["ニトリ", "IKEA", "東急ハンズ"],
+    "保険": ["日本生命", "東京海上日動"],
+    "税金": ["渋谷区役所", "郵便局"],
+    "雑費": ["ヤマト運輸", "郵便局", "コインランドリー"],
+    "その他": ["有限会社 山田商店", "マルシェ", "自動販売機"],
+}
+
+# 品目名と単価の範囲（円）
+ITEMS: dict[str, list[tuple[str, int, int]]] = {
+    "食費": [("牛乳", 180, 280), ("食パン", 120, 300), ("おにぎり 鮭", 130, 180), ("緑茶 500ml", 100, 160),
+           ("ヨーグルト", 100, 250), ("卵 10個", 200, 350), ("鶏むね肉", 300, 800), ("キャベツ", 100, 300),
+           ("カップラーメン", 150, 250), ("チョコレート", 100, 300), ("コーヒー", 150, 600), ("弁当", 400, 900),
+           ("牛丼 並盛", 400, 600), ("ランチセット", 800, 1500)],
+    "交通費": [("レギュラーガソリン", 3000, 8000), ("乗車券", 150, 2500), ("タクシー運賃", 800, 6000),
+             ("駐車料金", 300, 2000), ("高速料金", 500, 4000)],
+    "日用品": [("洗剤", 200, 600), ("ティッシュ", 200, 500), ("歯ブラシ", 100, 400), ("シャンプー", 400, 1500),
+             ("トイレットペーパー", 300, 700), ("収納ケース", 100, 1500)],
+    "医療費": [("処方薬", 300, 3000), ("診察料", 1000, 5000), ("目薬", 400, 1200), ("湿布", 500, 1500)],
+    "通信費": [("携帯電話料金", 2000, 9000), ("機種代金分割", 1000, 5000)],
+    "光熱費": [("電気料金", 3000, 15000), ("ガス料金", 2000, 9000), ("水道料金", 2000, 6000)],
+    "交際費": [("贈答品", 3000, 10000), ("花束", 2000, 6000), ("飲み会", 3000, 8000)],
+    "衣服・美容": [("Tシャツ", 990, 2990), ("靴下", 300, 990), ("ジーンズ", 2990, 6990), ("カット", 3000, 7000),
+              ("クリーニング", 300, 1200)],
+    "教育・書籍": [("文庫本", 600, 1200), ("雑誌", 500, 1200), ("技術書", 2500, 5000), ("ボールペン", 100, 300),
+              ("ノート", 150, 500)],
+    "娯楽・趣味": [("映画鑑賞券", 1500, 2000), ("ゲームソフト", 3000, 8000), ("ポップコーン", 500, 800),
+              ("カラオケ", 1000, 3000), ("イヤホン", 2000, 15000)],
+    "住居費": [("カーテン", 2000, 8000), ("照明器具", 3000, 12000), ("家賃", 60000, 120000)],
+    "保険": [("保険料", 3000, 20000)],
+    "税金": [("住民税", 5000, 40000), ("収入印紙", 200, 2000)],
+    "雑費": [("宅急便", 800, 2000), ("切手", 84, 500), ("コインランドリー", 300, 1000)],
+    "その他": [("商品", 100, 3000), ("飲料", 110, 200)],
+}
+
+# 1枚あたりの品目数の分布（食費は多く、公共料金などは1件）
+ITEM_COUNT_WEIGHTS = {
+    "食費": [(1, 20), (2, 18), (3, 15), (4, 12), (5, 10), (6, 8), (8, 8), (10, 5), (14, 4)],
+    "日用品": [(1, 35), (2, 30), (3, 20), (5, 15)],
+    "default": [(1, 60), (2, 25), (3, 15)],
+    "single": [(1, 1)],
+}
+SINGLE_ITEM_CATEGORIES = {"通信費", "光熱費", "保険", "税金", "住居費"}
+PAYMENT_METHODS = [("現金", 35), ("クレジットカード", 35), ("電子マネー", 15), ("QRコード決済", 13), ("不明", 2)]
+REDUCED_TAX_CATEGORIES = {"食費"}  # 軽減税率（8%）
+
+THUMBNAIL_SIZE = (200, 200)
+
+
+@dataclass
+class GenerationStats:
+    receipts: int = 0
+    items: int = 0
+    images: int = 0
+    phases: dict[str, float] = field(default_factory=dict)  # 段階ごとの所要時間（秒）
+
+    @property
+    def rows(self) -> int:
+        return self.receipts + self.items
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.phases.values())
+
+
+def _weighted(rng: random.Random, pairs: list[tuple]) -> object:
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+
+class ReceiptFactory:
+    """seed から決定的にレシートと品目の行を作る。"""
+
+    def __init__(self, seed: int, start: datetime.date, days: int, rows: int, raw_response: bool = False):
+        self.rng = random.Random(seed)
+        self.start = datetime.datetime.combine(start, datetime.time())
+        self.days = days
+        self.rows = rows
+        self.raw_response = raw_response
+        self._categories = list(CATEGORY_WEIGHTS.items())
+        unknown = [c for c in CATEGORIES if c not in STORES]
+        if unknown:
+            raise ValueError(f"合成データの定義がないカテゴリがあります: {unknown}")
+
+    def _date(self, index: int) -> datetime.date:
+        """期間全体に均等に散らしつつ、前後数日ぶれさせる。週末は少し多め。"""
+        rng = self.rng
+        offset = int(index * self.days / self.rows + rng.uniform(-2, 2))
+        day = self.start + datetime.timedelta(days=offset)
+        if day.weekday() < 5 and rng.random() < 0.15:  # 平日の一部を直後の土日へ寄せる
+            offset += 5 - day.weekday() + rng.randint(0, 1)
+        return (self.start + datetime.timedelta(days=min(max(offset, 0), self.days - 1))).date()
+
+    def make(self, receipt_id: int, index: int) -> tuple[dict, list[dict]]:
+        rng = self.rng
+        category = _weighted(rng, self._categories)
+        pool = category or rng.choice(list(STORES))
+        store = rng.choice(STORES[pool])
+
+        count_key = "single" if pool in SINGLE_ITEM_CATEGORIES else pool if pool in ITEM_COUNT_WEIGHTS else "default"
+        items = []
+        for name, low, high in rng.choices(ITEMS[pool], k=_weighted(rng, ITEM_COUNT_WEIGHTS[count_key])):
+            quantity = 1 if rng.random() < 0.85 else rng.randint(2, 4)
+            price = float(round(rng.uniform(low, high), -1 if high >= 1000 else 0))
+            items.append({"receipt_id": receipt_id, "name": name, "quantity": float(quantity), "price": price})
+        total = sum(item["price"] * item["quantity"] for item in items)
+        tax_rate = 0.08 if pool in REDUCED_TAX_CATEGORIES else 0.10
+        tax = float(int(total * tax_rate / (1 + tax_rate)))
+
+        receipt_date = self._date(index)
+        scanned = datetime.datetime.combine(receipt_date, datetime.time(rng.randint(8, 22), rng.randint(0, 59)))
+        scanned += datetime.timedelta(days=rng.choice([0, 0, 0, 1, 1, 2, 7]), seconds=rng.randint(0, 3599))
+        payment = _weighted(rng, PAYMENT_METHODS)
+        receipt = {
+            "id": receipt_id,
+            "store_name": store,
+            "date": receipt_date,
+            "total_amount": total,
+            "tax": tax,
+            "payment_method": payment,
+            "category": category,
+            "image_path": f"/uploads/gen-{receipt_id:08d}.jpg",
+            "thumbnail_path": None,
+            "image_phash": f"{rng.getrandbits(64):016x}",
+            "raw_response": None,
+            "created_at": scanned,
+            "updated_at": scanned,
+        }
+        if self.raw_response:
+            receipt["raw_response"] = json.dumps({
+                "store_name": store,
+                "date": receipt_date.isoformat(),
+                "total_amount": total,
+                "tax": tax,
+                "items": [{k: item[k] for k in ("name", "quantity", "price")} for item in items],
+                "payment_method": payment,
+                "category": category,
+            }, ensure_ascii=False)
+        return receipt, items
+
+
+def placeholder_image(rng: random.Random, lines: int) -> Image.Image:
+    """レシート風のプレースホルダー画像（白地に行ごとの灰色の帯）。帯の長さで dHash がばらつく。"""
+    img = Image.new("L", (360, 120 + lines * 36), 250)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40, 24, 40 + rng.randint(120, 280), 52), fill=60)  # 店名
+    for line in range(lines + 2):
+        top = 84 + line * 36
+        draw.rectangle((24, top, 24 + rng.randint(80, 220), top + 14), fill=rng.randint(90, 150))
+        draw.rectangle((260, top, 260 + rng.randint(40, 76), top + 14), fill=rng.randint(90, 150))
+    return img
+
+
+def write_images(receipt: dict, items: list[dict], rng: random.Random) -> None:
+    """プレースホルダー画像とサムネイルを書き出し、receipt のパスと dHash を更新する。"""
+    img = placeholder_image(rng, len(items))
+    name = Path(receipt["image_path"]).name
+    img.save(UPLOAD_DIR / name, "JPEG", quality=80)
+    receipt["image_phash"] = compute_dhash(img)
+    img.thumbnail(THUMBNAIL_SIZE)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    (THUMBNAIL_DIR / name).write_bytes(buf.getvalue())
+    receipt["thumbnail_path"] = f"/uploads/thumbs/{name}"
+
+
+def _fts_triggers() -> list[str]:
+    return [re.search(r"EXISTS (\w+)", statement).group(1) for statement in search.CREATE_STATEMENTS[1:]]
+
+
+def _generate_rows(factory: ReceiptFactory, first_id: int, rows: int, images: bool) -> Iterator[tuple[dict, list]]:
+    image_rng = random.Random(factory.rng.random())
+    for index in range(rows):
+        receipt, items = factory.make(first_id + index, index)
+        if images:
+            write_images(receipt, items, image_rng)
+        yield receipt, items
+
+
+def generate(
+    engine: Engine,
+    rows: int,
+    seed: int = 0,
+    start: datetime.date = datetime.date(2022, 1, 1),
+    days: int = 3 * 365,
+    images: bool = False,
+    raw_response: bool = False,
+    chunk_size: int = 10_000,
+    transaction_rows: int = 200_000,
+    replace: bool = False,
+    progress: Callable[[GenerationStats, float], None] | None = None,
+) -> GenerationStats:
+    """rows 件のレシートを投入する。既存のレシートは replace=True なら削除し、そうでなければ続きのIDで追加する。
+
+    progress(stats, 経過秒) はトランザクションをコミットするたびに呼ばれる。
+    """
+    stats = GenerationStats()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        conn.exec_driver_sql("PRAGMA cache_size=-200000")  # 約200MB
+        conn.commit()
+        with conn.begin():
+            for name in _fts_triggers():
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+            if replace:
+                conn.execute(delete(ReceiptItem))
+                conn.execute(delete(Receipt))
+            first_id = (conn.execute(select(func.max(Receipt.id))).scalar() or 0) + 1
+
+        started = time.perf_counter()
+        try:
+            factory = ReceiptFactory(seed, start, days, rows, raw_response)
+            receipts, items = [], []
+            transaction = conn.begin()
+            in_transaction = 0
+            for receipt, receipt_items in _generate_rows(factory, first_id, rows, images):
+                receipts.append(receipt)
+                items.extend(receipt_items)
+                if len(receipts) < chunk_size:
+                    continue
+                _insert(conn, receipts, items, stats, images)
+                in_transaction += len(receipts)
+                receipts, items = [], []
+                if in_transaction >= transaction_rows:
+                    transaction.commit()
+                    if progress:
+                        progress(stats, time.perf_counter() - started)
+                    transaction = conn.begin()
+                    in_transaction = 0
+            if receipts:
+                _insert(conn, receipts, items, stats, images)
+            transaction.commit()
+            if progress:
+                progress(stats, time.perf_counter() - started)
+        finally:
+            stats.phases["insert"] = time.perf_counter() - started
+            # 途中で失敗しても全文検索のトリガーは必ず戻す（失敗したトランザクションは先に巻き戻す）
+            if conn.in_transaction():
+                conn.rollback()
+            phase = time.perf_counter()
+            with conn.begin():
+                for statement in search.REBUILD_STATEMENTS + search.CREATE_STATEMENTS:
+                    conn.exec_driver_sql(statement)
+            stats.phases["search_index"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        with conn.begin():
+            rebuild_rollup(conn)
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+        stats.phases["rollup"] = time.perf_counter() - phase
+    return stats
+
+
+def _insert(conn: Connection, receipts: list[dict], items: list[dict], stats: GenerationStats, images: bool) -> None:
+    conn.execute(Receipt.__table__.insert(), receipts)
+    conn.execute(ReceiptItem.__table__.insert(), items)
+    stats.receipts += len(receipts)
+    stats.items += len(items)
+    if images:
+        stats.images += len(receipts)
+
+
+def _print_progress(total: int) -> Callable[[GenerationStats, float], None]:
+    def report(stats: GenerationStats, elapsed: float) -> None:
+        print(
+            f"  {stats.receipts:>10,} / {total:,} 件  "
+            f"{stats.receipts / elapsed:>9,.0f} receipts/s  {stats.rows / elapsed:>9,.0f} rows/s",
+            flush=True,
+        )
+
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, required=True, help="投入するレシート数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2022, 1, 1), help="最初の日付")
+    parser.add_argument("--days", type=int, default=3 * 365, help="日付を散らす日数")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--replace", action="store_true", help="既存のレシートを削除してから投入する")
+    parser.add_argument("--images", action="store_true", help="プレースホルダー画像とサムネイルを書き出す")
+    parser.add_argument("--raw-response", action="store_true", help="raw_response に解析結果の JSON を入れる")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="executemany 1回あたりのレシート数")
+    parser.add_argument("--transaction-rows", type=int, default=200_000, help="1トランザクションあたりのレシート数")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    print(f"{args.database_url} に {args.rows:,} 件を投入します（seed={args.seed}）")
+    stats = generate(
+        engine,
+        args.rows,
+        seed=args.seed,
+        start=args.start,
+        days=args.days,
+        images=args.images,
+        raw_response=args.raw_response,
+        chunk_size=args.chunk_size,
+        transaction_rows=args.transaction_rows,
+        replace=args.replace,
+        progress=_print_progress(args.rows),
+    )
+    insert_seconds = stats.phases["insert"]
+    print(
+        f"レシート {stats.receipts:,} 件・品目 {stats.items:,} 件・画像 {stats.images:,} 件を投入しました "
+        f"（投入 {insert_seconds:.1f}s: {stats.receipts / insert_seconds:,.0f} receipts/s, "
+        f"{stats.rows / insert_seconds:,.0f} rows/s）"
+    )
+    print(
+        f"全文検索の索引 {stats.phases['search_index']:.1f}s・月次ロールアップ {stats.phases['rollup']:.1f}s、"
+        f"合計 {stats.seconds:.1f}s（{stats.rows / stats.seconds:,.0f} rows/s）"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""月次ロールアップ（monthly_category_totals）の再構築・整合性チェック。
+
+    cd backend
+    python -m scripts.rollup rebuild   # receipts から作り直す
+    python -m scripts.rollup check     # receipts からの集計と比較する（不一致があれば終了コード 1）
+"""
+import argparse
+import sys
+
+from app.database import Base, SessionLocal, engine
+from app.migrations import run_migrations
+from app.services.rollup_service import check_consistency, rebuild_rollup
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rows = rebuild_rollup(db)
+            db.commit()
+            print(f"monthly_category_totals を再構築しました: {rows} 行")
+            return 0
+
+        mismatches = check_consistency(db)
+        for m in mismatches:
+            print(
+                f"{m.year}-{m.month:02d} {m.category}: "
+                f"receipts={m.expected[0]:.2f}/{m.expected[1]}件 rollup={m.actual[0]:.2f}/{m.actual[1]}件"
+            )
+        print("整合性チェック: " + ("OK" if not mismatches else f"{len(mismatches)} 件の不一致"))
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Vision 再生バックエンド（VISION_REPLAY_DIR）用の記録を receipts から書き出す。
+
+    cd backend
+    python -m scripts.vision_replay export ./replay            # raw_response と API レイテンシを書き出す
+    python -m scripts.vision_replay export ./replay --limit 500
+
+raw_response は <レシートID>.txt に1件ずつ、レイテンシ（ミリ秒）は latencies_ms.txt に1行1値で書き出す。
+レイテンシは vision_usage の成功した同期呼び出しから取り、無ければ receipts.scan_metadata から取る。
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from app.database import Base, SessionLocal, engine
+from app.migrations import run_migrations
+from app.models.receipt import Receipt
+from app.models.vision_usage import VisionUsage
+from app.services.vision_replay import LATENCY_FILE
+
+
+def export(out_dir: Path, limit: int | None) -> tuple[int, int]:
+    """raw_response とレイテンシを out_dir に書き出し、(レスポンス数, レイテンシ数) を返す。"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(Receipt.id, Receipt.raw_response, Receipt.scan_metadata)
+            .filter(Receipt.raw_response.isnot(None))
+            .order_by(Receipt.id.desc())
+        )
+        if limit:
+            query = query.limit(limit)
+        responses = 0
+        metadata_latencies = []
+        for receipt_id, raw_response, scan_metadata in query:
+            (out_dir / f"{receipt_id}.txt").write_text(raw_response, encoding="utf-8")
+            responses += 1
+            latency = ((scan_metadata or {}).get("vision") or {}).get("api_latency_ms")
+            if latency is not None:
+                metadata_latencies.append(latency)
+
+        usage_query = (
+            db.query(VisionUsage.latency_ms)
+            .filter(VisionUsage.status == "ok", VisionUsage.mode == "sync", VisionUsage.latency_ms.isnot(None))
+            .order_by(VisionUsage.id.desc())
+        )
+        if limit:
+            usage_query = usage_query.limit(limit)
+        latencies = [latency for (latency,) in usage_query] or metadata_latencies
+    finally:
+        db.close()
+
+    if latencies:
+        (out_dir / LATENCY_FILE).write_text("".join(f"{v}\n" for v in latencies), encoding="utf-8")
+    return responses, len(latencies)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--limit", type=int, help="新しいものから書き出す件数")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    responses, latencies = export(args.out_dir, args.limit)
+    print(f"{args.out_dir} に書き出しました: raw_response {responses} 件、レイテンシ {latencies} 件")
+    if latencies == 0:
+        print(f"レイテンシの記録がないため {LATENCY_FILE} は作成していません（empirical 以外の分布を指定してください）")
+    return 0 if responses else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
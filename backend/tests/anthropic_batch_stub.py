@@ -0,0 +1,133 @@
+"""Message Batches API を模したローカル HTTP サーバー（テスト用）。
+
+POST /v1/messages/batches でバッチを受け付け、GET /v1/messages/batches/{id} を
+polls_until_ended 回呼ばれるまでは in_progress、それ以降は ended として返す。
+結果（JSONL）は responder(custom_id, params) が返す result を使う。
+"""
+import json
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anthropic
+
+RECEIPT_TEXT = json.dumps(
+    {"store_name": "一括テスト店", "date": "2024-03-01", "total_amount": 980, "items": [{"name": "牛乳", "price": 980}]},
+    ensure_ascii=False,
+)
+
+
+def succeeded(text: str = RECEIPT_TEXT) -> dict:
+    return {
+        "type": "succeeded",
+        "message": {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "model": "claude-stub",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 1200, "output_tokens": 150},
+        },
+    }
+
+
+def errored(message: str = "overloaded") -> dict:
+    return {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": message}}}
+
+
+class BatchStubServer:
+    def __init__(
+        self,
+        responder: Callable[[str, dict], dict | None] = lambda custom_id, params: succeeded(),
+        polls_until_ended: int = 1,
+        fail_create: bool = False,
+    ):
+        self.responder = responder
+        self.polls_until_ended = polls_until_ended
+        self.fail_create = fail_create
+        self.batches: dict[str, dict] = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def client(self) -> anthropic.AsyncAnthropic:
+        return anthropic.AsyncAnthropic(api_key="sk-test", base_url=self.url, max_retries=0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _batch_json(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = batch["polls"] > self.polls_until_ended
+        count = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T01:00:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path != "/v1/messages/batches":
+                    return self._send(404, b"{}")
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if stub.fail_create:
+                    error = {"type": "error", "error": {"type": "api_error", "message": "stub failure"}}
+                    return self._send(500, json.dumps(error).encode())
+                batch_id = f"msgbatch_stub_{len(stub.batches) + 1}"
+                stub.batches[batch_id] = {"requests": body["requests"], "polls": 0}
+                self._send(200, json.dumps(stub._batch_json(batch_id)).encode())
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if parts[:3] != ["v1", "messages", "batches"] or len(parts) < 4 or parts[3] not in stub.batches:
+                    return self._send(404, b"{}")
+                batch_id = parts[3]
+                if len(parts) == 5 and parts[4] == "results":
+                    lines = []
+                    for request in stub.batches[batch_id]["requests"]:
+                        result = stub.responder(request["custom_id"], request["params"])
+                        if result is not None:
+                            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+                    return self._send(200, "\n".join(lines).encode(), "application/binary")
+                stub.batches[batch_id]["polls"] += 1
+                self._send(200, json.dumps(stub._batch_json(batch_id)).encode())
+
+        return Handler
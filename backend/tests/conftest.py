@@ -6,6 +6,10 @@ from sqlalchemy.pool import StaticPool
 
 from app.database import Base, get_db
 from app.main import app
+from app.services.duplicate_service import duplicate_index
+from app.services.metrics import registry
+from app.services.summary_cache import summary_cache
+from app.services.vision_limiter import vision_limiter
 
 engine = create_engine(
     "sqlite:///:memory:",
@@ -18,6 +22,10 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 @pytest.fixture(autouse=True)
 def setup_db():
     Base.metadata.create_all(bind=engine)
+    duplicate_index.reset()
+    summary_cache.clear()
+    vision_limiter.reset()
+    registry.reset()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -1,5 +1,10 @@
 """カテゴリ分類ロジックのテスト"""
-from app.services.category_service import classify_by_items
+import random
+
+import pytest
+
+from app.services import category_service
+from app.services.category_service import KeywordMatcher, classify_by_items, classify_receipts
 
 
 def test_classify_food_items():
@@ -49,3 +54,59 @@ def test_classify_unknown_items_returns_none():
 def test_classify_empty_items_returns_none():
     """空リストの場合は None が返ること"""
     assert classify_by_items([]) is None
+
+
+def _naive_first_match(keyword_map, name):
+    for keyword, category in keyword_map.items():
+        if keyword in name:
+            return category
+    return None
+
+
+def test_matcher_matches_naive_scan():
+    """オートマトンの結果が辞書を先頭から走査した場合と一致すること"""
+    rng = random.Random(0)
+    alphabet = "abcde"
+    keyword_map = {
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))): f"cat{i}"
+        for i in range(200)
+    }
+    matcher = KeywordMatcher(keyword_map)
+
+    for _ in range(500):
+        name = "".join(rng.choice(alphabet + "xyz") for _ in range(rng.randint(0, 12)))
+        assert matcher.first_match(name) == _naive_first_match(keyword_map, name)
+
+
+def test_matcher_prefers_earlier_keyword_over_earlier_position():
+    """文字列中の出現位置ではなく辞書順で最初のキーワードが優先されること"""
+    matcher = KeywordMatcher({"ビール": "酒類", "缶": "容器"})
+    assert matcher.first_match("缶ビール") == "酒類"
+
+
+def test_load_keyword_map_replaces_matcher():
+    """辞書の差し替え後は新しいキーワードで分類されること"""
+    original = dict(category_service.KEYWORD_MAP)
+    try:
+        category_service.load_keyword_map({"ガソリン": "車両費"})
+        assert classify_by_items([{"name": "レギュラーガソリン"}]) == "車両費"
+        assert classify_by_items([{"name": "おにぎり"}]) is None
+    finally:
+        category_service.load_keyword_map(original)
+
+
+def test_load_keyword_map_rejects_empty_keyword():
+    """空のキーワードを含む辞書は拒否し、元の辞書のまま分類されること"""
+    with pytest.raises(ValueError):
+        category_service.load_keyword_map({"ガソリン": "車両費", "": "雑費"})
+    assert classify_by_items([{"name": "洗剤"}]) == "日用品"
+
+
+def test_classify_receipts_keeps_order():
+    """複数レシートの分類結果が入力順で返ること"""
+    results = classify_receipts([
+        [{"name": "タクシー料金"}],
+        [{"name": "不明な品"}],
+        [{"name": "洗剤"}],
+    ])
+    assert results == ["交通費", None, "日用品"]
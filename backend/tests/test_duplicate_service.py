@@ -0,0 +1,83 @@
+"""知覚ハッシュによる重複検出のテスト"""
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from app.schemas.receipt import VisionResponse
+from app.services.duplicate_service import BKTree, find_duplicates, hamming_distance
+from app.services.image_service import compute_dhash
+from app.services.receipt_service import create_receipt, delete_receipt
+
+
+def _receipt_image(seed: int, size=(400, 600), fmt="JPEG") -> bytes:
+    rng = random.Random(seed)
+    img = Image.new("RGB", (400, 600), "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rng.randrange(380), rng.randrange(580)
+        draw.rectangle([x, y, x + rng.randrange(20, 200), y + 8], fill="black")
+    buf = io.BytesIO()
+    img.resize(size).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_dhash_is_stable_across_resize_and_format():
+    """同じ画像のリサイズ・形式違いは近く、別画像は遠いこと"""
+    original = int(compute_dhash(_receipt_image(1)), 16)
+    resized = int(compute_dhash(_receipt_image(1, size=(300, 450), fmt="PNG")), 16)
+    other = int(compute_dhash(_receipt_image(2)), 16)
+
+    assert hamming_distance(original, resized) <= 6
+    assert hamming_distance(original, other) > 10
+
+
+def test_bktree_matches_brute_force():
+    """BK-tree の探索結果が全件走査と一致すること"""
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for receipt_id, value in enumerate(values):
+        tree.add(value, receipt_id)
+
+    query = values[10] ^ 0b1011  # 3bit 違い
+    expected = sorted(
+        (hamming_distance(query, v), receipt_id)
+        for receipt_id, v in enumerate(values)
+        if hamming_distance(query, v) <= 12
+    )
+    assert tree.search(query, 12) == expected
+
+    tree.remove(values[10], 10)
+    assert (3, 10) not in tree.search(query, 12)
+    assert len(tree) == 499
+
+
+def test_find_duplicates_tracks_create_and_delete(db, tmp_path):
+    """作成したレシートが候補に現れ、削除後は現れないこと"""
+    phash = compute_dhash(_receipt_image(1))
+    vision = VisionResponse(store_name="テスト店", total_amount=500)
+    receipt = create_receipt(db, "/uploads/a.jpg", vision, "{}", image_phash=phash)
+
+    near = compute_dhash(_receipt_image(1, size=(300, 450)))
+    candidates = find_duplicates(db, near)
+    assert [c.receipt_id for c in candidates] == [receipt.id]
+    assert candidates[0].store_name == "テスト店"
+
+    delete_receipt(db, receipt, tmp_path)
+    assert find_duplicates(db, near) == []
+
+
+def test_duplicate_check_endpoint(client, db):
+    """重複チェックAPIが保存せずに近いレシートを返すこと"""
+    vision = VisionResponse(store_name="テスト店")
+    receipt = create_receipt(db, "/uploads/a.jpg", vision, "{}", image_phash=compute_dhash(_receipt_image(1)))
+
+    files = {"file": ("again.png", _receipt_image(1, size=(300, 450), fmt="PNG"), "image/png")}
+    response = client.post("/api/receipts/duplicates", files=files)
+    assert response.status_code == 200
+    assert [d["receipt_id"] for d in response.json()["duplicates"]] == [receipt.id]
+
+    response = client.get(f"/api/receipts/{receipt.id}/duplicates")
+    assert response.status_code == 200
+    assert response.json() == []
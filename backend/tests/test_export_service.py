@@ -1,8 +1,10 @@
 """CSV生成ロジックのテスト"""
 import datetime
+from unittest.mock import patch
 
 from app.models.receipt import Receipt, ReceiptItem
-from app.services.export_service import generate_csv
+from app.services.export_service import generate_csv, iter_csv
+from app.services.receipt_service import iter_receipt_batches
 
 
 def test_generate_csv_with_receipts(db):
@@ -40,3 +42,48 @@ def test_generate_csv_empty():
     lines = csv_content.strip().split("\n")
     assert len(lines) == 1  # ヘッダーのみ
     assert "ID" in lines[0]
+
+
+def _add_receipts(db, count):
+    for i in range(count):
+        receipt = Receipt(store_name=f"店{i}", total_amount=100 + i, image_path=f"/uploads/{i}.jpg")
+        receipt.items.append(ReceiptItem(name=f"品{i}", quantity=1, price=100))
+        db.add(receipt)
+    db.commit()
+
+
+def test_iter_csv_matches_generate_csv(db):
+    """ストリーミング出力を連結すると generate_csv と同じ内容になること"""
+    _add_receipts(db, 5)
+    receipts = db.query(Receipt).order_by(Receipt.id).all()
+
+    chunks = list(iter_csv([receipts[:2], receipts[2:]]))
+
+    assert len(chunks) == 3  # ヘッダー + 2バッチ
+    assert b"".join(chunks).decode("utf-8") == generate_csv(receipts)
+
+
+def test_iter_receipt_batches_reads_all_rows_in_batches(db):
+    """件数上限なしで、指定サイズのバッチに分けて全件返すこと"""
+    _add_receipts(db, 7)
+
+    batches = list(iter_receipt_batches(db, sort_by="total_amount", sort_order="asc", batch_size=3))
+
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert [r.total_amount for b in batches for r in b] == [100 + i for i in range(7)]
+    assert batches[-1][0].items[0].name == "品6"
+
+
+def test_export_csv_endpoint_streams_all_rows(client, db):
+    """エクスポートAPIがバッチサイズを超える件数を全件出力すること"""
+    _add_receipts(db, 5)
+
+    with patch("app.services.receipt_service.EXPORT_BATCH_SIZE", 2):
+        response = client.get("/api/receipts/export/csv", params={"sort_order": "asc"})
+
+    assert response.status_code == 200
+    text = response.content.decode("utf-8")
+    assert text.startswith("\ufeff")
+    lines = text.strip().split("\n")
+    assert len(lines) == 6
+    assert "店0" in lines[1]
@@ -0,0 +1,60 @@
+"""合成データ生成スクリプトのテスト"""
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+
+from app.database import Base
+from app.migrations import run_migrations
+from app.models import search
+from app.models.monthly_category_total import MonthlyCategoryTotal
+from app.models.receipt import Receipt
+from scripts import generate_dataset
+from scripts.generate_dataset import generate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'gen.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    yield engine
+    engine.dispose()
+
+
+def _trigger_count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'")).scalar()
+
+
+def test_generate_inserts_receipts_and_rebuilds_indexes(engine):
+    """指定件数が投入され、全文検索のトリガーと月次ロールアップが作り直されること"""
+    triggers = _trigger_count(engine)
+    stats = generate(engine, 300, seed=1, chunk_size=100, transaction_rows=200)
+
+    assert stats.receipts == 300 and stats.items >= 300
+    assert _trigger_count(engine) == triggers == len(search.CREATE_STATEMENTS) - 1
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Receipt)).scalar() == 300
+        assert conn.execute(select(func.sum(MonthlyCategoryTotal.count))).scalar() == 300
+
+
+def test_generate_restores_triggers_when_insert_fails(engine):
+    """投入の途中で失敗しても元の例外が送出され、全文検索のトリガーが戻ること"""
+    triggers = _trigger_count(engine)
+    real_insert = generate_dataset._insert
+    calls = []
+
+    def failing_insert(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        real_insert(*args)
+
+    with patch("scripts.generate_dataset._insert", side_effect=failing_insert):
+        with pytest.raises(RuntimeError, match="disk full"):
+            generate(engine, 300, chunk_size=100, transaction_rows=100)
+
+    assert _trigger_count(engine) == triggers
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Receipt)).scalar() == 100  # コミット済みの分だけ残る
@@ -0,0 +1,229 @@
+"""画像処理サービスのテスト"""
+import asyncio
+import hashlib
+import io
+import threading
+
+import pytest
+from PIL import Image, JpegImagePlugin
+
+from app.config import THUMBNAIL_DIR, UPLOAD_DIR
+from app.services import image_service
+from app.services.image_service import compute_dhash, generate_thumbnail, normalize_for_vision, run_image_task
+
+
+def test_generate_thumbnail_uses_draft_for_large_jpeg(monkeypatch):
+    """大きな JPEG は縮小デコードされ、size 以内のサムネイルになること"""
+    source = UPLOAD_DIR / "test_large_thumb_source.jpg"
+    Image.new("RGB", (4000, 3000), "white").save(source, "JPEG")
+    drafts = []
+    original_draft = JpegImagePlugin.JpegImageFile.draft
+
+    def spy_draft(self, mode, size):
+        result = original_draft(self, mode, size)
+        drafts.append(self.size)
+        return result
+
+    thumb_path = None
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", spy_draft)
+    try:
+        thumb_path = generate_thumbnail(f"/uploads/{source.name}")
+        assert thumb_path is not None
+        with Image.open(THUMBNAIL_DIR / thumb_path.rsplit("/", 1)[-1]) as thumb:
+            assert max(thumb.size) <= 200
+        # デコード時点で 1/8 スケール（500x375）まで縮小されている
+        assert drafts[0] == (500, 375)
+    finally:
+        source.unlink(missing_ok=True)
+        if thumb_path:
+            (THUMBNAIL_DIR / thumb_path.rsplit("/", 1)[-1]).unlink(missing_ok=True)
+
+
+def test_run_image_task_runs_outside_event_loop_thread():
+    """画像処理がイベントループとは別のスレッドで実行されること"""
+    image_service.shutdown_image_executor()
+
+    async def scenario():
+        return threading.get_ident(), await run_image_task(threading.get_ident)
+
+    loop_thread, worker_thread = asyncio.run(scenario())
+    assert worker_thread != loop_thread
+    image_service.shutdown_image_executor()
+
+
+def _encode(img, fmt="JPEG", **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_normalize_for_vision_downscales_long_edge():
+    """長辺が上限を超える画像は縮小・再エンコードされること"""
+    content = _encode(Image.effect_noise((4000, 3000), 64).convert("RGB"), quality=95)
+    image = normalize_for_vision(content, max_long_edge=1568, grayscale=False, image_format="jpeg", quality=80)
+
+    assert (image.width, image.height) == (1568, 1176)
+    assert image.media_type == "image/jpeg"
+    assert len(image.data) < len(content)
+    with Image.open(io.BytesIO(image.data)) as img:
+        assert img.size == (1568, 1176)
+
+
+def test_normalize_for_vision_applies_exif_orientation():
+    """EXIF の回転情報が画素に反映されること"""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 90度回転
+    content = _encode(Image.new("RGB", (300, 200), "white"), exif=exif)
+
+    image = normalize_for_vision(content, max_long_edge=1568, grayscale=False, image_format="webp", quality=80)
+    assert (image.width, image.height) == (200, 300)
+    assert image.media_type == "image/webp"
+
+
+def test_normalize_for_vision_grayscale():
+    """グレースケール指定時は L モードで送られること"""
+    content = _encode(Image.new("RGB", (300, 200), "red"))
+    image = normalize_for_vision(content, max_long_edge=1568, grayscale=True, image_format="jpeg", quality=80)
+    with Image.open(io.BytesIO(image.data)) as img:
+        assert img.mode == "L"
+
+
+def test_normalize_for_vision_keeps_small_original():
+    """変換不要で再エンコードしても小さくならない画像は元のまま返すこと"""
+    content = _encode(Image.new("RGB", (100, 80), "white"), quality=30)
+    image = normalize_for_vision(content, max_long_edge=1568, grayscale=False, image_format="jpeg", quality=95)
+    assert image.data == content
+    assert (image.width, image.height) == (100, 80)
+
+
+class _CountingReader(io.BytesIO):
+    """読み出したバイト数と1回の最大読み出し量を記録する。"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+        self.max_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        self.max_read = max(self.max_read, len(chunk))
+        return chunk
+
+
+def _upload(data, content_type="image/jpeg"):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    reader = _CountingReader(data)
+    return UploadFile(reader, filename="upload", headers=Headers({"content-type": content_type})), reader
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_service, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(image_service, "UPLOAD_CHUNK_SIZE", 1024)
+    return tmp_path
+
+
+def test_save_image_streams_in_chunks(upload_dir):
+    """チャンク単位で読み込み、SHA-256 と形式判定付きで保存されること"""
+    data = _encode(Image.effect_noise((300, 300), 64).convert("RGB"), "PNG")
+    file, reader = _upload(data, content_type="image/jpeg")  # Content-Type より中身の判定を優先する
+
+    saved = asyncio.run(image_service.save_image(file))
+
+    assert reader.max_read <= 1024
+    assert saved.path.endswith(".png")
+    assert saved.sha256 == hashlib.sha256(data).hexdigest()
+    assert saved.phash == compute_dhash(data)
+    assert [p.name for p in upload_dir.iterdir()] == [saved.path.rsplit("/", 1)[-1]]
+    assert (upload_dir / saved.path.rsplit("/", 1)[-1]).read_bytes() == data
+
+
+def test_save_image_rejects_oversized_upload_early(upload_dir, monkeypatch):
+    """上限を超えた時点で読み込みを打ち切り、一時ファイルを残さないこと"""
+    monkeypatch.setattr(image_service, "MAX_FILE_SIZE", 4096)
+    data = _encode(Image.effect_noise((400, 400), 64).convert("RGB"), "PNG")
+    file, reader = _upload(data, content_type="image/png")
+
+    with pytest.raises(ValueError, match="上限"):
+        asyncio.run(image_service.save_image(file))
+
+    assert reader.bytes_read <= 4096 + 1024
+    assert reader.bytes_read < len(data)
+    assert list(upload_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("data", [b"GIF89a" + b"\x00" * 64, b"", b"\xff\xd8\xff" + b"\x00" * 64])
+def test_save_image_rejects_invalid_content(upload_dir, data):
+    """マジックバイトが不正・空・壊れた画像は保存されないこと"""
+    file, _ = _upload(data)
+    with pytest.raises(ValueError):
+        asyncio.run(image_service.save_image(file))
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_save_image_without_derivatives_skips_thumbnail_and_vision_image(upload_dir):
+    """ジョブ登録用の保存ではサムネイル・Vision 送信用画像を作らないこと"""
+    data = _encode(Image.new("RGB", (120, 80), "white"))
+    file, _ = _upload(data)
+    saved = asyncio.run(image_service.save_image(file, derivatives=False))
+    assert saved.thumbnail is None
+    assert saved.vision_image is None
+    assert saved.phash == compute_dhash(data)
+
+
+def test_save_image_skips_vision_image_when_not_needed(upload_dir):
+    """needs_vision が False を返すと Vision 送信用画像だけを省くこと"""
+    data = _encode(Image.new("RGB", (120, 80), "white"))
+    file, _ = _upload(data)
+    asked = []
+
+    def needs_vision(sha256):
+        asked.append(sha256)
+        return False
+
+    saved = asyncio.run(image_service.save_image(file, needs_vision=needs_vision))
+    assert asked == [hashlib.sha256(data).hexdigest()]
+    assert saved.thumbnail is not None
+    assert saved.vision_image is None
+
+
+def test_compute_upload_phash_leaves_no_files(upload_dir):
+    """重複チェック用の読み込みではファイルが残らないこと"""
+    data = _encode(Image.new("RGB", (120, 80), "white"))
+    file, _ = _upload(data)
+    assert asyncio.run(image_service.compute_upload_phash(file)) == compute_dhash(data)
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_process_image_decodes_once(tmp_path, monkeypatch):
+    """1回のデコードから dHash・サムネイル・Vision 送信用画像が作られること"""
+    source = tmp_path / "photo.jpg"
+    Image.effect_noise((3200, 2400), 64).convert("RGB").save(source, "JPEG", quality=90)
+    opened = []
+    original_open = Image.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return original_open(*args, **kwargs)
+
+    monkeypatch.setattr(Image, "open", counting_open)
+    processed = image_service.process_image(source)
+
+    assert len(opened) == 1
+    assert processed.image_format == "JPEG"
+    with original_open(io.BytesIO(processed.thumbnail)) as thumb:
+        assert max(thumb.size) <= 200
+    assert max(processed.vision_image.width, processed.vision_image.height) == 1568
+    assert processed.vision_image.source_bytes == source.stat().st_size
+    assert set(processed.cpu_ms) == {"decode", "phash", "thumbnail", "vision_encode"}
+
+
+def test_process_image_rejects_truncated_file(tmp_path):
+    """途中で切れた画像はデコード時に検出されること"""
+    source = tmp_path / "broken.jpg"
+    source.write_bytes(_encode(Image.effect_noise((200, 200), 64).convert("RGB"))[:500])
+    with pytest.raises(ValueError):
+        image_service.process_image(source)
@@ -0,0 +1,69 @@
+"""メトリクスとテキスト形式の出力のテスト"""
+import pytest
+
+from app.services.metrics import CallbackMetric, Metric, MetricsRegistry
+
+
+def test_counter_and_gauge_render():
+    """カウンター・ゲージがラベルごとに出力されること"""
+    registry = MetricsRegistry()
+    errors = registry.counter("errors_total", "エラー数", ("kind",))
+    in_flight = registry.gauge("in_flight", "処理中の数")
+    errors.inc(kind="api")
+    errors.inc(2, kind="parse")
+    with in_flight.track_inprogress():
+        assert in_flight.value() == 1
+    assert in_flight.value() == 0
+
+    text = registry.render()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{kind="api"} 1' in text
+    assert 'errors_total{kind="parse"} 2' in text
+    assert "in_flight 0" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    """ヒストグラムのバケットが累積で、+Inf・sum・count が出力されること"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "所要時間", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="save")
+
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="save",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="save",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="save",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="save"} 4.05' in lines
+    assert 'stage_seconds_count{stage="save"} 4' in lines
+
+
+def test_labels_are_validated_and_escaped():
+    """ラベル名の過不足はエラーになり、ラベル値はエスケープされること"""
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "リクエスト数", ("route",))
+    with pytest.raises(ValueError):
+        counter.inc(path="/x")
+    counter.inc(route='/a"b\\c')
+    assert 'requests_total{route="/a\\"b\\\\c"} 1' in registry.render()
+
+
+def test_callback_metric_reads_values_on_render():
+    """CallbackMetric は出力時に値を読み出すこと"""
+    registry = MetricsRegistry()
+    values = {("hit",): 1}
+    registry.register(CallbackMetric("lookups_total", "参照数", "counter", lambda: values, ("result",)))
+    values[("hit",)] = 5
+    assert 'lookups_total{result="hit"} 5' in registry.render()
+    with pytest.raises(ValueError):
+        registry.register(CallbackMetric("lookups_total", "重複", "counter", dict))
+
+
+def test_metric_subclass_must_implement_samples():
+    """samples を実装していない Metric のサブクラスは生成時にエラーになること"""
+
+    class Incomplete(Metric):
+        def reset(self) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "未実装")
@@ -0,0 +1,130 @@
+"""スキーマ移行とインデックス利用のテスト"""
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+from app.database import Base
+from app.migrations import MIGRATIONS, run_migrations
+from app.models.receipt import Receipt, ReceiptItem
+from app.services.receipt_service import get_receipt, get_receipts
+from tests.conftest import engine
+
+# 移行導入前の receipts.db と同じスキーマ
+LEGACY_SCHEMA = [
+    """CREATE TABLE receipts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, store_name TEXT, date DATE, total_amount FLOAT,
+        tax FLOAT, payment_method TEXT, category TEXT, image_path TEXT NOT NULL,
+        thumbnail_path TEXT, raw_response TEXT, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)""",
+    """CREATE TABLE receipt_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+        name TEXT, quantity FLOAT, price FLOAT)""",
+    """CREATE TABLE scan_jobs (
+        id TEXT PRIMARY KEY, batch_id TEXT, filename TEXT, image_path TEXT, status TEXT NOT NULL,
+        error TEXT, receipt_id INTEGER, queued_at DATETIME NOT NULL, started_at DATETIME,
+        analyzed_at DATETIME, thumbnailed_at DATETIME, finished_at DATETIME)""",
+]
+
+
+def test_migrations_upgrade_legacy_database(tmp_path):
+    """既存DBに列とインデックスが追加され、再実行では何もしないこと"""
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text(
+            "INSERT INTO receipts (store_name, image_path, created_at, updated_at) "
+            "VALUES ('既存店', '/uploads/a.jpg', '2025-01-01', '2025-01-01')"
+        ))
+
+    Base.metadata.create_all(bind=legacy)
+    assert run_migrations(legacy) == [m.version for m in MIGRATIONS]
+    assert run_migrations(legacy) == []
+
+    inspector = inspect(legacy)
+    assert {"image_phash", "scan_metadata"} <= {c["name"] for c in inspector.get_columns("receipts")}
+    assert {"image_sha256", "vision_batch_id"} <= {c["name"] for c in inspector.get_columns("scan_jobs")}
+    receipt_indexes = {ix["name"] for ix in inspector.get_indexes("receipts")}
+    assert {ix.name for ix in Receipt.__table__.indexes} <= receipt_indexes
+    assert "ix_receipt_items_receipt_id" in {ix["name"] for ix in inspector.get_indexes("receipt_items")}
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT store_name FROM receipts")).scalar() == "既存店"
+        # 既存データが全文検索に索引されていること
+        assert conn.execute(text("SELECT rowid FROM receipts_fts WHERE receipts_fts MATCH '既存店'")).scalar() == 1
+
+
+def test_migrations_on_fresh_database(tmp_path):
+    """create_all 済みの新規DBでも移行が失敗しないこと"""
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(bind=fresh)
+    assert run_migrations(fresh) == [m.version for m in MIGRATIONS]
+
+
+def _query_plans(fn):
+    """fn 内で発行された SELECT ごとに (SQL, EXPLAIN QUERY PLAN) を返す。"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in captured:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append((statement, " | ".join(row[-1] for row in rows)))
+    return plans
+
+
+@pytest.fixture
+def seeded(db):
+    for i in range(50):
+        receipt = Receipt(
+            store_name=f"店{i % 7}",
+            date=datetime.date(2025, 1 + i % 12, 1),
+            total_amount=float(i * 100),
+            category=["食費", "交通費", "日用品"][i % 3],
+            image_path=f"/uploads/{i}.jpg",
+        )
+        receipt.items.append(ReceiptItem(name="牛乳", price=200))
+        db.add(receipt)
+    db.commit()
+    return db
+
+
+@pytest.mark.parametrize(
+    "kwargs, index",
+    [
+        ({"sort_by": "created_at"}, "ix_receipts_created_at_id"),
+        ({"sort_by": "date", "sort_order": "asc"}, "ix_receipts_date_id"),
+        ({"sort_by": "total_amount"}, "ix_receipts_total_amount_id"),
+        ({"sort_by": "store_name"}, "ix_receipts_store_name_id"),
+        ({"category": "食費"}, "ix_receipts_category_created_at_id"),
+        ({"date_from": datetime.date(2025, 3, 1), "date_to": datetime.date(2025, 3, 31), "sort_by": "date"},
+         "ix_receipts_date_id"),
+        ({"amount_min": 1000, "amount_max": 2000, "sort_by": "total_amount"}, "ix_receipts_total_amount_id"),
+    ],
+)
+def test_receipt_list_filters_use_indexes(seeded, kwargs, index):
+    """一覧の各絞り込み・ソートがインデックスを使うこと"""
+    plans = _query_plans(lambda: get_receipts(seeded, limit=10, **kwargs))
+    page_plan = next(plan for sql, plan in plans if "LIMIT" in sql)
+    assert index in page_plan, plans
+    assert "USE TEMP B-TREE FOR ORDER BY" not in page_plan, plans
+
+
+def test_items_loading_uses_receipt_id_index(seeded):
+    """品目の読み込みが receipt_id のインデックスを使うこと"""
+    receipt_id = seeded.query(Receipt.id).first()[0]
+    seeded.expire_all()
+
+    plans = _query_plans(lambda: get_receipts(seeded, limit=10)) + _query_plans(lambda: get_receipt(seeded, receipt_id))
+    item_plans = [plan for sql, plan in plans if "FROM receipt_items" in sql or "JOIN receipt_items" in sql]
+    assert item_plans
+    assert all("ix_receipt_items_receipt_id" in p for p in item_plans), item_plans
@@ -0,0 +1,45 @@
+"""リクエストプロファイラのテスト"""
+import os
+import threading
+import time
+from collections import Counter
+
+from app.services.profiling import ProfileStore, SamplingProfiler
+
+
+def _busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_collects_collapsed_stacks():
+    """実行中のスレッドのスタックが呼び出し元から順に ; 区切りで採取されること"""
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    time.sleep(0.05)
+    stacks = profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 0
+    busy = [stack for stack in stacks if stack.startswith("busy;")]
+    assert busy
+    assert all(stack.split(";")[-1].startswith("_busy_loop (tests/test_profiling.py:") for stack in busy)
+    assert not any(stack.startswith("request-profiler;") for stack in stacks)
+
+
+def test_profile_store_keeps_latest(tmp_path):
+    """新しい keep 件だけが残り、不正な ID は参照できないこと"""
+    store = ProfileStore(tmp_path, keep=2)
+    ids = [f"{i:032x}" for i in range(3)]
+    for i, profile_id in enumerate(ids):
+        store.save(profile_id, Counter({"MainThread;handler (app/x.py:1)": i + 1}), {"path": f"/p{i}"})
+        os.utime(tmp_path / f"{profile_id}.json", ns=(i * 10**9, i * 10**9))
+
+    assert [info["id"] for info in store.list()] == [ids[2], ids[1]]
+    assert store.path(ids[0]) is None
+    assert store.path(ids[2]).read_text(encoding="utf-8") == "MainThread;handler (app/x.py:1) 3\n"
+    assert store.path("../" + ids[2]) is None
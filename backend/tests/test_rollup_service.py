@@ -0,0 +1,88 @@
+"""月次ロールアップの増分更新・再構築のテスト"""
+import datetime
+import random
+
+from app.models.monthly_category_total import MonthlyCategoryTotal
+from app.models.receipt import Receipt
+from app.schemas.receipt import ReceiptUpdate, VisionResponse
+from app.services.receipt_service import create_receipt, delete_receipt, get_receipt, update_receipt
+from app.services.rollup_service import check_consistency, rebuild_rollup
+from app.services.summary_service import get_monthly_summary
+
+
+def _totals(db):
+    return {
+        (r.year, r.month, r.category): (r.total_amount, r.count)
+        for r in db.query(MonthlyCategoryTotal).all()
+    }
+
+
+def test_create_update_delete_keep_rollup_in_sync(db, tmp_path):
+    """作成・更新（月とカテゴリの変更）・削除がロールアップに反映されること"""
+    vision = VisionResponse(date=datetime.date(2025, 1, 10), total_amount=1000, category="食費")
+    receipt = create_receipt(db, "/uploads/a.jpg", vision, "{}")
+    assert _totals(db) == {(2025, 1, "食費"): (1000, 1)}
+
+    receipt = get_receipt(db, receipt.id)
+    update_receipt(db, receipt, ReceiptUpdate(date=datetime.date(2025, 2, 1), total_amount=1500, category=None))
+    assert _totals(db) == {(2025, 2, "未分類"): (1500, 1)}
+
+    delete_receipt(db, get_receipt(db, receipt.id), tmp_path)
+    assert _totals(db) == {}
+
+
+def test_expired_receipt_update_uses_previous_db_values(db):
+    """属性が失効した状態で更新しても、変更前の値が正しく差し引かれること"""
+    db.add(Receipt(date=datetime.date(2025, 3, 1), total_amount=500, category="交通費", image_path="a.jpg"))
+    db.commit()
+    receipt = db.query(Receipt).one()
+    db.expire(receipt)
+
+    receipt.total_amount = 800
+    db.commit()
+
+    assert _totals(db) == {(2025, 3, "交通費"): (800, 1)}
+
+
+def test_random_operations_match_raw_aggregation(db):
+    """ランダムな追加・更新・削除の後もロールアップが生の集計と一致すること"""
+    rng = random.Random(42)
+    categories = ["食費", "交通費", None]
+    for _ in range(200):
+        receipts = db.query(Receipt).all()
+        op = rng.random()
+        if op < 0.5 or not receipts:
+            db.add(Receipt(
+                date=rng.choice([None, datetime.date(2025, rng.randint(1, 4), rng.randint(1, 28))]),
+                total_amount=rng.choice([None, float(rng.randrange(100, 5000))]),
+                category=rng.choice(categories),
+                image_path="x.jpg",
+            ))
+        elif op < 0.8:
+            receipt = rng.choice(receipts)
+            receipt.category = rng.choice(categories)
+            receipt.total_amount = float(rng.randrange(100, 5000))
+            if rng.random() < 0.3:
+                receipt.date = datetime.date(2025, rng.randint(1, 4), 1)
+        else:
+            db.delete(rng.choice(receipts))
+        db.commit()
+
+    assert check_consistency(db) == []
+
+
+def test_rebuild_and_check_detect_drift(db):
+    """ロールアップ外の変更は check で検出され、rebuild で修復されること"""
+    db.add(Receipt(date=datetime.date(2025, 5, 1), total_amount=300, category="食費", image_path="a.jpg"))
+    db.commit()
+    db.query(Receipt).update({Receipt.total_amount: 900})  # bulk UPDATE はロールアップ対象外
+    db.commit()
+
+    mismatches = check_consistency(db)
+    assert len(mismatches) == 1
+    assert mismatches[0].expected == (900, 1)
+
+    assert rebuild_rollup(db) == 1
+    db.commit()
+    assert check_consistency(db) == []
+    assert get_monthly_summary(db, 2025, 5).total_amount == 900
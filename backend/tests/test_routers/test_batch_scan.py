@@ -1,8 +1,14 @@
 """一括スキャンのテスト"""
+import asyncio
 import io
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.models.receipt import Receipt
 from app.schemas.receipt import VisionResponse
+from app.services.image_service import SavedImage
 
 
 def _make_image_file(name="test.jpg", content_type="image/jpeg"):
@@ -32,7 +38,7 @@ def _make_image_file(name="test.jpg", content_type="image/jpeg"):
 
 
 @patch("app.routers.receipts.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
-@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value="/uploads/test.jpg")
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
 @patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
 def test_batch_scan_success(mock_analyze, mock_save, mock_thumb, client, db):
     """複数ファイルが全て成功する場合のテスト"""
@@ -58,7 +64,7 @@ def test_batch_scan_success(mock_analyze, mock_save, mock_thumb, client, db):
 
 
 @patch("app.routers.receipts.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
-@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value="/uploads/test.jpg")
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
 @patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
 def test_batch_scan_partial_failure(mock_analyze, mock_save, mock_thumb, client, db):
     """一部のファイルが失敗する場合のテスト"""
@@ -93,3 +99,76 @@ def test_batch_scan_partial_failure(mock_analyze, mock_save, mock_thumb, client,
     assert data["results"][1]["success"] is False
     assert data["results"][1]["error"] is not None
     assert data["results"][2]["success"] is True
+
+
+@patch("app.routers.receipts.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
+def test_batch_scan_continues_after_failed_commit(mock_analyze, mock_save, mock_thumb, client, db):
+    """1 件の commit が失敗しても、同じセッションを使う残りのファイルは保存されること"""
+    stores = iter(["店A", "ロック店", "店C"])
+
+    async def side_effect(*args, **kwargs):
+        return VisionResponse(store_name=next(stores), total_amount=500, category="食費"), "{}"
+
+    mock_analyze.side_effect = side_effect
+
+    def fail_locked(session, flush_context):
+        if any(isinstance(obj, Receipt) and obj.store_name == "ロック店" for obj in session.new):
+            raise OperationalError("INSERT INTO receipts", {}, Exception("database is locked"))
+
+    event.listen(db, "after_flush", fail_locked)
+    try:
+        files = [("files", _make_image_file(name)) for name in ("a.jpg", "b.jpg", "c.jpg")]
+        data = client.post("/api/receipts/scan/batch", files=files).json()
+    finally:
+        event.remove(db, "after_flush", fail_locked)
+
+    assert [r["success"] for r in data["results"]] == [True, False, True]
+    assert "database is locked" in data["results"][1]["error"]
+    assert sorted(r.store_name for r in db.query(Receipt).all()) == ["店A", "店C"]
+
+
+@patch("app.routers.receipts.BATCH_SCAN_CONCURRENCY", 2)
+@patch("app.routers.receipts.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
+def test_batch_scan_concurrency_limit_and_order(mock_analyze, mock_save, mock_thumb, client, db):
+    """同時実行数が上限を超えず、結果がアップロード順に並ぶこと"""
+    in_flight = 0
+    max_in_flight = 0
+    delays = iter([0.03, 0.01, 0.02, 0.0])
+
+    async def side_effect(*args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(next(delays))
+        in_flight -= 1
+        return VisionResponse(store_name="テスト店", total_amount=500, category="食費"), "{}"
+
+    mock_analyze.side_effect = side_effect
+
+    names = ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    files = [("files", _make_image_file(name)) for name in names]
+
+    response = client.post("/api/receipts/scan/batch", files=files)
+    assert response.status_code == 201
+    data = response.json()
+    assert max_in_flight == 2
+    assert [r["filename"] for r in data["results"]] == names
+    assert data["success_count"] == 4
+
+
+@patch("app.routers.receipts._cleanup_uploaded_file")
+@patch("app.routers.receipts.generate_thumbnail", return_value=None)
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/fail.jpg", "0" * 64))
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock, side_effect=ValueError("解析エラー"))
+def test_batch_scan_cleans_up_failed_files(mock_analyze, mock_save, mock_thumb, mock_cleanup, client, db):
+    """解析に失敗したファイルは削除されること"""
+    files = [("files", _make_image_file("fail.jpg"))]
+
+    response = client.post("/api/receipts/scan/batch", files=files)
+    assert response.status_code == 201
+    assert response.json()["error_count"] == 1
+    mock_cleanup.assert_called_once_with("/uploads/fail.jpg")
@@ -0,0 +1,154 @@
+"""一括取り込み（Message Batches API）のテスト"""
+import asyncio
+import hashlib
+import io
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+from app.config import VISION_MODEL
+from app.models.receipt import Receipt
+from app.models.vision_batch import VisionBatch
+from app.models.vision_usage import VisionUsage
+from app.schemas.receipt import VisionResponse
+from app.services import image_service, vision_cache_service
+from app.services.bulk_vision_service import BulkBatchPoller, requeue_unsubmitted_jobs
+from app.services.image_service import SavedImage
+from app.services.scan_job_service import enqueue_job, get_job
+from app.services.vision_service import PROMPT_VERSION
+from tests.anthropic_batch_stub import BatchStubServer, errored
+from tests.conftest import TestingSessionLocal
+from tests.test_routers.test_batch_scan import _make_image_file
+
+
+@pytest.fixture
+def bulk_env(tmp_path, monkeypatch):
+    """画像の保存先を一時ディレクトリ（tmp_path/uploads）にし、API キーを設定済みにする。"""
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(image_service, "UPLOAD_DIR", upload_dir)
+    monkeypatch.setattr("app.services.bulk_vision_service.UPLOAD_DIR", upload_dir)
+    monkeypatch.setattr("app.services.bulk_vision_service.ANTHROPIC_API_KEY", "sk-test")
+    monkeypatch.setattr("app.services.bulk_vision_service.MOCK_VISION", False)
+    with patch("app.services.scan_job_service.generate_thumbnail", return_value="/uploads/thumbs/t.jpg"):
+        yield upload_dir
+
+
+def _submit(client, server, files):
+    with patch("app.services.bulk_vision_service._get_client", side_effect=server.client):
+        return client.post("/api/scan-jobs/bulk", files=files)
+
+
+def _poll(server) -> int:
+    poller = BulkBatchPoller(TestingSessionLocal, poll_interval=0, client_factory=server.client)
+    return asyncio.run(poller.poll_once())
+
+
+def test_bulk_scan_submits_batch_and_imports_results(client, db, bulk_env):
+    """画像がバッチとして投入され、完了後に結果がレシートとして取り込まれること"""
+    with BatchStubServer(polls_until_ended=1) as server:
+        files = [
+            ("files", _make_image_file("a.jpg")),
+            ("files", _make_image_file("b.jpg")),
+            ("files", ("bad.jpg", b"not an image", "image/jpeg")),
+        ]
+        response = _submit(client, server, files)
+        assert response.status_code == 202
+        data = response.json()
+        assert (data["submitted"], data["failed"]) == (2, 1)
+        assert len(data["vision_batch_ids"]) == 1
+
+        batch_id = data["vision_batch_ids"][0]
+        requests = server.batches[batch_id]["requests"]
+        assert {r["custom_id"] for r in requests} == {j["id"] for j in data["jobs"] if j["status"] == "submitted"}
+        assert requests[0]["params"]["messages"][0]["content"][0]["source"]["data"]
+
+        assert _poll(server) == 0  # まだ in_progress
+        assert _poll(server) == 1
+
+    status = client.get(f"/api/scan-jobs/batches/{data['batch_id']}").json()
+    assert (status["succeeded"], status["failed"], status["submitted"]) == (2, 1, 0)
+    receipts = db.query(Receipt).all()
+    assert [r.store_name for r in receipts] == ["一括テスト店", "一括テスト店"]
+    assert receipts[0].scan_metadata["vision"]["bulk_batch_id"] == batch_id
+    assert receipts[0].scan_metadata["vision"]["input_tokens"] == 1200
+
+    usage = db.query(VisionUsage).all()
+    assert [(u.mode, u.input_tokens) for u in usage] == [("batch", 1200), ("batch", 1200)]
+
+    record = db.get(VisionBatch, batch_id)
+    db.refresh(record)
+    assert (record.status, record.succeeded_count, record.failed_count) == ("processed", 2, 0)
+    assert _poll(server) == 0  # 処理済みのバッチは再確認しない
+
+
+def test_bulk_scan_records_errored_and_missing_results(client, db, bulk_env):
+    """エラー結果・結果の欠落はジョブ単位で failed になること"""
+    responses = iter([errored("overloaded"), None])
+    with BatchStubServer(responder=lambda custom_id, params: next(responses), polls_until_ended=0) as server:
+        files = [("files", _make_image_file("a.jpg")), ("files", _make_image_file("b.jpg"))]
+        data = _submit(client, server, files).json()
+        assert _poll(server) == 1
+
+    jobs = client.get(f"/api/scan-jobs/batches/{data['batch_id']}").json()["jobs"]
+    errors = sorted(job["error"] for job in jobs)
+    assert all(job["status"] == "failed" for job in jobs)
+    assert "overloaded" in errors[1]
+    assert "含まれていません" in errors[0]
+    assert list(bulk_env.iterdir()) == []  # 失敗したジョブの画像は削除される
+
+
+def test_bulk_scan_splits_large_uploads(client, bulk_env, monkeypatch):
+    """BULK_VISION_MAX_REQUESTS 件ごとに別のバッチとして投入されること"""
+    monkeypatch.setattr("app.services.bulk_vision_service.BULK_VISION_MAX_REQUESTS", 2)
+    with BatchStubServer() as server:
+        files = [("files", _make_image_file(f"{i}.jpg")) for i in range(5)]
+        data = _submit(client, server, files).json()
+        assert sorted(len(b["requests"]) for b in server.batches.values()) == [1, 2, 2]
+    assert len(data["vision_batch_ids"]) == 3
+
+
+def test_bulk_scan_submission_failure_requeues_jobs(client, db, bulk_env):
+    """バッチの投入に失敗したジョブは画像を残したまま通常のキューへ戻ること"""
+    with BatchStubServer(fail_create=True) as server:
+        data = _submit(client, server, [("files", _make_image_file())]).json()
+    assert (data["queued"], data["failed"]) == (1, 0)
+    job = get_job(db, data["jobs"][0]["id"])
+    assert job.vision_batch_id is None
+    assert (bulk_env / job.image_path.rsplit("/", 1)[-1]).exists()
+
+
+def test_bulk_scan_imports_cached_results_without_submitting(client, db, bulk_env, monkeypatch):
+    """解析キャッシュにある画像はバッチに含めず、その場で取り込むこと"""
+    monkeypatch.setattr("app.services.bulk_vision_service.VISION_CACHE_ENABLED", True)
+    cached_file = _make_image_file("cached.jpg")
+    vision_cache_service.store_result(
+        db, hashlib.sha256(cached_file[1].getvalue()).hexdigest(), VISION_MODEL, PROMPT_VERSION,
+        VisionResponse(store_name="キャッシュ店", total_amount=100), "{}",
+    )
+    with BatchStubServer() as server:
+        other = io.BytesIO()
+        Image.new("RGB", (40, 30), "blue").save(other, "PNG")
+        files = [("files", cached_file), ("files", ("b.png", other.getvalue(), "image/png"))]
+        data = _submit(client, server, files).json()
+        assert [len(b["requests"]) for b in server.batches.values()] == [1]
+
+    assert (data["succeeded"], data["submitted"]) == (1, 1)
+    assert [r.store_name for r in db.query(Receipt).all()] == ["キャッシュ店"]
+
+
+def test_bulk_scan_requires_api_key(client, monkeypatch):
+    """API キー未設定なら 400 を返すこと"""
+    monkeypatch.setattr("app.services.bulk_vision_service.ANTHROPIC_API_KEY", "")
+    monkeypatch.setattr("app.services.bulk_vision_service.MOCK_VISION", False)
+    response = client.post("/api/scan-jobs/bulk", files=[("files", _make_image_file())])
+    assert response.status_code == 400
+
+
+def test_unsubmitted_jobs_are_requeued(db):
+    """投入前に停止したジョブは通常のキューへ戻ること"""
+    job = enqueue_job(db, SavedImage("/uploads/x.jpg", "0" * 64), status="submitted")
+    assert requeue_unsubmitted_jobs(db) == 1
+    db.expire_all()
+    assert get_job(db, job.id).status == "queued"
@@ -0,0 +1,42 @@
+"""/metrics エンドポイントのテスト"""
+from unittest.mock import AsyncMock, patch
+
+from app.schemas.receipt import VisionResponse
+from app.services.image_service import SavedImage
+from app.services.metrics import http_request_seconds, scan_stage_seconds, scans_in_flight
+from tests.test_routers.test_batch_scan import _make_image_file
+
+STAGES = ["save_image", "find_duplicates", "analyze_receipt", "generate_thumbnail", "create_receipt"]
+
+
+@patch("app.routers.receipts.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
+def test_scan_records_stage_timings(mock_analyze, mock_save, mock_thumb, client):
+    """単発スキャンの各段階の所要時間が記録され、/metrics に出力されること"""
+    mock_analyze.return_value = (VisionResponse(store_name="テスト店", total_amount=500, items=[]), "{}")
+    response = client.post("/api/receipts/scan", files={"file": _make_image_file()})
+    assert response.status_code == 201
+
+    for name in STAGES:
+        assert scan_stage_seconds.count(pipeline="scan", stage=name) == 1
+    assert scans_in_flight.value(pipeline="scan") == 0
+
+    body = client.get("/metrics")
+    assert body.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'receipt_scan_stage_seconds_count{pipeline="scan",stage="analyze_receipt"} 1' in body.text
+    assert 'receipt_scans_in_flight{pipeline="scan"} 0' in body.text
+    assert 'cache_lookups_total{cache="vision",result="hit"}' in body.text
+    assert "vision_circuit_open 0" in body.text
+
+
+def test_requests_are_recorded_by_route_template(client):
+    """API リクエストはパステンプレート単位で記録され、/metrics 自体は記録されないこと"""
+    client.get("/api/receipts/1")
+    client.get("/api/receipts/2")
+    client.get("/api/receipts")
+    client.get("/metrics")
+
+    assert http_request_seconds.count(method="GET", route="/api/receipts/{receipt_id}", status="404") == 2
+    assert http_request_seconds.count(method="GET", route="/api/receipts", status="200") == 1
+    assert 'route="/metrics"' not in client.get("/metrics").text
@@ -0,0 +1,53 @@
+"""リクエスト単位のプロファイルのテスト"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.profiling import ProfileStore, ProfilingMiddleware
+
+
+@pytest.fixture
+def profiled(client, tmp_path, monkeypatch):
+    """ProfilingMiddleware を組み込んだクライアントと、保存先のストア。"""
+    store = ProfileStore(tmp_path, keep=5)
+    monkeypatch.setattr("app.routers.admin.profile_store", store)
+    return TestClient(ProfilingMiddleware(app, store=store, interval_ms=1)), store
+
+
+def test_profile_header_stores_profile(profiled):
+    """X-Profile: 1 のリクエストはプロファイルが保存され、ID で取得できること"""
+    client, store = profiled
+    response = client.get("/api/receipts", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    [info] = client.get("/api/admin/profiles").json()
+    assert (info["id"], info["method"], info["path"], info["status"]) == (profile_id, "GET", "/api/receipts", 200)
+
+    download = client.get(f"/api/admin/profiles/{profile_id}")
+    assert download.status_code == 200
+    assert download.text == store.path(profile_id).read_text(encoding="utf-8")
+
+
+def test_profile_query_flag(profiled):
+    """?profile=1 でもプロファイルを採取すること"""
+    client, store = profiled
+    response = client.get("/api/summary/monthly-list", params={"profile": "1"})
+    assert response.status_code == 200
+    assert "X-Profile-Id" in response.headers
+    assert len(store.list()) == 1
+
+
+def test_requests_without_flag_are_not_profiled(profiled):
+    """指定のないリクエストはプロファイルしないこと"""
+    client, store = profiled
+    response = client.get("/api/receipts", headers={"X-Profile": "0"})
+    assert "X-Profile-Id" not in response.headers
+    assert store.list() == []
+    assert client.get("/api/admin/profiles/" + "0" * 32).status_code == 404
+
+
+def test_profiling_is_off_by_default(client):
+    """PROFILING_ENABLED が無効ならヘッダーを付けてもプロファイルしないこと"""
+    response = client.get("/api/receipts", headers={"X-Profile": "1"})
+    assert "X-Profile-Id" not in response.headers
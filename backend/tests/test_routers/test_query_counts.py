@@ -0,0 +1,82 @@
+"""クエリ数の回帰テスト（件数に比例してクエリが増えないこと）"""
+import datetime
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.models.receipt import Receipt, ReceiptItem
+from tests.conftest import engine
+
+
+@contextmanager
+def count_queries():
+    statements: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _seed(db, count):
+    for i in range(count):
+        receipt = Receipt(
+            store_name=f"店{i}",
+            date=datetime.date(2025, 1 + i % 3, 1),
+            total_amount=100 + i,
+            category="食費",
+            image_path=f"/uploads/{i}.jpg",
+        )
+        receipt.items.append(ReceiptItem(name="牛乳", quantity=1, price=200))
+        receipt.items.append(ReceiptItem(name="パン", quantity=2, price=150))
+        db.add(receipt)
+    db.commit()
+    db.expire_all()
+
+
+def _query_count(client, db, count, method, url, **kwargs):
+    _seed(db, count)
+    with count_queries() as statements:
+        response = client.request(method, url, **kwargs)
+    assert response.status_code == 200, response.text
+    # 次の計測のためにデータを消す
+    db.query(ReceiptItem).delete()
+    db.query(Receipt).delete()
+    db.commit()
+    db.expire_all()
+    return len(statements)
+
+
+@pytest.mark.parametrize(
+    "url, params",
+    [
+        ("/api/receipts", {"limit": 100}),
+        ("/api/receipts", {"limit": 100, "category": "食費", "sort_by": "total_amount"}),
+        ("/api/receipts/export/csv", {}),
+        ("/api/summary/monthly", {"year": 2025, "month": 1}),
+        ("/api/summary/monthly-list", {}),
+    ],
+)
+def test_query_count_does_not_grow_with_rows(client, db, url, params):
+    """2件でも30件でも発行されるクエリ数が同じであること"""
+    small = _query_count(client, db, 2, "GET", url, params=params)
+    large = _query_count(client, db, 30, "GET", url, params=params)
+    assert large == small
+
+
+def test_detail_loads_items_in_single_query(client, db):
+    """詳細取得は品目を含めて1クエリで読み込むこと"""
+    _seed(db, 1)
+    receipt_id = db.query(Receipt.id).scalar()
+
+    with count_queries() as statements:
+        response = client.get(f"/api/receipts/{receipt_id}")
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 2
+    assert len(statements) == 1
@@ -0,0 +1,160 @@
+"""オンデマンド派生画像エンドポイントのテスト"""
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app.models.receipt import Receipt
+from app.services import derivative_service
+
+
+@pytest.fixture
+def image_dirs(tmp_path, monkeypatch):
+    """元画像と派生画像の保存先を一時ディレクトリに差し替える。"""
+    upload_dir = tmp_path / "uploads"
+    derived_dir = upload_dir / "thumbs" / "derived"
+    derived_dir.mkdir(parents=True)
+    monkeypatch.setattr(derivative_service, "UPLOAD_DIR", upload_dir)
+    monkeypatch.setattr(derivative_service, "DERIVATIVE_DIR", derived_dir)
+    derivative_service.reset_cache_size()
+    yield upload_dir, derived_dir
+    derivative_service.reset_cache_size()
+
+
+def _create_receipt_with_image(db, upload_dir, name="original.jpg", size=(1200, 900)):
+    Image.new("RGB", size, "white").save(upload_dir / name, "JPEG")
+    receipt = Receipt(store_name="テスト店", total_amount=100, image_path=f"/uploads/{name}")
+    db.add(receipt)
+    db.commit()
+    return receipt
+
+
+def test_image_derivative_is_generated_and_cached(client, db, image_dirs):
+    """指定幅・形式の派生画像が生成され、2回目はキャッシュから返ること"""
+    upload_dir, derived_dir = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir)
+
+    first = client.get(f"/api/receipts/{receipt.id}/image", params={"w": 400, "fmt": "webp"})
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/webp"
+    assert "immutable" in first.headers["cache-control"]
+    with Image.open(io.BytesIO(first.content)) as img:
+        assert img.format == "WEBP"
+        assert img.size == (400, 300)
+
+    cached = list(derived_dir.iterdir())
+    assert len(cached) == 1
+    mtime = cached[0].stat().st_mtime_ns
+
+    second = client.get(f"/api/receipts/{receipt.id}/image", params={"w": 400, "fmt": "webp"})
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.content == first.content
+    assert list(derived_dir.iterdir()) == cached
+    assert cached[0].stat().st_mtime_ns >= mtime
+
+
+def test_image_derivative_does_not_upscale(client, db, image_dirs):
+    """元画像より大きい幅を指定しても拡大しないこと"""
+    upload_dir, _ = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir, size=(300, 200))
+
+    response = client.get(f"/api/receipts/{receipt.id}/image", params={"w": 800, "fmt": "png"})
+    with Image.open(io.BytesIO(response.content)) as img:
+        assert img.size == (300, 200)
+
+
+def test_image_derivative_not_modified(client, db, image_dirs):
+    """If-None-Match が一致すれば 304 を返すこと"""
+    upload_dir, _ = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir)
+    etag = client.get(f"/api/receipts/{receipt.id}/image", params={"w": 200}).headers["etag"]
+
+    response = client.get(
+        f"/api/receipts/{receipt.id}/image", params={"w": 200}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.parametrize("params", [{"w": 123}, {"w": 200, "fmt": "gif"}])
+def test_image_derivative_rejects_unlisted_params(client, db, image_dirs, params):
+    """ホワイトリスト外の幅・形式は 400 になること"""
+    upload_dir, _ = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir)
+    response = client.get(f"/api/receipts/{receipt.id}/image", params=params)
+    assert response.status_code == 400
+
+
+def test_image_derivative_not_found(client, db, image_dirs):
+    """レシートまたは元画像がなければ 404 になること"""
+    upload_dir, _ = image_dirs
+    assert client.get("/api/receipts/999/image", params={"w": 200}).status_code == 404
+
+    receipt = _create_receipt_with_image(db, upload_dir)
+    (upload_dir / "original.jpg").unlink()
+    assert client.get(f"/api/receipts/{receipt.id}/image", params={"w": 200}).status_code == 404
+
+
+def _get_derivative(name, width=400, fmt="png"):
+    derivative = derivative_service.get_derivative(f"/uploads/{name}", width, fmt)
+    derivative.file.close()
+    return derivative
+
+
+def test_derivative_cache_evicts_least_recently_used(db, image_dirs, monkeypatch):
+    """上限を超えると最終参照が古い派生画像から削除されること"""
+    upload_dir, derived_dir = image_dirs
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        Image.new("RGB", (800, 600), "white").save(upload_dir / name, "JPEG")
+
+    a = _get_derivative("a.jpg")
+    b = _get_derivative("b.jpg")
+    os.utime(a.path, (1, 1))
+    os.utime(b.path, (2, 2))
+    _get_derivative("a.jpg")  # a を最近参照にする
+
+    monkeypatch.setattr(derivative_service, "DERIVATIVE_CACHE_MAX_BYTES", a.path.stat().st_size * 2)
+    c = _get_derivative("c.jpg")
+
+    assert a.path.exists()
+    assert not b.path.exists()
+    assert c.path.exists()
+
+
+def test_not_modified_does_not_render(client, db, image_dirs, monkeypatch):
+    """If-None-Match が一致すれば、キャッシュになくても派生画像を生成せずに 304 を返すこと"""
+    upload_dir, derived_dir = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir)
+    etag = derivative_service.derivative_etag(receipt.image_path, 800, "webp")
+    monkeypatch.setattr(derivative_service, "_render", lambda *args: pytest.fail("生成された"))
+
+    response = client.get(
+        f"/api/receipts/{receipt.id}/image", params={"w": 800}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert list(derived_dir.iterdir()) == []
+
+
+def test_evicted_derivative_is_still_served(db, image_dirs):
+    """返した後に追い出されても、開いたファイルから最後まで読めること"""
+    upload_dir, _ = image_dirs
+    Image.new("RGB", (800, 600), "white").save(upload_dir / "a.jpg", "JPEG")
+    expected = _get_derivative("a.jpg").path.read_bytes()
+
+    derivative = derivative_service.get_derivative("/uploads/a.jpg", 400, "png")
+    derivative.path.unlink()
+    assert b"".join(derivative.iter_chunks()) == expected
+    assert derivative.size == len(expected)
+    assert derivative.file.closed
+
+
+def test_delete_receipt_removes_derivatives(client, db, image_dirs):
+    """レシート削除時に派生画像も削除されること"""
+    upload_dir, derived_dir = image_dirs
+    receipt = _create_receipt_with_image(db, upload_dir)
+    client.get(f"/api/receipts/{receipt.id}/image", params={"w": 200})
+    assert list(derived_dir.iterdir())
+
+    assert client.delete(f"/api/receipts/{receipt.id}").status_code == 204
+    assert list(derived_dir.iterdir()) == []
@@ -0,0 +1,77 @@
+"""キーセット（カーソル）ページネーションのテスト"""
+import datetime
+
+import pytest
+
+from app.models.receipt import Receipt
+
+
+def _seed(db):
+    base = datetime.datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(13):
+        db.add(Receipt(
+            store_name=None if i % 5 == 0 else f"店{i % 4}",
+            date=None if i % 4 == 0 else datetime.date(2025, 1, 1 + i % 3),
+            total_amount=None if i % 6 == 0 else float(100 * (i % 3)),
+            created_at=base + datetime.timedelta(minutes=i // 2),
+            image_path=f"/uploads/{i}.jpg",
+        ))
+    db.commit()
+
+
+def _walk_with_cursor(client, params):
+    ids = []
+    cursor = None
+    for _ in range(20):
+        query = dict(params, limit=4)
+        if cursor:
+            query["cursor"] = cursor
+        data = client.get("/api/receipts", params=query).json()
+        ids.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return ids
+    raise AssertionError("ページングが終了しません")
+
+
+@pytest.mark.parametrize("sort_by", ["created_at", "date", "total_amount", "store_name"])
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_cursor_pages_match_offset_order(client, db, sort_by, sort_order):
+    """NULL や同値を含んでも、カーソルで辿った順序がオフセット方式の全件順序と一致すること"""
+    _seed(db)
+    params = {"sort_by": sort_by, "sort_order": sort_order}
+    expected = [item["id"] for item in client.get("/api/receipts", params=dict(params, limit=100)).json()["items"]]
+
+    assert _walk_with_cursor(client, params) == expected
+    assert len(expected) == 13
+
+
+def test_cursor_is_stable_when_new_receipts_arrive(client, db):
+    """新しいレシートが追加されても次ページがずれないこと"""
+    _seed(db)
+    first = client.get("/api/receipts", params={"limit": 4}).json()
+    db.add(Receipt(store_name="新着", image_path="/uploads/new.jpg"))
+    db.commit()
+
+    second = client.get("/api/receipts", params={"limit": 4, "cursor": first["next_cursor"]}).json()
+    offset_second = client.get("/api/receipts", params={"limit": 4, "skip": 4}).json()
+
+    assert second["items"][0]["id"] == offset_second["items"][1]["id"]
+    assert first["items"][-1]["id"] not in [item["id"] for item in second["items"]]
+
+
+def test_offset_mode_returns_next_cursor(client, db):
+    """オフセット方式でも最後のページ以外は next_cursor が返ること"""
+    _seed(db)
+    assert client.get("/api/receipts", params={"limit": 5}).json()["next_cursor"] is not None
+    assert client.get("/api/receipts", params={"limit": 5, "skip": 10}).json()["next_cursor"] is None
+
+
+def test_invalid_cursor_returns_400(client, db):
+    """壊れたカーソルやソート条件の異なるカーソルは 400 になること"""
+    _seed(db)
+    cursor = client.get("/api/receipts", params={"limit": 2}).json()["next_cursor"]
+
+    assert client.get("/api/receipts", params={"cursor": "not-a-cursor"}).status_code == 400
+    response = client.get("/api/receipts", params={"cursor": cursor, "sort_by": "date"})
+    assert response.status_code == 400
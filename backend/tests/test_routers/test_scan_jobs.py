@@ -0,0 +1,152 @@
+"""非同期スキャンジョブのテスト"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from app.models.receipt import Receipt
+from app.schemas.receipt import VisionResponse
+from app.services.image_service import SavedImage
+from app.services.receipt_service import create_receipt
+from app.services.scan_job_service import ScanWorkerPool, claim_next_job, process_next_job, requeue_interrupted_jobs
+from app.services.vision_limiter import VisionUnavailableError, vision_limiter
+from tests.conftest import TestingSessionLocal
+from tests.test_routers.test_batch_scan import _make_image_file
+
+
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_create_scan_job_returns_job_id(mock_save, client):
+    """アップロードするとジョブIDがすぐに返り、queued 状態で取得できること"""
+    response = client.post("/api/scan-jobs", files={"file": _make_image_file()})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert job["queued_at"] is not None
+
+    response = client.get(f"/api/scan-jobs/{job['id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "queued"
+
+
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock)
+def test_batch_records_failed_uploads(mock_save, client):
+    """保存に失敗したファイルも失敗ジョブとしてバッチに含まれること"""
+    mock_save.side_effect = [SavedImage("/uploads/a.jpg", "0" * 64), ValueError("対応していないファイル形式です")]
+
+    files = [("files", _make_image_file("a.jpg")), ("files", _make_image_file("b.gif"))]
+    response = client.post("/api/scan-jobs/batch", files=files)
+    assert response.status_code == 202
+    data = response.json()
+    assert data["total"] == 2
+    assert data["queued"] == 1
+    assert data["failed"] == 1
+
+    response = client.get(f"/api/scan-jobs/batches/{data['batch_id']}")
+    assert response.status_code == 200
+    assert [j["filename"] for j in response.json()["jobs"]] == ["a.jpg", "b.gif"]
+
+
+def test_unknown_job_returns_404(client):
+    """存在しないジョブ・バッチで 404 が返ること"""
+    assert client.get("/api/scan-jobs/unknown").status_code == 404
+    assert client.get("/api/scan-jobs/batches/unknown").status_code == 404
+
+
+@patch("app.services.scan_job_service.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
+@patch("app.services.scan_job_service.analyze_receipt", new_callable=AsyncMock)
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_worker_processes_job(mock_save, mock_analyze, mock_thumb, client):
+    """ワーカーがジョブを処理し、レシートIDとステージ時刻が記録されること"""
+    mock_analyze.return_value = (VisionResponse(store_name="テスト店", total_amount=500), "{}")
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+
+    assert asyncio.run(process_next_job(TestingSessionLocal)) is True
+    assert asyncio.run(process_next_job(TestingSessionLocal)) is False
+
+    job = client.get(f"/api/scan-jobs/{job_id}").json()
+    assert job["status"] == "succeeded"
+    assert job["receipt_id"] is not None
+    for stage in ("started_at", "analyzed_at", "thumbnailed_at", "finished_at"):
+        assert job[stage] is not None
+    assert client.get(f"/api/receipts/{job['receipt_id']}").json()["store_name"] == "テスト店"
+
+
+@patch("app.services.scan_job_service.delete_image")
+@patch("app.services.scan_job_service.analyze_receipt", new_callable=AsyncMock, side_effect=ValueError("解析エラー"))
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_worker_records_failure(mock_save, mock_analyze, mock_delete, client):
+    """解析に失敗したジョブは failed になり、画像が削除されること"""
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+
+    asyncio.run(process_next_job(TestingSessionLocal))
+
+    job = client.get(f"/api/scan-jobs/{job_id}").json()
+    assert job["status"] == "failed"
+    assert job["error"] == "解析エラー"
+    mock_delete.assert_called_once_with("/uploads/test.jpg")
+
+
+@patch("app.services.scan_job_service.delete_image")
+@patch("app.services.scan_job_service.generate_thumbnail", return_value="/uploads/thumbs/t.jpg")
+@patch("app.services.scan_job_service.analyze_receipt", new_callable=AsyncMock)
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_failure_after_receipt_is_saved_keeps_image(mock_save, mock_analyze, mock_thumb, mock_delete, client, db):
+    """レシートの保存後に失敗した場合、レシートが参照する画像は削除しないこと"""
+    mock_analyze.return_value = (VisionResponse(store_name="テスト店", total_amount=500), "{}")
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+
+    def create_then_fail(*args, **kwargs):
+        create_receipt(*args, **kwargs)
+        raise RuntimeError("ジョブの更新に失敗")
+
+    with patch("app.services.scan_job_service.create_receipt", side_effect=create_then_fail):
+        asyncio.run(process_next_job(TestingSessionLocal))
+
+    assert client.get(f"/api/scan-jobs/{job_id}").json()["status"] == "failed"
+    assert db.query(Receipt).one().image_path == "/uploads/test.jpg"
+    mock_delete.assert_not_called()
+
+
+@patch("app.services.scan_job_service.delete_image")
+@patch(
+    "app.services.scan_job_service.analyze_receipt", new_callable=AsyncMock, side_effect=VisionUnavailableError(0.01)
+)
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_worker_requeues_job_while_circuit_is_open(mock_save, mock_analyze, mock_delete, client, monkeypatch):
+    """Vision API のサーキットが開いている間はジョブを失敗させずにキューへ戻すこと"""
+    monkeypatch.setattr("app.services.scan_job_service.SCAN_JOB_POLL_INTERVAL", 0.01)
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+
+    asyncio.run(process_next_job(TestingSessionLocal))
+
+    job = client.get(f"/api/scan-jobs/{job_id}").json()
+    assert job["status"] == "queued"
+    assert job["error"] is None
+    mock_delete.assert_not_called()
+
+
+@patch("app.services.scan_job_service.analyze_receipt", new_callable=AsyncMock)
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_worker_does_not_claim_jobs_while_circuit_is_open(mock_save, mock_analyze, client):
+    """サーキットが開いている間、ワーカーはジョブを取り出さずに待つこと"""
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+    for _ in range(vision_limiter.breaker.threshold):
+        vision_limiter.breaker.record_failure()
+
+    async def scenario():
+        pool = ScanWorkerPool(TestingSessionLocal, workers=1, poll_interval=0.01)
+        pool.start()
+        await asyncio.sleep(0.05)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    mock_analyze.assert_not_called()
+    assert client.get(f"/api/scan-jobs/{job_id}").json()["status"] == "queued"
+
+
+@patch("app.routers.scan_jobs.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+def test_interrupted_jobs_are_requeued(mock_save, client, db):
+    """processing のまま残ったジョブが再起動時に queued へ戻ること"""
+    job_id = client.post("/api/scan-jobs", files={"file": _make_image_file()}).json()["id"]
+    assert claim_next_job(db).id == job_id
+
+    assert requeue_interrupted_jobs(db) == 1
+    assert client.get(f"/api/scan-jobs/{job_id}").json()["status"] == "queued"
@@ -0,0 +1,64 @@
+"""サムネイル生成をプールへ逃がしたときの応答性テスト"""
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from app.main import app
+from app.schemas.receipt import VisionResponse
+from app.services.image_service import SavedImage
+from tests.test_routers.test_batch_scan import _make_image_file
+
+THUMBNAIL_SECONDS = 0.5
+
+
+def _slow_thumbnail(image_path):
+    time.sleep(THUMBNAIL_SECONDS)  # 重いデコード・縮小を模した同期処理
+    return "/uploads/thumbs/t.jpg"
+
+
+@patch("app.routers.receipts.generate_thumbnail", side_effect=_slow_thumbnail)
+@patch("app.routers.receipts.save_image", new_callable=AsyncMock, return_value=SavedImage("/uploads/test.jpg", "0" * 64))
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
+def test_other_requests_stay_responsive_during_thumbnail(mock_analyze, mock_save, mock_thumb, client):
+    """サムネイル生成中も他のリクエストが待たされないこと"""
+    mock_analyze.return_value = (VisionResponse(store_name="テスト店", total_amount=500, category="食費"), "{}")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            scan = asyncio.create_task(ac.post("/api/receipts/scan", files={"file": _make_image_file()}))
+            await asyncio.sleep(0.05)  # スキャン側がサムネイル生成に入るのを待つ
+
+            start = time.perf_counter()
+            other = await ac.get("/api/receipts/999")
+            other_latency = time.perf_counter() - start
+
+            return await scan, other, other_latency
+
+    scan_response, other_response, other_latency = asyncio.run(scenario())
+
+    assert scan_response.status_code == 201
+    assert other_response.status_code == 404
+    assert other_latency < THUMBNAIL_SECONDS / 2
+
+
+@patch("app.routers.receipts.generate_thumbnail")
+@patch("app.routers.receipts.analyze_receipt", new_callable=AsyncMock)
+def test_scan_reuses_single_decode(mock_analyze, mock_generate, client, tmp_path, monkeypatch):
+    """スキャン時は保存時のデコード結果をサムネイルと Vision 送信に使い回すこと"""
+    from app.services import image_service
+
+    monkeypatch.setattr(image_service, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(image_service, "THUMBNAIL_DIR", tmp_path)
+    mock_analyze.return_value = (VisionResponse(store_name="テスト店", total_amount=500, category="食費"), "{}")
+
+    response = client.post("/api/receipts/scan", files={"file": _make_image_file()})
+
+    assert response.status_code == 201
+    mock_generate.assert_not_called()
+    assert mock_analyze.await_args.kwargs["image"] is not None
+    data = response.json()
+    assert (tmp_path / data["thumbnail_path"].rsplit("/", 1)[-1]).exists()
+    assert set(data["scan_metadata"]["image_cpu_ms"]) >= {"decode", "phash", "thumbnail"}
@@ -0,0 +1,112 @@
+"""全文検索（FTS5 trigram）のテスト"""
+import datetime
+
+import pytest
+
+from app.models.receipt import Receipt, ReceiptItem
+from app.schemas.receipt import ReceiptItemCreate, ReceiptUpdate, VisionResponse
+from app.services.receipt_service import create_receipt, delete_receipt, get_receipt, get_receipts, update_receipt
+from app.services.search_service import build_match_expression
+
+
+def _create(db, store_name, items=(), created_at=None):
+    vision = VisionResponse(
+        store_name=store_name,
+        date=datetime.date(2025, 1, 1),
+        items=[ReceiptItemCreate(name=name) for name in items],
+    )
+    receipt = create_receipt(db, "/uploads/a.jpg", vision, "{}")
+    if created_at:
+        receipt.created_at = created_at
+        db.commit()
+    return receipt
+
+
+def _search(db, term, **kwargs):
+    items, total = get_receipts(db, search=term, **kwargs)
+    return [r.store_name for r in items], total
+
+
+def test_search_matches_item_names_including_short_terms(db):
+    """2文字の語でも品目名で検索できること"""
+    _create(db, "イオン", items=["牛乳 1L", "食パン"])
+    _create(db, "ローソン", items=["おにぎり"])
+
+    assert _search(db, "牛乳") == (["イオン"], 1)
+    assert _search(db, "おにぎり") == (["ローソン"], 1)
+
+
+def test_search_matches_store_name_case_insensitive(db):
+    """店名を大文字小文字を区別せず部分一致で検索できること"""
+    _create(db, "AEON Style")
+    _create(db, "セブンイレブン")
+
+    assert _search(db, "aeon") == (["AEON Style"], 1)
+    assert _search(db, "イレブン") == (["セブンイレブン"], 1)
+
+
+def test_multiple_terms_are_anded(db):
+    """空白区切りの語はすべて含むレシートだけに一致すること"""
+    _create(db, "イオン", items=["牛乳", "食パン"])
+    _create(db, "イオン", items=["牛乳"])
+
+    assert _search(db, "イオン 食パン")[1] == 1
+
+
+def test_index_follows_update_and_delete(db, tmp_path):
+    """品目・店名の更新と削除が検索結果に反映されること"""
+    receipt = _create(db, "イオン", items=["牛乳"])
+    update_receipt(db, get_receipt(db, receipt.id), ReceiptUpdate(store_name="西友", items=[ReceiptItemCreate(name="豆腐")]))
+
+    assert _search(db, "牛乳")[1] == 0
+    assert _search(db, "豆腐") == (["西友"], 1)
+    assert _search(db, "イオン")[1] == 0
+
+    delete_receipt(db, get_receipt(db, receipt.id), tmp_path)
+    assert _search(db, "西友")[1] == 0
+
+
+def test_relevance_ordering(db):
+    """関連度順では一致の多いレシートが先に来ること"""
+    base = datetime.datetime(2025, 1, 1)
+    _create(db, "コンビニ", items=["チョコレート"], created_at=base + datetime.timedelta(days=1))
+    _create(db, "チョコレート専門店", items=["チョコレート", "チョコレートケーキ"], created_at=base)
+
+    names, _ = _search(db, "チョコレート", sort_by="relevance")
+    assert names == ["チョコレート専門店", "コンビニ"]
+
+
+@pytest.mark.parametrize("term", ['"', "100%", "a_b", "OR", "NEAR(x y)", "***"])
+def test_special_characters_do_not_break_query(db, term):
+    """FTS5 の演算子や LIKE のワイルドカードを含む語でもエラーにならないこと"""
+    _create(db, "テスト店")
+    assert _search(db, term)[1] == 0
+
+
+def test_build_match_expression_splits_short_terms():
+    assert build_match_expression('セブン 牛乳 a"bc') == ('"セブン" AND "a""bc"', ["牛乳"])
+
+
+def test_list_endpoint_relevance_sort(client, db):
+    """一覧APIで sort_by=relevance は search 指定時のみ使えること"""
+    _create(db, "イオン", items=["牛乳"])
+
+    response = client.get("/api/receipts", params={"search": "牛乳", "sort_by": "relevance"})
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+    assert response.json()["next_cursor"] is None
+
+    assert client.get("/api/receipts", params={"sort_by": "relevance"}).status_code == 400
+
+
+def test_bulk_core_insert_is_indexed(db):
+    """ORM を経由しない INSERT でもトリガーで索引されること"""
+    now = datetime.datetime(2025, 1, 1)
+    db.execute(
+        Receipt.__table__.insert(),
+        [{"id": 100, "store_name": "業務スーパー", "image_path": "x", "created_at": now, "updated_at": now}],
+    )
+    db.execute(ReceiptItem.__table__.insert(), [{"receipt_id": 100, "name": "冷凍うどん"}])
+    db.commit()
+
+    assert _search(db, "うどん") == (["業務スーパー"], 1)
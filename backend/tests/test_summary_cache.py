@@ -0,0 +1,134 @@
+"""月次集計キャッシュのテスト"""
+import datetime
+from unittest.mock import patch
+
+from app.models.receipt import Receipt
+from app.schemas.receipt import ReceiptUpdate
+from app.services.receipt_service import get_receipt, update_receipt
+from app.services.summary_cache import SummaryCache, monthly_key, summary_cache
+from app.services.summary_service import get_available_months, get_monthly_summary
+from tests.conftest import TestingSessionLocal
+
+
+def _add(db, date, amount, category="食費"):
+    receipt = Receipt(date=date, total_amount=amount, category=category, image_path="a.jpg")
+    db.add(receipt)
+    db.commit()
+    return receipt
+
+
+def test_repeated_reads_hit_cache(db):
+    """2回目以降の取得はキャッシュから返ること"""
+    _add(db, datetime.date(2025, 1, 10), 1000)
+    before = summary_cache.stats()
+
+    first = get_monthly_summary(db, 2025, 1)
+    second = get_monthly_summary(db, 2025, 1)
+
+    stats = summary_cache.stats()
+    assert second is first
+    assert stats.misses == before.misses + 1
+    assert stats.hits == before.hits + 1
+
+
+def test_write_invalidates_only_affected_month(db):
+    """レシートの変更で、その年月と年月リストだけが無効化されること"""
+    _add(db, datetime.date(2025, 1, 10), 1000)
+    _add(db, datetime.date(2025, 2, 10), 2000)
+    january = get_monthly_summary(db, 2025, 1)
+    get_monthly_summary(db, 2025, 2)
+    get_available_months(db)
+
+    _add(db, datetime.date(2025, 2, 20), 500)
+
+    assert summary_cache.get(monthly_key(2025, 1)) is january
+    assert summary_cache.get(monthly_key(2025, 2)) is None
+    assert get_monthly_summary(db, 2025, 2).total_amount == 2500
+    assert get_available_months(db).months[0].count == 2
+
+
+def test_update_moving_month_invalidates_both_months(db):
+    """更新で年月が変わる場合、移動元と移動先の両方が無効化されること"""
+    receipt = _add(db, datetime.date(2025, 1, 10), 1000)
+    get_monthly_summary(db, 2025, 1)
+    get_monthly_summary(db, 2025, 3)
+
+    update_receipt(db, get_receipt(db, receipt.id), ReceiptUpdate(date=datetime.date(2025, 3, 1), total_amount=1000))
+
+    assert get_monthly_summary(db, 2025, 1).total_count == 0
+    assert get_monthly_summary(db, 2025, 3).total_count == 1
+
+
+def test_rollback_does_not_invalidate(db):
+    """ロールバックされた変更ではキャッシュが残ること"""
+    _add(db, datetime.date(2025, 1, 10), 1000)
+    cached = get_monthly_summary(db, 2025, 1)
+
+    db.add(Receipt(date=datetime.date(2025, 1, 11), total_amount=1, image_path="a.jpg"))
+    db.flush()
+    db.rollback()
+
+    assert summary_cache.get(monthly_key(2025, 1)) is cached
+
+
+def test_write_during_read_is_not_cached(db):
+    """集計の読み出し中にコミットされた変更で無効化された場合、古い結果を保存しないこと"""
+    _add(db, datetime.date(2025, 1, 10), 1000)
+    original_generation = summary_cache.generation
+
+    def generation_then_write(key):
+        generation = original_generation(key)
+        other = TestingSessionLocal()
+        try:
+            _add(other, datetime.date(2025, 1, 20), 500)
+        finally:
+            other.close()
+        return generation
+
+    with patch.object(summary_cache, "generation", generation_then_write):
+        get_monthly_summary(db, 2025, 1)
+
+    assert summary_cache.get(monthly_key(2025, 1)) is None
+    assert get_monthly_summary(db, 2025, 1).total_amount == 1500
+
+
+def test_put_is_dropped_after_clear():
+    """取得した世代の後に全削除された場合も保存しないこと"""
+    cache = SummaryCache(max_entries=2)
+    generation = cache.generation(("a",))
+    cache.clear()
+    cache.put(("a",), 1, generation)
+    assert cache.get(("a",)) is None
+
+    cache.put(("a",), 2, cache.generation(("a",)))
+    assert cache.get(("a",)) == 2
+
+
+def test_lru_bound_and_ttl():
+    """件数上限で古いものから追い出され、TTL 経過で失効すること"""
+    cache = SummaryCache(max_entries=2, ttl=10)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    cache.get(("a",))
+    cache.put(("c",), 3)
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == 1
+
+    with patch("app.services.summary_cache.time.monotonic", return_value=1e12):
+        assert cache.get(("a",)) is None
+
+
+def test_admin_stats_endpoint(client, db):
+    """統計エンドポイントがヒット・ミス数を返すこと"""
+    client.get("/api/summary/monthly", params={"year": 2025, "month": 1})
+    client.get("/api/summary/monthly", params={"year": 2025, "month": 1})
+
+    response = client.get("/api/admin/summary-cache")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["entries"] == 1
+    assert data["hits"] >= 1
+
+    assert client.delete("/api/admin/summary-cache").status_code == 204
+    assert client.get("/api/admin/summary-cache").json()["entries"] == 0
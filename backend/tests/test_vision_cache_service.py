@@ -0,0 +1,113 @@
+"""Vision 解析キャッシュのテスト"""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.config import VISION_MODEL
+from app.models.vision_cache import VisionCacheEntry
+from app.schemas.receipt import VisionResponse
+from app.services import vision_cache_service
+from app.services.vision_service import PROMPT_VERSION, analyze_receipt
+from tests.conftest import TestingSessionLocal
+
+VISION = VisionResponse(store_name="テスト店", total_amount=500, items=[{"name": "牛乳", "price": 200}])
+
+
+def test_store_and_get(db):
+    """保存した結果が同じキーで取得できること"""
+    vision_cache_service.store_result(db, "a" * 64, "model", "v1", VISION, '{"raw": 1}')
+
+    cached = vision_cache_service.get_cached_result(db, "a" * 64, "model", "v1")
+    assert cached is not None
+    vision, raw = cached
+    assert vision == VISION
+    assert raw == '{"raw": 1}'
+
+
+def test_model_and_prompt_version_are_part_of_key(db):
+    """モデル・プロンプトバージョンが異なればヒットしないこと"""
+    vision_cache_service.store_result(db, "a" * 64, "model", "v1", VISION, "{}")
+
+    assert vision_cache_service.get_cached_result(db, "a" * 64, "other-model", "v1") is None
+    assert vision_cache_service.get_cached_result(db, "a" * 64, "model", "v2") is None
+
+
+def test_has_result_does_not_count_as_hit(db):
+    """has_result はヒット数・参照数を変えないこと"""
+    vision_cache_service.store_result(db, "a" * 64, "model", "v1", VISION, "{}")
+    before = vision_cache_service.lookup_counts()
+
+    assert vision_cache_service.has_result(db, "a" * 64, "model", "v1")
+    assert not vision_cache_service.has_result(db, "b" * 64, "model", "v1")
+    assert vision_cache_service.lookup_counts() == before
+    assert db.get(VisionCacheEntry, ("a" * 64, "model", "v1")).hit_count == 0
+
+
+def test_evict_removes_least_recently_used(db):
+    """上限を超えると最終参照が古いエントリから削除されること"""
+    for sha in ("a", "b", "c"):
+        vision_cache_service.store_result(db, sha * 64, "model", "v1", VISION, "{}")
+    vision_cache_service.get_cached_result(db, "a" * 64, "model", "v1")
+
+    entry_size = db.query(VisionCacheEntry).first().size_bytes
+    deleted = vision_cache_service.evict(db, max_bytes=entry_size * 2)
+    db.commit()
+
+    assert deleted == 1
+    remaining = {e.image_sha256[0] for e in db.query(VisionCacheEntry).all()}
+    assert remaining == {"a", "c"}
+
+
+def test_purge_and_stats(db):
+    """統計にヒット/ミス数が反映され、purge で全削除されること"""
+    vision_cache_service.store_result(db, "a" * 64, "model", "v1", VISION, "{}")
+    before = vision_cache_service.get_stats(db)
+    vision_cache_service.get_cached_result(db, "a" * 64, "model", "v1")
+    vision_cache_service.get_cached_result(db, "b" * 64, "model", "v1")
+
+    stats = vision_cache_service.get_stats(db)
+    assert stats.entries == 1
+    assert stats.total_bytes > 0
+    assert stats.hits == before.hits + 1
+    assert stats.misses == before.misses + 1
+
+    assert vision_cache_service.purge(db) == 1
+    assert vision_cache_service.get_stats(db).entries == 0
+
+
+def test_admin_endpoints(client, db):
+    """管理エンドポイントで統計取得とキャッシュ削除ができること"""
+    vision_cache_service.store_result(db, "a" * 64, "model", "v1", VISION, "{}")
+
+    response = client.get("/api/admin/vision-cache")
+    assert response.status_code == 200
+    assert response.json()["entries"] == 1
+
+    response = client.delete("/api/admin/vision-cache")
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 1}
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._encode_image", new_callable=AsyncMock, return_value=("", "image/jpeg"))
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_cache_hit_skips_api(mock_get_client, mock_encode, db):
+    """同じ画像ハッシュの2回目の解析では API が呼ばれないこと"""
+    message = SimpleNamespace(
+        content=[SimpleNamespace(text='{"store_name": "テスト店", "total_amount": 500}')],
+        usage=SimpleNamespace(input_tokens=1500, output_tokens=200),
+    )
+    client = MagicMock()
+    client.messages.create = AsyncMock(return_value=message)
+    client.with_options.return_value = client
+    mock_get_client.return_value = client
+
+    first, _ = asyncio.run(analyze_receipt("/tmp/x.jpg", image_hash="d" * 64))
+    second, raw = asyncio.run(analyze_receipt("/tmp/x.jpg", image_hash="d" * 64))
+
+    assert client.messages.create.await_count == 1
+    assert second == first
+    assert "テスト店" in raw
+    assert db.get(VisionCacheEntry, ("d" * 64, VISION_MODEL, PROMPT_VERSION)) is not None
+
@@ -0,0 +1,223 @@
+"""Vision API 呼び出しの流量制御のテスト"""
+import asyncio
+import io
+from unittest.mock import patch
+
+import anthropic
+import httpx
+import pytest
+from PIL import Image
+
+from app.services.vision_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PROBE_RETRY_AFTER,
+    CircuitBreaker,
+    TokenBucket,
+    VisionLimiter,
+    VisionUnavailableError,
+    vision_limiter,
+)
+
+
+def _status_error(cls, status: int, headers: dict | None = None):
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=None)
+
+
+class FlakyCall:
+    """先頭から順に errors を送出し、尽きたら "ok" を返す呼び出し。"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _limiter(**kwargs) -> VisionLimiter:
+    options = dict(
+        max_concurrency=2, rate_per_minute=0, burst=1, max_retries=3,
+        base_delay=0.001, max_delay=1, breaker_threshold=5, breaker_cooldown=30,
+    )
+    options.update(kwargs)
+    return VisionLimiter(**options)
+
+
+def test_retries_rate_limit_honouring_retry_after():
+    """429 は retry-after の秒数だけ待ってから再試行されること"""
+    limiter = _limiter()
+    call = FlakyCall(_status_error(anthropic.RateLimitError, 429, {"retry-after-ms": "50"}))
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    with patch("app.services.vision_limiter.asyncio.sleep", fake_sleep):
+        assert asyncio.run(limiter.call(call)) == "ok"
+    assert call.calls == 2
+    assert sleeps[0] == pytest.approx(0.05)
+    stats = limiter.stats()
+    assert (stats["calls"], stats["retries"], stats["in_flight"]) == (2, 1, 0)
+
+
+def test_overloaded_and_timeouts_are_retried_until_limit():
+    """529・タイムアウトは上限回数まで再試行し、それでも失敗すれば例外を送出すること"""
+    limiter = _limiter(max_retries=2)
+    timeout = anthropic.APITimeoutError(httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+    call = FlakyCall(_status_error(anthropic.InternalServerError, 529), timeout, timeout, timeout)
+    with pytest.raises(anthropic.APITimeoutError):
+        asyncio.run(limiter.call(call))
+    assert call.calls == 3
+
+
+def test_client_errors_and_long_retry_after_are_not_retried():
+    """400 や上限を超える retry-after は再試行しないこと"""
+    limiter = _limiter()
+    call = FlakyCall(_status_error(anthropic.BadRequestError, 400))
+    with pytest.raises(anthropic.BadRequestError):
+        asyncio.run(limiter.call(call))
+    assert call.calls == 1
+
+    call = FlakyCall(_status_error(anthropic.RateLimitError, 429, {"retry-after": "120"}))
+    with pytest.raises(anthropic.RateLimitError):
+        asyncio.run(limiter.call(call))
+    assert call.calls == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """連続失敗でサーキットが開き、クールダウン後の試行が成功すれば閉じること"""
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(VisionUnavailableError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == 10
+
+    now[0] = 11
+    breaker.before_call()  # half_open の試行は1件だけ通す
+    assert breaker.state == "half_open"
+    with pytest.raises(VisionUnavailableError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == PROBE_RETRY_AFTER  # 試行中の呼び出しに 0 秒後の再試行を促さない
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_open_circuit_fails_fast_without_calling_api():
+    """サーキットが開いている間は API を呼ばずに失敗すること"""
+    limiter = _limiter(max_retries=0, breaker_threshold=2)
+    for _ in range(2):
+        with pytest.raises(anthropic.InternalServerError):
+            asyncio.run(limiter.call(FlakyCall(_status_error(anthropic.InternalServerError, 503))))
+    call = FlakyCall()
+    with pytest.raises(VisionUnavailableError):
+        asyncio.run(limiter.call(call))
+    assert call.calls == 0
+    assert limiter.stats()["circuit_state"] == "open"
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_cancelled_probe_while_waiting_for_slot_releases_circuit():
+    """half_open の試行が枠待ちの間に取り消されても、次の呼び出しで再び試行できること"""
+    limiter = _limiter(max_concurrency=1)
+    now = [0.0]
+    limiter.breaker = CircuitBreaker(threshold=1, cooldown=10, clock=lambda: now[0])
+    limiter.breaker.record_failure()
+    now[0] = 11
+
+    async def scenario():
+        await limiter._acquire(PRIORITY_INTERACTIVE)  # 枠を塞ぐ
+        probe = asyncio.create_task(limiter.call(FlakyCall()))
+        await asyncio.sleep(0)
+        assert limiter.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        limiter._release()
+        return await limiter.call(FlakyCall())
+
+    assert asyncio.run(scenario()) == "ok"
+    assert limiter.breaker.state == "closed"
+
+
+def test_interactive_calls_jump_ahead_of_background_queue():
+    """空き待ちでは単発スキャンが一括処理より先に実行されること"""
+    limiter = _limiter(max_concurrency=1)
+    order = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def hold():
+            await gate.wait()
+            return "held"
+
+        def tagged(name):
+            async def run():
+                order.append(name)
+            return run
+
+        holder = asyncio.create_task(limiter.call(hold))
+        await asyncio.sleep(0)
+        background = [asyncio.create_task(limiter.call(tagged(f"bg{i}"), PRIORITY_BACKGROUND)) for i in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(limiter.call(tagged("interactive"), PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 3
+        gate.set()
+        await asyncio.gather(holder, interactive, *background)
+
+    asyncio.run(scenario())
+    assert order == ["interactive", "bg0", "bg1"]
+    stats = limiter.stats()
+    assert (stats["queue_depth"], stats["in_flight"], stats["wait_count"]) == (0, 0, 4)
+    assert stats["wait_max_ms"] > 0
+
+
+def test_token_bucket_spaces_out_requests():
+    """バーストを使い切ると補充レートに従って待ち時間が伸び、retry-after で全体が止まること"""
+    now = [0.0]
+    bucket = TokenBucket(rate_per_sec=2, burst=2, clock=lambda: now[0])
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    now[0] = 10
+    bucket.block(3)
+    assert bucket.reserve() == 3
+
+
+def _image_file():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, "JPEG")
+    return ("receipt.jpg", buffer.getvalue(), "image/jpeg")
+
+
+def test_scan_returns_503_while_circuit_is_open(client, monkeypatch):
+    """サーキットが開いている間、単発スキャンは Retry-After 付きの 503 を返すこと"""
+    monkeypatch.setattr("app.services.vision_service.MOCK_VISION", False)
+    monkeypatch.setattr("app.services.vision_service.VISION_CACHE_ENABLED", False)
+    monkeypatch.setattr("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+    for _ in range(vision_limiter.breaker.threshold):
+        vision_limiter.breaker.record_failure()
+
+    with patch("app.services.vision_service._get_client") as mock_get_client, \
+            patch("app.services.vision_service._encode_image") as mock_encode:
+        response = client.post("/api/receipts/scan", files={"file": _image_file()})
+    assert response.status_code == 503
+    mock_encode.assert_not_called()  # 画像をエンコードする前に失敗する
+    assert int(response.headers["retry-after"]) >= 1
+    mock_get_client.return_value.with_options.return_value.messages.create.assert_not_called()
+
+    stats = client.get("/api/admin/vision-limiter").json()
+    assert stats["circuit_state"] == "open"
+    assert stats["rejected"] == 1
@@ -0,0 +1,104 @@
+"""記録済み応答を再生する Vision バックエンドのテスト"""
+import asyncio
+import json
+import random
+
+import anthropic
+import pytest
+
+from app.models.vision_cache import VisionCacheEntry
+from app.models.vision_usage import VisionUsage
+from app.services import vision_replay
+from app.services.vision_limiter import vision_limiter
+from app.services.vision_replay import REPLAY_MODEL, ReplayVisionClient, load_responses, parse_latency_spec
+from app.services.vision_service import analyze_receipt
+from tests.conftest import TestingSessionLocal
+
+RAW = "```json\n" + json.dumps({"store_name": "再生テスト店", "total_amount": 1234, "items": None}, ensure_ascii=False) + "\n```"
+
+
+@pytest.fixture
+def replay(monkeypatch, tmp_path):
+    """再生モードを有効にし、差し替え用のクライアントを作る関数を返す。"""
+    monkeypatch.setattr(vision_replay, "VISION_REPLAY_DIR", str(tmp_path))
+    monkeypatch.setattr("app.services.vision_service.ANTHROPIC_API_KEY", "")
+    monkeypatch.setattr("app.services.vision_service.VISION_CACHE_ENABLED", False)
+    monkeypatch.setattr("app.services.vision_service.SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(vision_limiter, "base_delay", 0.001)
+
+    def install(**kwargs) -> ReplayVisionClient:
+        client = ReplayVisionClient([RAW], parse_latency_spec("fixed:1"), retry_after=0.01, seed=1, **kwargs)
+        monkeypatch.setattr(vision_replay, "_client", client)
+        return client
+
+    return install
+
+
+def _analyze(tmp_path):
+    image_path = tmp_path / "receipt.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff" + b"\0" * 16)
+    return asyncio.run(analyze_receipt(str(image_path)))
+
+
+def test_latency_specs():
+    """固定・一様・対数正規・実測値の各分布から秒単位で値が引けること"""
+    rng = random.Random(0)
+    assert parse_latency_spec("fixed:250")(rng) == 0.25
+    assert 0.1 <= parse_latency_spec("uniform:100:200")(rng) <= 0.2
+    samples = [parse_latency_spec("lognormal:1000:0.3")(rng) for _ in range(2000)]
+    assert sorted(samples)[1000] == pytest.approx(1.0, rel=0.1)
+    with pytest.raises(ValueError):
+        parse_latency_spec("gamma:1")
+
+
+def test_empirical_latency_and_response_loading(tmp_path):
+    """latencies_ms.txt から復元抽出し、応答の読み込みからは除外されること"""
+    (tmp_path / "1.txt").write_text(RAW, encoding="utf-8")
+    (tmp_path / "latencies_ms.txt").write_text("100\n300\n", encoding="utf-8")
+    assert load_responses(tmp_path) == [RAW]
+    sampler = parse_latency_spec("empirical", tmp_path)
+    assert {sampler(random.Random(i)) for i in range(20)} == {0.1, 0.3}
+    with pytest.raises(ValueError):
+        load_responses(tmp_path / "missing")
+
+
+def test_replayed_response_goes_through_real_parser(replay, tmp_path):
+    """再生した応答が _extract_json と VisionResponse の検証を通って返ること"""
+    client = replay()
+    vision, raw = _analyze(tmp_path)
+    assert raw == RAW
+    assert (vision.store_name, vision.total_amount, vision.items) == ("再生テスト店", 1234, [])
+    assert client.calls == 1
+
+
+def test_injected_rate_limits_are_retried_by_limiter(replay, tmp_path):
+    """注入した 429 は retry-after に従って再試行され、上限を超えると例外になること"""
+    client = replay(rate_limit_rate=1.0)
+    with pytest.raises(anthropic.RateLimitError) as excinfo:
+        _analyze(tmp_path)
+    assert excinfo.value.response.headers["retry-after"] == "0.01"
+    assert client.calls == 4  # 初回 + VISION_MAX_RETRIES 回
+
+
+def test_injected_errors_and_malformed_responses(replay, tmp_path):
+    """注入した 529 と途中で切れた応答がそれぞれ API エラー・パース失敗として現れること"""
+    replay(error_rate=1.0)
+    with pytest.raises(anthropic.InternalServerError):
+        _analyze(tmp_path)
+
+    replay(malformed_rate=1.0)
+    with pytest.raises(ValueError):
+        _analyze(tmp_path)
+
+
+def test_replayed_responses_are_not_cached_and_recorded_as_replay(replay, tmp_path, monkeypatch, db):
+    """再生した応答は解析キャッシュに保存されず、使用量は replay として記録されること"""
+    monkeypatch.setattr("app.services.vision_service.VISION_CACHE_ENABLED", True)
+    replay()
+    image_path = tmp_path / "receipt.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff" + b"\0" * 16)
+    asyncio.run(analyze_receipt(str(image_path), image_hash="e" * 64))
+
+    assert db.query(VisionCacheEntry).count() == 0
+    usage = db.query(VisionUsage).one()
+    assert (usage.model, usage.mode, usage.status) == (REPLAY_MODEL, "replay", "ok")
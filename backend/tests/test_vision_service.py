@@ -0,0 +1,166 @@
+"""Vision API 呼び出しのテスト"""
+import asyncio
+import base64
+import hashlib
+import io
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from app.config import VISION_MODEL
+from app.models.vision_usage import VisionUsage
+from app.services.metrics import vision_api_seconds, vision_errors_total, vision_wait_seconds
+from app.services.vision_limiter import vision_limiter
+from app.services.vision_service import PROMPT, PROMPT_VERSION, analyze_receipt, build_message_params
+from tests.conftest import TestingSessionLocal
+
+
+USAGE = SimpleNamespace(input_tokens=1500, output_tokens=200, cache_creation_input_tokens=0, cache_read_input_tokens=0)
+
+
+def _mock_client(text='{"store_name": "テスト店", "total_amount": 500}'):
+    client = MagicMock()
+    client.messages.create = AsyncMock(return_value=SimpleNamespace(content=[SimpleNamespace(text=text)], usage=USAGE))
+    client.with_options.return_value = client
+    return client
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_sends_normalized_image_and_records_metadata(mock_get_client, tmp_path):
+    """縮小した画像が送信され、削減量と所要時間が scan_metadata に記録されること"""
+    image_path = tmp_path / "large.jpg"
+    Image.effect_noise((3200, 2400), 64).convert("RGB").save(image_path, "JPEG", quality=95)
+    client = _mock_client()
+    mock_get_client.return_value = client
+
+    scan_metadata = {}
+    vision, _ = asyncio.run(analyze_receipt(str(image_path), scan_metadata=scan_metadata))
+
+    assert vision.store_name == "テスト店"
+    metadata = scan_metadata["vision"]
+    assert metadata["original_bytes"] == image_path.stat().st_size
+    assert metadata["bytes_saved"] == metadata["original_bytes"] - metadata["sent_bytes"] > 0
+    assert (metadata["width"], metadata["height"]) == (1568, 1176)
+    assert metadata["api_latency_ms"] >= 0
+    assert metadata["normalize_ms"] >= 0
+
+    source = client.messages.create.await_args.kwargs["messages"][0]["content"][0]["source"]
+    assert source["media_type"] == "image/jpeg"
+    with Image.open(io.BytesIO(base64.b64decode(source["data"]))) as sent:
+        assert sent.size == (1568, 1176)
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.VISION_IMAGE_NORMALIZE", False)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_without_normalization_sends_original(mock_get_client, tmp_path):
+    """正規化を無効にすると元画像がそのまま送信されること"""
+    image_path = tmp_path / "receipt.png"
+    Image.new("RGB", (64, 64), "white").save(image_path, "PNG")
+    mock_get_client.return_value = _mock_client()
+
+    scan_metadata = {}
+    asyncio.run(analyze_receipt(str(image_path), scan_metadata=scan_metadata))
+    assert scan_metadata["vision"]["bytes_saved"] == 0
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.VISION_PROMPT_CACHE", True)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_caches_static_prompt_and_records_usage(mock_get_client, tmp_path, db):
+    """静的プロンプトに cache_control が付き、使用量とレイテンシが記録されること"""
+    image_path = tmp_path / "receipt.png"
+    Image.new("RGB", (64, 64), "white").save(image_path, "PNG")
+    client = _mock_client()
+    mock_get_client.return_value = client
+
+    scan_metadata = {}
+    asyncio.run(analyze_receipt(str(image_path), scan_metadata=scan_metadata))
+
+    kwargs = client.messages.create.await_args.kwargs
+    assert kwargs["system"] == [{"type": "text", "text": PROMPT, "cache_control": {"type": "ephemeral"}}]
+    assert PROMPT not in str(kwargs["messages"])
+    assert scan_metadata["vision"]["input_tokens"] == 1500
+    assert scan_metadata["vision"]["output_tokens"] == 200
+
+    usage = db.query(VisionUsage).one()
+    assert (usage.model, usage.mode, usage.status) == (VISION_MODEL, "sync", "ok")
+    assert (usage.input_tokens, usage.output_tokens) == (1500, 200)
+    assert usage.latency_ms == scan_metadata["vision"]["api_latency_ms"]
+
+
+@patch("app.services.vision_service.VISION_PROMPT_CACHE", False)
+def test_prompt_cache_control_is_opt_in():
+    """VISION_PROMPT_CACHE が無効なら cache_control を付けず、解析キャッシュのキーは PROMPT だけで決まること"""
+    params = build_message_params("data", "image/png")
+    assert params["system"] == [{"type": "text", "text": PROMPT}]
+    assert PROMPT_VERSION == hashlib.sha256(PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_separates_limiter_wait_from_api_latency(mock_get_client, tmp_path, db):
+    """枠待ち・再試行の時間は API の所要時間に含めず、limiter_wait_ms に記録されること"""
+    image_path = tmp_path / "receipt.png"
+    Image.new("RGB", (64, 64), "white").save(image_path, "PNG")
+    mock_get_client.return_value = _mock_client()
+
+    async def slow_call(factory, priority):
+        await asyncio.sleep(0.2)  # 枠待ち・バックオフの代わり
+        return await factory()
+
+    scan_metadata = {}
+    with patch.object(vision_limiter, "call", slow_call):
+        asyncio.run(analyze_receipt(str(image_path), scan_metadata=scan_metadata))
+
+    metadata = scan_metadata["vision"]
+    assert metadata["api_latency_ms"] < 100
+    assert metadata["limiter_wait_ms"] >= 200
+    assert db.query(VisionUsage).one().latency_ms == metadata["api_latency_ms"]
+    assert vision_wait_seconds.count() == 1
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_records_failed_calls(mock_get_client, tmp_path, db):
+    """失敗した API 呼び出しも error として記録されること"""
+    image_path = tmp_path / "receipt.png"
+    Image.new("RGB", (64, 64), "white").save(image_path, "PNG")
+    client = _mock_client()
+    client.messages.create.side_effect = RuntimeError("boom")
+    mock_get_client.return_value = client
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(analyze_receipt(str(image_path)))
+    usage = db.query(VisionUsage).one()
+    assert (usage.status, usage.input_tokens) == ("error", 0)
+    assert vision_errors_total.value(kind="api") == 1
+
+
+@patch("app.services.vision_service.SessionLocal", TestingSessionLocal)
+@patch("app.services.vision_service.VISION_CACHE_ENABLED", False)
+@patch("app.services.vision_service.ANTHROPIC_API_KEY", "sk-test")
+@patch("app.services.vision_service._get_client")
+def test_analyze_receipt_counts_unparseable_responses(mock_get_client, tmp_path):
+    """JSON を取り出せない応答は parse エラーとして数えられること"""
+    image_path = tmp_path / "receipt.png"
+    Image.new("RGB", (64, 64), "white").save(image_path, "PNG")
+    mock_get_client.return_value = _mock_client(text="読み取れませんでした")
+
+    with pytest.raises(ValueError):
+        asyncio.run(analyze_receipt(str(image_path)))
+    assert vision_errors_total.value(kind="parse") == 1
+    assert vision_api_seconds.count() == 1
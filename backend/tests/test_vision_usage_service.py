@@ -0,0 +1,85 @@
+"""Vision API 使用量の記録・集計のテスト"""
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.vision_usage import VisionUsage
+from app.services.vision_usage_service import estimate_cost, get_daily_usage, record_call
+
+
+def _usage(input_tokens=1000, output_tokens=100, cache_write=0, cache_read=0):
+    return SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_creation_input_tokens=cache_write,
+        cache_read_input_tokens=cache_read,
+    )
+
+
+def _record(db, when: datetime.datetime, model="claude-sonnet-4-20250514", **kwargs):
+    entry = record_call(db, model, **kwargs)
+    entry.created_at = when
+    db.commit()
+
+
+def test_estimate_cost_applies_cache_and_batch_rates():
+    """キャッシュ書き込み・読み込みの倍率と Batches API の割引が費用に反映されること"""
+    assert estimate_cost("claude-sonnet-4-20250514", 1_000_000, 0) == pytest.approx(3.0)
+    assert estimate_cost("claude-sonnet-4-20250514", 0, 1_000_000) == pytest.approx(15.0)
+    assert estimate_cost("claude-sonnet-4-20250514", 0, 0, cache_creation_input_tokens=1_000_000) == pytest.approx(3.75)
+    assert estimate_cost("claude-sonnet-4-20250514", 0, 0, cache_read_input_tokens=1_000_000) == pytest.approx(0.3)
+    assert estimate_cost("claude-sonnet-4-20250514", 1_000_000, 0, batch=True) == pytest.approx(1.5)
+    assert estimate_cost("claude-opus-4-5-20251101", 1_000_000, 0) == pytest.approx(5.0)  # 最長一致
+    assert estimate_cost("unknown-model", 1000, 100) is None
+
+
+def test_daily_usage_groups_by_day_and_model(db):
+    """日別・モデル別にトークン数・費用・レイテンシが集計されること"""
+    day1 = datetime.datetime(2025, 3, 1, 10)
+    day2 = datetime.datetime(2025, 3, 2, 23, 59)
+    _record(db, day1, usage=_usage(cache_write=2000), latency_ms=1000)
+    _record(db, day1, usage=_usage(cache_read=2000), latency_ms=600)
+    _record(db, day1, status="error", latency_ms=200)
+    _record(db, day1, usage=_usage(), mode="batch")
+    _record(db, day1, model="claude-3-5-haiku-20241022", usage=_usage(), latency_ms=300)
+    _record(db, day2, usage=_usage(), latency_ms=800)
+    _record(db, datetime.datetime(2025, 3, 3), usage=_usage())  # 範囲外
+
+    result = get_daily_usage(db, datetime.date(2025, 3, 1), datetime.date(2025, 3, 2))
+
+    assert [(d.date.day, d.model) for d in result.days] == [
+        (1, "claude-3-5-haiku-20241022"),
+        (1, "claude-sonnet-4-20250514"),
+        (2, "claude-sonnet-4-20250514"),
+    ]
+    sonnet = result.days[1]
+    assert (sonnet.calls, sonnet.errors, sonnet.batch_calls) == (4, 1, 1)
+    assert (sonnet.input_tokens, sonnet.output_tokens) == (3000, 300)
+    assert (sonnet.cache_creation_input_tokens, sonnet.cache_read_input_tokens) == (2000, 2000)
+    assert sonnet.cache_read_ratio == pytest.approx(2000 / 7000, abs=1e-4)
+    expected = (
+        estimate_cost("claude-sonnet-4-20250514", 2000, 200, 2000, 2000)
+        + estimate_cost("claude-sonnet-4-20250514", 1000, 100, batch=True)
+    )
+    assert sonnet.estimated_cost_usd == pytest.approx(expected)
+    assert sonnet.avg_latency_ms == pytest.approx(600)
+    assert sonnet.max_latency_ms == 1000
+    assert result.total_estimated_cost_usd == pytest.approx(sum(d.estimated_cost_usd for d in result.days))
+
+
+def test_vision_usage_endpoint(client, db):
+    """/api/admin/vision-usage が期間内の集計を返し、不正な期間は 400 になること"""
+    _record(db, datetime.datetime(2025, 3, 1, 12), usage=_usage(), latency_ms=500)
+
+    response = client.get("/api/admin/vision-usage", params={"date_from": "2025-03-01", "date_to": "2025-03-31"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["days"][0]["date"] == "2025-03-01"
+    assert data["days"][0]["calls"] == 1
+    assert data["total_estimated_cost_usd"] > 0
+    assert db.query(VisionUsage).count() == 1
+
+    response = client.get("/api/admin/vision-usage", params={"date_from": "2025-03-02", "date_to": "2025-03-01"})
+    assert response.status_code == 400
+    assert client.get("/api/admin/vision-usage").json()["days"] == []